@@ -1,23 +1,148 @@
 #!/usr/bin/env python3
 import os
 import re
+import io
+import csv
 import json
-import shutil
 import subprocess
 import uuid
 import sys
+import time
+import shutil
 import argparse
-from typing import Dict, Any
+import contextlib
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 
 # Add scripts/core to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
-from replacements import replace_hardcoded_content_safe, normalize_to_e164
+from replacements import (
+    replace_hardcoded_content_safe, normalize_to_e164, scan_targets,
+    get_compiled_replacements, legacy_scanner, is_scan_target, ReplacementResult
+)
+from profiler import PatternStats
+from rule_stats import RuleStats, template_revision
+from branding_manifest import MANIFEST_FILENAME
+from template_copy import (
+    copy_and_brand_template, brand_template_in_memory, brand_overlay_files, snapshot_template, COPY_MODES
+)
+from app_archive import archive_format, unsupported_reason, write_archive
+from template_index import template_index
+from app_cache import AppCache, CachedApp, DEFAULT_MAX_BYTES
+from generation_context import GenerationContext
+from walker import TreeSnapshot
+from profiler import PROFILE_FORMATS, Profiler
+
+# Files the wizard rewrites in place after copying the template
+WIZARD_WRITTEN_PATHS = {
+    'app.json', 'package.json', 'eas.json', 'tailwind.config.js', '.env.example',
+    'app/config/firebase.ts', 'config/firebase.ts', 'config/messaging.ts',
+    'assets/REPLACE_DEMO_IMAGES.md', 'README.md', 'data/employeeSeedData.js',
+    'data/employeeSeedData.json', 'data/README_EMPLOYEES.md', MANIFEST_FILENAME,
+}
+
+# Generated docs stamped with the time they were written, and the stamp's label;
+# an app restored from the cache gets them stamped anew
+TIMESTAMPED_DOCS = {
+    'assets/REPLACE_DEMO_IMAGES.md': 'Created: ',
+    'data/README_EMPLOYEES.md': 'Generated on: ',
+}
+
+# Files the wizard edits *before* the replacement pass; they are copied raw and
+# branded afterwards so the engine sees the wizard's edits, as it always has
+PRE_REPLACEMENT_PATHS = [
+    'app.json', 'package.json', 'app/config/firebase.ts', 'config/firebase.ts',
+    'tailwind.config.js', 'config/messaging.ts',
+]
+
+# Batch manifest fields every client entry must provide
+BATCH_REQUIRED_FIELDS = [
+    'businessName', 'ownerName', 'ownerEmail', 'ownerPhone', 'businessAddress',
+    'serviceTypes', 'primaryColor', 'appName', 'bundleId',
+]
+
+# Types the fields of a batch entry may have when they're given (JSON numbers
+# are fine where a CSV would have digits)
+BATCH_FIELD_TYPES = {
+    'businessName': str, 'ownerName': str, 'ownerEmail': str, 'ownerPhone': (str, int),
+    'businessAddress': str, 'serviceTypes': (str, list), 'primaryColor': str, 'appName': str,
+    'bundleId': str, 'language': str, 'welcomeMessage': str, 'numberOfWorkers': (str, int),
+    'firebaseProjectId': str, 'firebaseConfigPath': str, 'employees': list, 'messaging': dict,
+    'sms4free': (str, bool), 'whatsapp': (str, bool),
+}
+EMPLOYEE_FIELD_TYPES = {'name': str, 'phone': (str, int), 'specialization': str, 'experience': (str, int)}
+MESSAGING_FIELD_TYPES = {
+    'enabled': (str, bool), 'user': str, 'pass': str, 'apiKey': str, 'sender': str,
+    'phoneNumberId': str, 'accessToken': str,
+}
+JSON_TYPE_NAMES = {str: 'a string', int: 'a number', bool: 'true/false', list: 'a list', dict: 'an object'}
+
+def field_type_errors(fields: Dict[str, Any], types: Dict[str, Any], where: str = '') -> List[str]:
+    """A problem for every field of fields that is set to a value of a type it can't have"""
+    errors = []
+    for field, allowed in types.items():
+        value = fields.get(field)
+        allowed = allowed if isinstance(allowed, tuple) else (allowed,)
+        # bool is an int to isinstance, but true isn't a phone number
+        if value is None or (isinstance(value, allowed) and (bool in allowed or not isinstance(value, bool))):
+            continue
+        expected = ' or '.join(JSON_TYPE_NAMES[kind] for kind in allowed)
+        errors.append(f"{where}{field} must be {expected}: {json.dumps(value, ensure_ascii=False)}")
+    return errors
+
+@dataclass
+class BatchResult:
+    """Outcome of generating one client app in batch mode"""
+    business_name: str
+    bundle_id: str
+    app_path: str
+    ok: bool = False
+    replacements: int = 0
+    files_touched: int = 0
+    legacy_issues: int = 0
+    seconds: float = 0.0
+    # Restored from the app cache instead of generated
+    cached: bool = False
+    error: Optional[str] = None
+    log: str = ''
+
+def app_path_for(business_info: Dict[str, Any]) -> str:
+    """Directory a client app is generated into"""
+    project_name = re.sub(r'\W+', '-', business_info['businessName'].lower())
+    return os.path.join(os.path.expanduser('~/Desktop'), f'{project_name}-barbershop')
+
+def write_app_archive(ctx: GenerationContext, target, fmt: Optional[str] = None, root: str = '') -> int:
+    """write_archive() for an app generated in memory or restored from the app cache"""
+    if ctx.cached_app is not None:
+        return ctx.cached_app.write_archive(target, fmt, root=root)
+    return write_archive(ctx.overlay, target, fmt, root=root)
 
 class BarberAppDuplicationWizard:
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, jobs=1, copy_mode='copy', profile_path=None, profile_format='json',
+                 rule_stats=False, skip_dead_rules=False, archive_path=None, patch_path=None,
+                 use_template_index=True, use_app_cache=False, app_cache_size=DEFAULT_MAX_BYTES):
         self.template_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.dry_run = dry_run
-        self.replacement_result = None
+        self.jobs = jobs
+        self.copy_mode = copy_mode
+        self.profile_path = profile_path
+        self.profile_format = profile_format
+        # Record per-rule statistics for the template (see core/rule_stats.py). Off by
+        # default: collecting them times every rule. Profiling collects them anyway,
+        # and skipping dead rules needs them for the current template revision.
+        self.rule_stats = rule_stats or bool(profile_path) or skip_dead_rules
+        self.skip_dead_rules = skip_dead_rules
+        # Brand from the template's placeholder index (see core/template_index.py)
+        self.use_template_index = use_template_index
+        # Restore apps generated before for the same client and template (see core/app_cache.py).
+        # Off by default: storing each app costs a second write of it; main() turns it on for
+        # batch and serve mode, where the same clients are regenerated.
+        self.app_cache = AppCache(max_bytes=app_cache_size) if use_app_cache else None
+        # Generate into this archive instead of a directory (see core/app_archive.py)
+        self.archive_path = archive_path
+        # Dry runs write the template's branding diff here (a directory in batch mode)
+        self.patch_path = patch_path
         
     def validate_input(self, prompt: str, validator=None, default=None) -> str:
         while True:
@@ -131,15 +256,12 @@ class BarberAppDuplicationWizard:
                 }
             },
             
-            "firebaseProjectId": str(uuid.uuid4()).replace('-', '')[:8]  # Shorter project ID
+            "firebaseProjectId": str(uuid.uuid4()).replace('-', '')[:8],  # Shorter project ID
+            "generatedFields": ["firebaseProjectId"]
         }
 
         # Post-process business info with enhanced fields
-        bundle_parts = business_info['bundleId'].split('.')
-        business_info['domain'] = f"{bundle_parts[-1]}.com"
-        business_info['ownerPhoneE164'] = normalize_to_e164(business_info['ownerPhone'])
-        business_info['businessAddressHe'] = business_info['businessAddress']
-        business_info['businessAddressEn'] = business_info['businessAddress']
+        self.add_derived_fields(business_info)
 
         # Collect SMS credentials if enabled
         if business_info["messaging"]["sms4free"]["enabled"]:
@@ -202,105 +324,350 @@ class BarberAppDuplicationWizard:
                         f"Employee {i + 1} - Years of Experience (optional): ",
                         default="לא צוין"
                     ),
-                    "isMainBarber": i == 0,  # First employee is the main barber
-                    "available": True,
-                    "barberId": f"barber_{i + 1}",
-                    "userId": f"user_{business_info['businessName'].lower().replace(' ', '_')}_barber_{i + 1}"
                 }
                 
-                # Normalize phone to E.164
-                employee["phoneE164"] = normalize_to_e164(employee["phone"])
-                
-                business_info["employees"].append(employee)
+                business_info["employees"].append(self.complete_employee(business_info, employee, i))
                 print(f"✓ Added employee: {employee['name']}")
         
         print(f"\n✅ Collected information for {len(business_info['employees'])} employees")
 
         return business_info
 
-    def update_configuration_files(self, business_info: Dict[str, Any]):
-        """Update all configuration files with business-specific information"""
+    def add_derived_fields(self, business_info: Dict[str, Any]):
+        """Fill in the fields derived from the collected answers"""
+        bundle_parts = business_info['bundleId'].split('.')
+        business_info['domain'] = f"{bundle_parts[-1]}.com"
+        business_info['ownerPhoneE164'] = normalize_to_e164(business_info['ownerPhone'])
+        business_info['businessAddressHe'] = business_info['businessAddress']
+        business_info['businessAddressEn'] = business_info['businessAddress']
+
+    def complete_employee(self, business_info: Dict[str, Any], employee: Dict[str, Any], index: int) -> Dict[str, Any]:
+        """Add the generated ids and flags to an employee entry"""
+        employee.update({
+            "isMainBarber": index == 0,  # First employee is the main barber
+            "available": True,
+            "barberId": f"barber_{index + 1}",
+            "userId": f"user_{business_info['businessName'].lower().replace(' ', '_')}_barber_{index + 1}"
+        })
         
-        # Update app.json
-        self.update_app_json(business_info)
+        # Normalize phone to E.164
+        employee["phoneE164"] = normalize_to_e164(employee["phone"])
+        return employee
+
+    def load_batch_file(self, batch_path: str) -> List[Dict[str, Any]]:
+        """
+        Read client entries from a JSON list (or {"clients": [...]}) or a CSV file.
+        CSV employees are written as "name|phone|specialization|experience; ..."
+        """
+        if batch_path.lower().endswith('.csv'):
+            with open(batch_path, 'r', encoding='utf-8-sig', newline='') as f:
+                entries = []
+                for row in csv.DictReader(f):
+                    entry = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+                    employees = []
+                    for chunk in entry.pop('employees', '').split(';'):
+                        fields = [field.strip() for field in chunk.split('|')]
+                        if fields[0]:
+                            employees.append(dict(zip(['name', 'phone', 'specialization', 'experience'], fields)))
+                    entry['employees'] = employees
+                    entries.append(entry)
+        else:
+            with open(batch_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                entries = entries.get('clients', [])
         
-        # Update package.json
-        self.update_package_json(business_info)
+        # Relative paths in the manifest are relative to the manifest itself
+        base_dir = os.path.dirname(os.path.abspath(batch_path))
+        for entry in entries:
+            if isinstance(entry, dict) and isinstance(entry.get('firebaseConfigPath'), str) and entry['firebaseConfigPath']:
+                entry['firebaseConfigPath'] = os.path.join(base_dir, os.path.expanduser(entry['firebaseConfigPath']))
+        return entries
+
+    def business_info_from_entry(self, entry: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """
+        Validate one batch entry with the interactive validators and build its
+        business_info. Returns (business_info or None, list of problems).
+        """
+        if not isinstance(entry, dict):
+            return None, ["entry is not an object"]
+        errors = field_type_errors(entry, BATCH_FIELD_TYPES)
+        if isinstance(entry.get('serviceTypes'), list) and not all(isinstance(s, str) for s in entry['serviceTypes']):
+            errors.append("serviceTypes must be a list of strings")
+        for i, employee in enumerate(entry.get('employees') if isinstance(entry.get('employees'), list) else []):
+            if isinstance(employee, dict):
+                errors += field_type_errors(employee, EMPLOYEE_FIELD_TYPES, f"employee {i + 1}: ")
+            else:
+                errors.append(f"employee {i + 1}: not an object")
+        messaging = entry.get('messaging') if isinstance(entry.get('messaging'), dict) else {}
+        for channel in ('sms4free', 'whatsapp'):
+            if not isinstance(messaging.get(channel) or {}, dict):
+                errors.append(f"messaging.{channel} must be an object")
+            else:
+                errors += field_type_errors(messaging.get(channel) or {}, MESSAGING_FIELD_TYPES,
+                                            f"messaging.{channel}.")
+        if errors:
+            return None, errors
+        errors = [f"missing {field}" for field in BATCH_REQUIRED_FIELDS if not str(entry.get(field) or '').strip()]
+        if errors:
+            return None, errors
         
-        # Update Firebase configuration
-        self.update_firebase_config(business_info)
+        def yes(value) -> bool:
+            return value is True or str(value).strip().lower() in ('yes', 'true', '1')
         
-        # Update colors and theming
-        self.update_theme_colors(business_info)
+        if not self.validate_email(entry['ownerEmail']):
+            errors.append(f"invalid ownerEmail: {entry['ownerEmail']}")
+        if not self.validate_phone(str(entry['ownerPhone'])):
+            errors.append(f"invalid ownerPhone: {entry['ownerPhone']}")
+        if not self.validate_bundle_id(entry['bundleId']):
+            errors.append(f"invalid bundleId: {entry['bundleId']}")
+        if not self.validate_hex_color(entry['primaryColor']):
+            errors.append(f"invalid primaryColor: {entry['primaryColor']}")
         
-        # Update messaging configuration
-        self.update_messaging_config(business_info)
+        employees = entry.get('employees') or []
+        try:
+            num_workers = int(entry.get('numberOfWorkers') or len(employees))
+        except ValueError:
+            num_workers = 0
+        if not 1 <= num_workers <= 50:
+            errors.append(f"numberOfWorkers must be 1-50: {entry.get('numberOfWorkers')}")
+        elif len(employees) != num_workers:
+            errors.append(f"numberOfWorkers is {num_workers} but {len(employees)} employees are listed")
+        for i, employee in enumerate(employees):
+            if not str(employee.get('name') or '').strip():
+                errors.append(f"employee {i + 1}: missing name")
+            elif not self.validate_phone(str(employee.get('phone') or '')):
+                errors.append(f"employee {i + 1}: invalid phone: {employee.get('phone')}")
         
-        # Replace all hardcoded content throughout the app using new system
-        self.replace_content_with_new_system(business_info)
+        firebase_config_path = entry.get('firebaseConfigPath') or None
+        if firebase_config_path and not self.validate_firebase_config_file(firebase_config_path):
+            errors.append(f"invalid firebaseConfigPath: {firebase_config_path}")
+        if errors:
+            return None, errors
         
-        # Replace demo images with neutral ones
-        self.replace_demo_images(business_info)
+        messaging = entry.get('messaging') or {}
+        sms4free = messaging.get('sms4free') or {}
+        whatsapp = messaging.get('whatsapp') or {}
+        service_types = entry['serviceTypes']
+        primary_color = entry['primaryColor']
+        if len(primary_color) == 4:
+            # Expand #rgb, the color rules need all six digits
+            primary_color = '#' + ''.join(digit * 2 for digit in primary_color[1:])
+        business_info = {
+            "businessName": entry['businessName'],
+            "ownerName": entry['ownerName'],
+            "ownerEmail": entry['ownerEmail'],
+            "ownerPhone": str(entry['ownerPhone']),
+            "businessAddress": entry['businessAddress'],
+            "numberOfWorkers": num_workers,
+            "serviceTypes": service_types.split(',') if isinstance(service_types, str) else list(service_types),
+            "primaryColor": primary_color,
+            "language": entry.get('language') or 'he',
+            "appName": entry['appName'],
+            "bundleId": entry['bundleId'],
+            "welcomeMessage": entry.get('welcomeMessage') or f"שלום, ברוכים הבאים ל-{entry['businessName']}",
+            "messaging": {
+                "sms4free": {
+                    "enabled": yes(sms4free.get('enabled', entry.get('sms4free', False))),
+                    "user": sms4free.get('user', ''),
+                    "pass": sms4free.get('pass', ''),
+                    "apiKey": sms4free.get('apiKey', ''),
+                    "sender": sms4free.get('sender', '')
+                },
+                "whatsapp": {
+                    "enabled": yes(whatsapp.get('enabled', entry.get('whatsapp', False))),
+                    "phoneNumberId": whatsapp.get('phoneNumberId', ''),
+                    "accessToken": whatsapp.get('accessToken', '')
+                }
+            },
+            "firebaseProjectId": entry.get('firebaseProjectId') or str(uuid.uuid4()).replace('-', '')[:8],
+            "firebaseConfigPath": firebase_config_path,
+            "employees": [],
+            "generatedFields": [] if entry.get('firebaseProjectId') else ["firebaseProjectId"]
+        }
+        self.add_derived_fields(business_info)
+        for i, employee in enumerate(employees):
+            business_info["employees"].append(self.complete_employee(business_info, {
+                "name": employee['name'],
+                "phone": str(employee['phone']),
+                "specialization": employee.get('specialization') or "תספורת כללית",
+                "experience": employee.get('experience') or "לא צוין",
+            }, i))
+        return business_info, []
+
+    def run_batch(self, batch_path: str, batch_workers: int = 4) -> bool:
+        """
+        Validate every client in a batch manifest, then generate the apps of
+        the valid ones concurrently (clients with problems are listed and skipped)
+        """
+        print(f"\n--- Barber App Batch Generation: {batch_path} ---")
+        entries = self.load_batch_file(batch_path)
         
-        # Create employee seed data
-        self.create_employee_seed_data(business_info)
+        clients = []
+        problems = []
+        seen_paths = {}
+        for number, entry in enumerate(entries, 1):
+            business_info, errors = self.business_info_from_entry(entry)
+            if business_info is not None:
+                app_path = app_path_for(business_info)
+                if app_path in seen_paths:
+                    errors.append(f"same target directory as client {seen_paths[app_path]}: {app_path}")
+                elif os.path.exists(app_path):
+                    errors.append(f"target directory already exists: {app_path}")
+                seen_paths.setdefault(app_path, number)
+            name = entry.get('businessName') if isinstance(entry, dict) else None
+            for error in errors:
+                problems.append(f"  ❌ Client {number} ({name or '?'}): {error}")
+            if not errors:
+                clients.append(business_info)
         
-        # Update environment variables
-        self.update_env_files(business_info)
+        if problems:
+            # A client with problems is skipped; the rest are still generated
+            print(f"\n❌ {len(problems)} problems in {batch_path}, "
+                  f"{len(entries) - len(clients)} clients are skipped:")
+            print("\n".join(problems))
+            if not clients:
+                return False
+        print(f"✅ {len(clients)} clients validated")
         
-        # Update EAS configuration
-        self.update_eas_config(business_info)
+        if self.dry_run:
+            print("\n--- DRY RUN SUMMARY ---")
+            for business_info in clients:
+                print(f"Would create {business_info['bundleId']} at {app_path_for(business_info)}")
+            if self.patch_path:
+                os.makedirs(self.patch_path, exist_ok=True)
+                snapshot = snapshot_template(self.template_path)
+                for business_info in clients:
+                    patch_path = os.path.join(self.patch_path, f"{business_info['bundleId']}.patch")
+                    result = self.write_branding_patch(business_info, patch_path, snapshot)
+                    print(f"  📝 {patch_path}: {result.total_replacements} replacements "
+                          f"in {result.files_touched} files")
+            return not problems
+        
+        # Each app is generated in its own process so its output can be captured
+        # for the summary (stdout redirection is process-wide)
+        print(f"🚀 Generating {len(clients)} apps with {batch_workers} workers...")
+        if self.use_template_index or self.app_cache is not None:
+            # Compiled (and hashed) here once, instead of by every worker at the same time
+            snapshot = snapshot_template(self.template_path)
+            if self.app_cache is not None:
+                self.app_cache.template_hash(self.template_path, snapshot)
+            if self.use_template_index:
+                for business_info in clients:
+                    template_index(self.template_path, snapshot, scan_targets(snapshot),
+                                   get_compiled_replacements(business_info))
+        tasks = [(business_info, self.copy_mode, self.rule_stats, self.skip_dead_rules, self.use_template_index,
+                  self.app_cache) for business_info in clients]
+        results = []
+        with ProcessPoolExecutor(max_workers=max(1, batch_workers)) as pool:
+            for result in pool.map(_generate_client_app, tasks):
+                status = "✓" if result.ok else "❌"
+                cached = ", cached" if result.cached else ""
+                print(f"  {status} {result.business_name} ({result.seconds:.1f}s{cached})")
+                results.append(result)
+        
+        self.print_batch_summary(results)
+        return not problems and all(result.ok for result in results)
+
+    def write_branding_patch(self, business_info: Dict[str, Any], patch_path: str,
+                             snapshot: Optional[TreeSnapshot] = None):
+        """
+        Dry-run the replacement engine over the template and write what it would
+        change as a patch (apply with patch -p1 in a copy of the template).
+        The wizard's own config edits (app.json, .env, ...) aren't part of it.
+        """
+        with contextlib.redirect_stdout(io.StringIO()):
+            return replace_hardcoded_content_safe(self.template_path, business_info, dry_run=True,
+                                                  workers=self.jobs, snapshot=snapshot,
+                                                  patch_path=patch_path)
+
+    def print_batch_summary(self, results: List[BatchResult]):
+        """Print one row per generated client app"""
+        rows = [("Business", "Bundle ID", "Status", "Replacements", "Legacy", "Time", "Location / Error")]
+        for result in results:
+            rows.append((
+                result.business_name, result.bundle_id,
+                ("CACHED" if result.cached else "OK") if result.ok else "FAILED",
+                str(result.replacements), str(result.legacy_issues), f"{result.seconds:.1f}s",
+                result.app_path if result.ok else result.error
+            ))
+        widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]) - 1)]
+        
+        print("\n" + "=" * 60)
+        print(f"📦 Batch Summary: {sum(result.ok for result in results)}/{len(results)} apps generated")
+        print("=" * 60)
+        for i, row in enumerate(rows):
+            print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) + "  " + row[-1])
+            if i == 0:
+                print("  ".join("-" * width for width in widths) + "  " + "-" * len(row[-1]))
+        
+        for result in results:
+            if not result.ok and result.log:
+                print(f"\n--- Output for {result.business_name} (last lines) ---")
+                print("\n".join(result.log.splitlines()[-15:]))
 
-    def update_app_json(self, business_info: Dict[str, Any]):
+    def update_configuration_files(self, ctx: GenerationContext):
+        """Update all configuration files with business-specific information"""
+        
+        steps = [
+            ('app.json', self.update_app_json),
+            ('package.json', self.update_package_json),
+            ('firebase', self.update_firebase_config),
+            ('theme', self.update_theme_colors),
+            ('messaging', self.update_messaging_config),
+            # Replace all hardcoded content throughout the app using new system
+            ('content replacement', self.replace_content_with_new_system),
+            # Replace demo images with neutral ones
+            ('images', self.replace_demo_images),
+            ('employee seed data', self.create_employee_seed_data),
+            ('env', self.update_env_files),
+            ('eas.json', self.update_eas_config),
+        ]
+        for name, step in steps:
+            with ctx.stage(name):
+                step(ctx)
+        ctx.flush_documents()
+
+    def update_app_json(self, ctx: GenerationContext):
         """Update app.json with business-specific configuration"""
+        business_info = ctx.business_info
         app_json_path = 'app.json'
         
-        if os.path.exists(app_json_path):
-            with open(app_json_path, 'r') as f:
-                app_config = json.load(f)
+        if ctx.exists(app_json_path):
+            # Edited in place (missing objects are created); written with the replacement pass
+            app_config = ctx.json_document(app_json_path)
             
             # Update expo configuration
-            app_config['expo']['name'] = business_info['appName']
-            app_config['expo']['slug'] = business_info['bundleId'].split('.')[-1]
+            app_config.set(('expo', 'name'), business_info['appName'])
+            app_config.set(('expo', 'slug'), business_info['bundleId'].split('.')[-1])
             
             # iOS configuration
-            if 'ios' not in app_config['expo']:
-                app_config['expo']['ios'] = {}
-            app_config['expo']['ios']['bundleIdentifier'] = business_info['bundleId']
+            app_config.set(('expo', 'ios', 'bundleIdentifier'), business_info['bundleId'])
             
             # Android configuration  
-            if 'android' not in app_config['expo']:
-                app_config['expo']['android'] = {}
-            app_config['expo']['android']['package'] = business_info['bundleId']
+            app_config.set(('expo', 'android', 'package'), business_info['bundleId'])
             
             # Update colors
-            if 'splash' not in app_config['expo']:
-                app_config['expo']['splash'] = {}
-            app_config['expo']['splash']['backgroundColor'] = business_info['primaryColor']
-            
-            with open(app_json_path, 'w') as f:
-                json.dump(app_config, f, indent=2)
+            app_config.set(('expo', 'splash', 'backgroundColor'), business_info['primaryColor'])
             
             print(f"✓ Updated app.json with {business_info['appName']}")
 
-    def update_package_json(self, business_info: Dict[str, Any]):
+    def update_package_json(self, ctx: GenerationContext):
         """Update package.json with business information"""
+        business_info = ctx.business_info
         package_json_path = 'package.json'
         
-        if os.path.exists(package_json_path):
-            with open(package_json_path, 'r') as f:
-                package_config = json.load(f)
-            
-            package_config['name'] = business_info['bundleId'].split('.')[-1]
-            package_config['description'] = f"{business_info['businessName']} - Barber Shop Booking App"
+        if ctx.exists(package_json_path):
+            package_config = ctx.json_document(package_json_path)
             
-            with open(package_json_path, 'w') as f:
-                json.dump(package_config, f, indent=2)
+            package_config.set(('name',), business_info['bundleId'].split('.')[-1])
+            package_config.set(('description',), f"{business_info['businessName']} - Barber Shop Booking App")
             
             print(f"✓ Updated package.json")
 
-    def update_firebase_config(self, business_info: Dict[str, Any]):
+    def update_firebase_config(self, ctx: GenerationContext):
         """Update Firebase configuration with real or demo values"""
+        business_info = ctx.business_info
         config_files = ['app/config/firebase.ts', 'config/firebase.ts']
         
         # Use real Firebase config if provided, otherwise create demo config
@@ -332,46 +699,44 @@ class BarberAppDuplicationWizard:
             }
         
         for config_file in config_files:
-            if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    content = f.read()
+            if ctx.exists(config_file):
+                content = ctx.read_text(config_file)
                 
                 # Replace Firebase config values with real or demo ones
-                content = re.sub(r'apiKey:\s*["\'][^"\']*["\']', f'apiKey: "{firebase_config["apiKey"]}"', content)
-                content = re.sub(r'authDomain:\s*["\'][^"\']*["\']', f'authDomain: "{firebase_config["authDomain"]}"', content)
-                content = re.sub(r'projectId:\s*["\'][^"\']*["\']', f'projectId: "{firebase_config["projectId"]}"', content)
-                content = re.sub(r'storageBucket:\s*["\'][^"\']*["\']', f'storageBucket: "{firebase_config["storageBucket"]}"', content)
-                content = re.sub(r'messagingSenderId:\s*["\'][^"\']*["\']', f'messagingSenderId: "{firebase_config["messagingSenderId"]}"', content)
-                content = re.sub(r'appId:\s*["\'][^"\']*["\']', f'appId: "{firebase_config["appId"]}"', content)
+                content = ctx.sub(r'apiKey:\s*["\'][^"\']*["\']', f'apiKey: "{firebase_config["apiKey"]}"', content)
+                content = ctx.sub(r'authDomain:\s*["\'][^"\']*["\']', f'authDomain: "{firebase_config["authDomain"]}"', content)
+                content = ctx.sub(r'projectId:\s*["\'][^"\']*["\']', f'projectId: "{firebase_config["projectId"]}"', content)
+                content = ctx.sub(r'storageBucket:\s*["\'][^"\']*["\']', f'storageBucket: "{firebase_config["storageBucket"]}"', content)
+                content = ctx.sub(r'messagingSenderId:\s*["\'][^"\']*["\']', f'messagingSenderId: "{firebase_config["messagingSenderId"]}"', content)
+                content = ctx.sub(r'appId:\s*["\'][^"\']*["\']', f'appId: "{firebase_config["appId"]}"', content)
                 
-                with open(config_file, 'w') as f:
-                    f.write(content)
+                ctx.write_text(config_file, content)
                 
                 config_type = "real" if business_info.get('firebaseConfigPath') else "demo"
                 print(f"✓ Updated {config_file} with {config_type} Firebase config")
 
-    def update_theme_colors(self, business_info: Dict[str, Any]):
+    def update_theme_colors(self, ctx: GenerationContext):
         """Update theme colors in configuration files"""
+        business_info = ctx.business_info
         tailwind_config_path = 'tailwind.config.js'
         
-        if os.path.exists(tailwind_config_path):
-            with open(tailwind_config_path, 'r') as f:
-                content = f.read()
+        if ctx.exists(tailwind_config_path):
+            content = ctx.read_text(tailwind_config_path)
             
             # Update primary color only
-            content = re.sub(
+            content = ctx.sub(
                 r"primary:\s*['\"]#[0-9a-fA-F]{6}['\"]",
                 f"primary: '{business_info['primaryColor']}'",
                 content
             )
             
-            with open(tailwind_config_path, 'w') as f:
-                f.write(content)
+            ctx.write_text(tailwind_config_path, content)
             
             print(f"✓ Updated theme colors")
 
-    def update_env_files(self, business_info: Dict[str, Any]):
+    def update_env_files(self, ctx: GenerationContext):
         """Create environment configuration file"""
+        business_info = ctx.business_info
         env_content = f"""# {business_info['businessName']} Configuration
 FIREBASE_PROJECT_ID={business_info['firebaseProjectId']}
 BUSINESS_NAME={business_info['businessName']}
@@ -394,76 +759,98 @@ WHATSAPP_PHONE_NUMBER_ID={business_info['messaging']['whatsapp']['phoneNumberId'
 WHATSAPP_ACCESS_TOKEN={business_info['messaging']['whatsapp']['accessToken']}
 """
         
-        with open('.env.example', 'w') as f:
-            f.write(env_content)
+        ctx.write_text('.env.example', env_content)
         
         print(f"✓ Created .env.example file")
 
-    def update_messaging_config(self, business_info: Dict[str, Any]):
+    def update_messaging_config(self, ctx: GenerationContext):
         """Update messaging configuration"""
+        business_info = ctx.business_info
         config_path = 'config/messaging.ts'
         
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                content = f.read()
+        if ctx.exists(config_path):
+            content = ctx.read_text(config_path)
             
             # Update default provider based on what's enabled
             if business_info["messaging"]["sms4free"]["enabled"]:
-                content = re.sub(
+                content = ctx.sub(
                     r"defaultProvider:\s*['\"][^'\"]*['\"]",
                     "defaultProvider: 'sms4free'",
                     content
                 )
             elif business_info["messaging"]["whatsapp"]["enabled"]:
-                content = re.sub(
+                content = ctx.sub(
                     r"defaultProvider:\s*['\"][^'\"]*['\"]",
                     "defaultProvider: 'whatsapp'",
                     content
                 )
             
-            with open(config_path, 'w') as f:
-                f.write(content)
+            ctx.write_text(config_path, content)
             
             print(f"✓ Updated messaging configuration")
 
-    def update_eas_config(self, business_info: Dict[str, Any]):
+    def update_eas_config(self, ctx: GenerationContext):
         """Update EAS build configuration"""
+        business_info = ctx.business_info
         eas_json_path = 'eas.json'
         
-        if os.path.exists(eas_json_path):
-            with open(eas_json_path, 'r') as f:
-                eas_config = json.load(f)
+        if ctx.exists(eas_json_path):
+            eas_config = ctx.json_document(eas_json_path)
             
             # Update bundle identifiers in build profiles
-            for profile_name, profile in eas_config.get('build', {}).items():
+            for profile_name, profile in eas_config.get(('build',), {}).items():
                 if 'ios' in profile and 'bundleIdentifier' in profile['ios']:
-                    profile['ios']['bundleIdentifier'] = business_info['bundleId']
+                    eas_config.set(('build', profile_name, 'ios', 'bundleIdentifier'), business_info['bundleId'])
                 if 'android' in profile and 'package' in profile['android']:
-                    profile['android']['package'] = business_info['bundleId']
-            
-            with open(eas_json_path, 'w') as f:
-                json.dump(eas_config, f, indent=2)
+                    eas_config.set(('build', profile_name, 'android', 'package'), business_info['bundleId'])
             
             print(f"✓ Updated EAS configuration")
 
-    def replace_content_with_new_system(self, business_info: Dict[str, Any]):
+    def replace_content_with_new_system(self, ctx: GenerationContext):
         """Replace all hardcoded content using the new replacement system"""
         
         print(f"\n🔄 Applying comprehensive content replacement...")
         
-        # Use the new replacement system
-        result = replace_hardcoded_content_safe('.', business_info, dry_run=self.dry_run)
+        # Use the new replacement system. When the template was branded while it
+        # was copied, only the files held back from that pass are left to do.
+        # The JSON files edited so far are branded from memory and written once.
+        files = None
+        contents = {}
+        if ctx.deferred_paths is not None:
+            files = [path.replace('/', os.sep) for path in ctx.deferred_paths if ctx.exists(path)]
+            if not ctx.dry_run:
+                contents = {path.replace('/', os.sep): data
+                            for path, data in ctx.take_documents(ctx.deferred_paths).items()}
+        ctx.flush_documents()
+        if ctx.overlay is not None:
+            result = brand_overlay_files(ctx.overlay, files or [], ctx.business_info, contents,
+                                         pattern_stats=ctx.pattern_stats, check_legacy=ctx.check_legacy)
+        else:
+            result = replace_hardcoded_content_safe(ctx.root, ctx.business_info, dry_run=ctx.dry_run,
+                                                    workers=ctx.jobs, incremental=True, files=files,
+                                                    contents=contents, pattern_stats=ctx.pattern_stats,
+                                                    check_legacy=ctx.check_legacy)
+        ctx.count('files_written', result.files_touched)
+        ctx.count('regex_matches', result.total_replacements)
+        ctx.unverified_paths.difference_update(path.replace(os.sep, '/') for path in result.files_verified)
+        if ctx.profiler is not None:
+            ctx.profiler.add_patterns(result.pattern_stats)
         
         # Store results for final summary
-        self.replacement_result = result
+        if ctx.replacement_result is not None and files is not None:
+            ctx.replacement_result.merge(result)
+            result = ctx.replacement_result
+        else:
+            ctx.replacement_result = result
         
-        if not self.dry_run:
+        if not ctx.dry_run:
             print(f"✅ Content replacement complete: {result.total_replacements} replacements in {result.files_touched} files")
         else:
             print(f"📋 DRY RUN: Would make {result.total_replacements} replacements in {result.files_touched} files")
 
-    def replace_demo_images(self, business_info: Dict[str, Any]):
+    def replace_demo_images(self, ctx: GenerationContext):
         """Replace demo images with neutral placeholder images"""
+        business_info = ctx.business_info
         
         # Create placeholder images info file
         placeholder_info = f"""# Demo Images - Replace with Real Business Images
@@ -494,13 +881,13 @@ Business: {business_info['businessName']}
 Created: {__import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 """
         
-        with open('assets/REPLACE_DEMO_IMAGES.md', 'w') as f:
-            f.write(placeholder_info)
+        ctx.write_text('assets/REPLACE_DEMO_IMAGES.md', placeholder_info)
         
         print(f"✓ Created demo images replacement guide")
 
-    def create_employee_seed_data(self, business_info: Dict[str, Any]):
+    def create_employee_seed_data(self, ctx: GenerationContext):
         """Create seed data file for employees/barbers"""
+        business_info = ctx.business_info
         if not business_info.get('employees') or len(business_info['employees']) == 0:
             print("⚠️ No employees to create seed data for")
             return
@@ -610,10 +997,7 @@ export default employeeSeedData;
 
         # Write the seed file
         seed_file_path = 'data/employeeSeedData.js'
-        os.makedirs(os.path.dirname(seed_file_path), exist_ok=True)
-        
-        with open(seed_file_path, 'w', encoding='utf-8') as f:
-            f.write(seed_content)
+        ctx.write_text(seed_file_path, seed_content, encoding='utf-8')
 
         # Also create a JSON version for easy import
         json_data = {
@@ -623,8 +1007,7 @@ export default employeeSeedData;
         }
         
         json_file_path = 'data/employeeSeedData.json'
-        with open(json_file_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
+        ctx.write_json(json_file_path, json_data, encoding='utf-8', ensure_ascii=False)
 
         # Create README for the seed data
         readme_content = f"""# Employee Seed Data for {business_info['businessName']}
@@ -677,26 +1060,135 @@ Generated on: {__import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S
 """
 
         readme_file_path = 'data/README_EMPLOYEES.md'
-        with open(readme_file_path, 'w', encoding='utf-8') as f:
-            f.write(readme_content)
+        ctx.write_text(readme_file_path, readme_content, encoding='utf-8')
 
         print(f"✓ Created employee seed data:")
         print(f"  - JavaScript: {seed_file_path}")
         print(f"  - JSON: {json_file_path}")
         print(f"  - Documentation: {readme_file_path}")
 
-    def create_new_app_instance(self, business_info: Dict[str, Any]):
+    def check_unverified_files(self, ctx: GenerationContext):
+        """
+        Check the text files written after the replacement passes for legacy
+        content. Everything else was checked by those passes as it was branded
+        (GenerationContext.check_legacy), so the app is never read again as a whole.
+        """
+        result = ctx.replacement_result
+        files = sorted(path for path in ctx.unverified_paths if is_scan_target(path) and ctx.exists(path))
+        for rel_path in files:
+            result.add_legacy_findings(rel_path.replace('/', os.sep),
+                                       legacy_scanner().scan_bytes(ctx.read_bytes(rel_path)))
+        ctx.unverified_paths.clear()
+        ctx.count('files_read', len(files))
+        
+        print(f"\n🧪 Legacy content check: {len(result.files_verified)} files "
+              f"({len(files)} checked after the replacement pass)")
+        self.print_legacy_findings(result)
+
+    def print_legacy_findings(self, result: ReplacementResult):
+        """List the legacy content a ReplacementResult's checks found, 5 matches per pattern"""
+        if not result.legacy_findings:
+            print("  ✅ No legacy brand strings found!")
+            return
+        print(f"  ❌ Found {result.legacy_issues} legacy content issues:")
+        for pattern_name, matches in result.legacy_findings.items():
+            for file_path, line_num, line_content in matches[:5]:
+                print(f"    {file_path}:{line_num} [{pattern_name}] → {line_content[:100]}")
+            if len(matches) > 5:
+                print(f"    ... and {len(matches) - 5} more")
+
+    def create_new_app_instance(self, business_info: Dict[str, Any], app_path: Optional[str] = None,
+                                snapshot: Optional[TreeSnapshot] = None, archive_path: Optional[str] = None,
+                                in_memory: bool = False) -> GenerationContext:
+        """
+        Generate one client app into app_path (default: app_path_for(business_info)).
+        snapshot is a walk of the template to reuse (see generation_server.py).
+        With archive_path (.tar, .tar.gz, .tar.zst or .zip) the app is generated in
+        memory and streamed into that archive instead, under app_path's name; with
+        in_memory it's left in ctx.overlay for the caller to write.
+        """
+        in_memory = in_memory or archive_path is not None
         # Generate a unique project name
-        project_name = re.sub(r'\W+', '-', business_info['businessName'].lower())
-        desktop_path = os.path.expanduser('~/Desktop')
-        new_app_path = os.path.join(desktop_path, f'{project_name}-barbershop')
-
-        # Copy template to new location
-        shutil.copytree(self.template_path, new_app_path, symlinks=False, ignore=None)
+        new_app_path = app_path or app_path_for(business_info)
+        profiler = Profiler() if self.profile_path else None
+        ctx = GenerationContext(new_app_path, business_info, dry_run=self.dry_run, jobs=self.jobs,
+                                profiler=profiler, pattern_stats=profiler is not None or self.rule_stats,
+                                # The replacement passes check what they write; only later writes are checked separately
+                                check_legacy=True)
+        
+        if snapshot is None:
+            snapshot = snapshot_template(self.template_path)
+        cache_key = None
+        if self.app_cache is not None:
+            with ctx.stage('app cache'):
+                cache_key = self.app_cache.key(self.app_cache.template_hash(self.template_path, snapshot),
+                                               business_info, in_memory)
+                cached = self.app_cache.get(cache_key)
+            # A directory that's already there is left for the copy to refuse
+            if cached is not None and (in_memory or not os.path.exists(new_app_path)):
+                try:
+                    with ctx.stage('restore'):
+                        self.restore_cached_app(ctx, cached, archive_path, in_memory)
+                except OSError as e:
+                    print(f"⚠️  Cached app can't be used ({e}), generating it again")
+                    self.app_cache.remove(cache_key)
+                    ctx.cached_app = None
+                    if not in_memory:
+                        shutil.rmtree(new_app_path, ignore_errors=True)
+                else:
+                    self.finish_generation(ctx, archive_path or new_app_path)
+                    return ctx
+        revision = None
+        skip_rules = set()
+        if self.rule_stats:
+            revision = template_revision(self.template_path, snapshot, scan_targets(snapshot))
+            if self.skip_dead_rules:
+                patterns = [pattern for pattern, _ in get_compiled_replacements(business_info).rules]
+                skip_rules = RuleStats.load().dead_rules(revision, patterns)
+                if skip_rules:
+                    print(f"💀 Skipping {len(skip_rules)} replacement rules that can't match this template")
+        index = None
+        if self.use_template_index:
+            with ctx.stage('template index'):
+                index = template_index(self.template_path, snapshot, scan_targets(snapshot),
+                                       get_compiled_replacements(business_info))
+
+        # Copy template to new location, skipping dependency and build folders and
+        # replacing hardcoded content on the way
+        with ctx.stage('copy template'):
+            if in_memory:
+                ctx.replacement_result, copy_result, ctx.overlay = brand_template_in_memory(
+                    self.template_path, business_info, workers=self.jobs, defer=PRE_REPLACEMENT_PATHS,
+                    snapshot=snapshot, skip_rules=skip_rules, index=index, pattern_stats=ctx.pattern_stats,
+                    check_legacy=ctx.check_legacy
+                )
+            else:
+                ctx.replacement_result, copy_result = copy_and_brand_template(
+                    self.template_path, new_app_path, business_info, mode=self.copy_mode,
+                    workers=self.jobs, defer=PRE_REPLACEMENT_PATHS, keep_unlinked=WIZARD_WRITTEN_PATHS,
+                    snapshot=snapshot, skip_rules=skip_rules, index=index, pattern_stats=ctx.pattern_stats,
+                    check_legacy=ctx.check_legacy
+                )
+            ctx.count('files_written', copy_result.files_copied + copy_result.files_linked + copy_result.files_cloned)
+            ctx.count('bytes_written', copy_result.bytes_copied)
+            ctx.count('regex_matches', ctx.replacement_result.total_replacements)
+            if ctx.profiler is not None:
+                ctx.profiler.add_patterns(ctx.replacement_result.pattern_stats)
+        if revision is not None:
+            # Before the config steps fold their own runs into the same stats
+            checked = [pattern for pattern, _ in get_compiled_replacements(business_info).without(skip_rules).rules]
+            RuleStats.load().record(self.template_path, revision, checked,
+                                    ctx.replacement_result.pattern_stats or PatternStats(), copy_result.files_scanned)
+        ctx.deferred_paths = PRE_REPLACEMENT_PATHS
+        if in_memory:
+            print(f"✓ Branded template in memory: {copy_result.files_copied} files rewritten")
+        else:
+            print(f"✓ Copied template: {copy_result.files_copied} copied, "
+                  f"{copy_result.files_linked + copy_result.files_cloned} linked ({self.copy_mode})")
 
         # Update configuration files in the new instance
-        os.chdir(new_app_path)
-        self.update_configuration_files(business_info)
+        with ctx.stage('configure'):
+            self.update_configuration_files(ctx)
 
         # Simple README with essential information
         readme_content = f"""# {business_info['businessName']} - Barber Shop App
@@ -759,10 +1251,78 @@ Check `.env.example` for all required environment variables including:
 {business_info['ownerName']} - {business_info['ownerEmail']}
 """
         
-        readme_path = os.path.join(new_app_path, 'README.md')
-        with open(readme_path, 'w') as f:
-            f.write(readme_content)
-
+        with ctx.stage('readme'):
+            ctx.write_text('README.md', readme_content)
+
+        with ctx.stage('legacy check'):
+            self.check_unverified_files(ctx)
+
+        location = new_app_path
+        if archive_path is not None:
+            with ctx.stage('archive'):
+                files_archived = write_archive(ctx.overlay, archive_path, root=os.path.basename(new_app_path))
+                ctx.count('files_written', files_archived)
+            location = archive_path
+
+        if cache_key is not None:
+            with ctx.stage('app cache'):
+                try:
+                    if in_memory:
+                        stored = self.app_cache.store_overlay(cache_key, ctx.overlay, business_info,
+                                                              ctx.replacement_result)
+                    else:
+                        stored = self.app_cache.store_directory(cache_key, new_app_path, business_info,
+                                                                ctx.replacement_result)
+                    if stored is not None:
+                        print(f"💾 Stored in the app cache for the next run ({stored.files} files)")
+                        if not in_memory and self.copy_mode == 'hardlink':
+                            # Share the store's copy of the template instead of linking to the template
+                            print(f"🔗 {stored.link_unchanged(new_app_path)} files linked to the object store")
+                except OSError as e:
+                    print(f"⚠️  Could not store the app in the app cache: {e}")
+
+        self.finish_generation(ctx, location)
+        return ctx
+
+    def restore_cached_app(self, ctx: GenerationContext, cached: CachedApp, archive_path: Optional[str],
+                           in_memory: bool):
+        """
+        Put a cached app where create_new_app_instance would have generated it:
+        extracted into ctx.root, streamed into archive_path, or (in_memory) left
+        in ctx.cached_app for the caller to write.
+        """
+        business_info = ctx.business_info
+        cached.adopt_generated_fields(business_info)
+        self.restamp_cached_docs(cached)
+        ctx.cached_app = cached
+        ctx.replacement_result = cached.replacement_result()
+        if archive_path is not None:
+            ctx.count('files_written', cached.write_archive(archive_path, root=os.path.basename(ctx.root)))
+        elif not in_memory:
+            copy_result = cached.restore(ctx.root, self.copy_mode)
+            ctx.count('files_written', cached.files)
+            if copy_result.files_linked or copy_result.files_cloned:
+                print(f"🔗 {copy_result.files_linked + copy_result.files_cloned} files linked to the object store "
+                      f"({self.copy_mode})")
+        print(f"♻️  Restored from the app cache: {cached.files} files, generated for "
+              f"{business_info['businessName']} from the same template ({cached.metadata['created']})")
+        print(f"\n🧪 Legacy content check: {len(ctx.replacement_result.files_verified)} files "
+              f"(when the app was generated)")
+        self.print_legacy_findings(ctx.replacement_result)
+
+    def restamp_cached_docs(self, cached: CachedApp):
+        """Have the cached app's TIMESTAMPED_DOCS restored with the current time, as if just written"""
+        now = __import__('datetime').datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for rel_path, label in TIMESTAMPED_DOCS.items():
+            content = cached.read(rel_path)
+            if content is not None:
+                cached.overrides[rel_path] = re.sub(
+                    rf'^{re.escape(label)}.*$', lambda _: label + now, content.decode('utf-8'), flags=re.MULTILINE
+                ).encode('utf-8')
+
+    def finish_generation(self, ctx: GenerationContext, location: str):
+        """Print the generation summary and save the profile"""
+        business_info = ctx.business_info
         print(f"\n✅ Wizard 3.0 Enhanced – Generation Complete")
         print("=" * 60)
         
@@ -810,11 +1370,15 @@ Check `.env.example` for all required environment variables including:
         print(f"  ✅ Demo images guide created")
         
         # Replacement Statistics
-        if self.replacement_result:
+        if ctx.replacement_result:
             print(f"\n📊 Content Replacement Stats:")
-            print(f"  📝 {self.replacement_result.total_replacements} replacements across {self.replacement_result.files_touched} files")
-            print(f"  🔍 Legacy brand strings: removed")
-            print(f"  📞 Phone format: E.164 verified")
+            print(f"  📝 {ctx.replacement_result.total_replacements} replacements across {ctx.replacement_result.files_touched} files")
+            if ctx.replacement_result.legacy_issues:
+                print(f"  ⚠️  Legacy content left: {ctx.replacement_result.legacy_issues} matches (see the legacy check above)")
+            else:
+                print(f"  🔍 Legacy brand strings: removed ({len(ctx.replacement_result.files_verified)} files verified)")
+            if 'non_e164_phones' not in ctx.replacement_result.legacy_findings:
+                print(f"  📞 Phone format: E.164 verified")
         
         # Next Steps
         print(f"\n🚀 Next Steps:")
@@ -828,7 +1392,7 @@ Check `.env.example` for all required environment variables including:
         
         # Generated Files Summary
         print(f"\n📁 Generated Files:")
-        print(f"  📂 {new_app_path}")
+        print(f"  📂 {location}")
         print(f"  📄 README.md - Complete setup guide")
         print(f"  📄 .env.example - Environment variables template")
         if business_info.get('employees'):
@@ -836,8 +1400,13 @@ Check `.env.example` for all required environment variables including:
         print(f"  📄 assets/REPLACE_DEMO_IMAGES.md - Image replacement guide")
         
         print(f"\n🎉 Your customized barber shop app is ready!")
-        print(f"📍 Location: {new_app_path}")
+        print(f"📍 Location: {location}")
         print("=" * 60)
+        
+        if ctx.profiler is not None:
+            ctx.profiler.print_summary()
+            ctx.profiler.save(self.profile_path, self.profile_format)
+            print(f"💾 Profile written to {self.profile_path} ({self.profile_format})")
 
     def run(self):
         try:
@@ -851,11 +1420,17 @@ Check `.env.example` for all required environment variables including:
                 print(f"Would create app for: {business_info['businessName']}")
                 print(f"Bundle ID: {business_info['bundleId']}")
                 print(f"Firebase Project: {business_info['firebaseProjectId']}")
-                desktop_path = os.path.expanduser('~/Desktop')
-                print(f"Target directory: {os.path.join(desktop_path, re.sub(r'\\W+', '-', business_info['businessName'].lower()) + '-barbershop')}")
+                print(f"Target directory: {app_path_for(business_info)}")
+                if self.archive_path:
+                    print(f"Archive: {self.archive_path}")
+                if self.patch_path:
+                    result = self.write_branding_patch(business_info, self.patch_path,
+                                                       snapshot_template(self.template_path))
+                    print(f"📝 Branding patch: {result.total_replacements} replacements in "
+                          f"{result.files_touched} files written to {self.patch_path}")
                 return
                 
-            self.create_new_app_instance(business_info)
+            self.create_new_app_instance(business_info, archive_path=self.archive_path)
             
         except KeyboardInterrupt:
             print("\n\n❌ Setup cancelled by user")
@@ -864,15 +1439,123 @@ Check `.env.example` for all required environment variables including:
             print(f"\n❌ Error during setup: {str(e)}")
             sys.exit(1)
 
+def _generate_client_app(args: Tuple[Dict[str, Any], str, bool, bool, bool, Optional[AppCache]]) -> BatchResult:
+    """Batch worker: generate one client app, capturing everything it prints"""
+    business_info, copy_mode, rule_stats, skip_dead_rules, use_template_index, app_cache = args
+    result = BatchResult(business_info['businessName'], business_info['bundleId'], app_path_for(business_info))
+    wizard = BarberAppDuplicationWizard(copy_mode=copy_mode, rule_stats=rule_stats, skip_dead_rules=skip_dead_rules,
+                                        use_template_index=use_template_index, use_app_cache=False)
+    wizard.app_cache = app_cache
+    output = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            ctx = wizard.create_new_app_instance(business_info)
+        result.ok = True
+        result.cached = ctx.cached_app is not None
+        if ctx.replacement_result:
+            result.replacements = ctx.replacement_result.total_replacements
+            result.files_touched = ctx.replacement_result.files_touched
+            result.legacy_issues = ctx.replacement_result.legacy_issues
+    except Exception as e:
+        result.error = str(e)
+    result.seconds = time.perf_counter() - start
+    result.log = output.getvalue()
+    return result
+
 def main():
     parser = argparse.ArgumentParser(description='Barber App Duplication Wizard 3.0 - Simple & Fast')
     parser.add_argument('--dry-run', action='store_true', 
                        help='Preview the configuration without creating files')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                       help='Number of worker processes for content replacement')
+    parser.add_argument('--copy-mode', choices=COPY_MODES, default='copy',
+                       help='How to copy template files that are never rewritten (default: copy)')
+    parser.add_argument('--batch', metavar='CLIENTS',
+                       help='Generate one app per client from a JSON or CSV manifest instead of asking')
+    parser.add_argument('--batch-workers', type=int, default=min(4, os.cpu_count() or 1),
+                       help='Number of apps generated at the same time in batch mode')
+    parser.add_argument('--profile', metavar='FILE',
+                       help='Record per-step timings, I/O and regex match counts to FILE')
+    parser.add_argument('--profile-format', choices=PROFILE_FORMATS, default='json',
+                       help='Profile file format: json summary or chrome trace (chrome://tracing, Perfetto)')
+    parser.add_argument('--rule-stats', action='store_true',
+                       help='Record per-rule replacement statistics (see core/rule_stats.py report); '
+                            'also on with --profile and --skip-dead-rules')
+    parser.add_argument('--skip-dead-rules', action='store_true',
+                       help='Leave out replacement rules proven unable to match the current template')
+    parser.add_argument('--no-template-index', action='store_true',
+                       help='Run the replacement engine over every template file instead of splicing values '
+                            'in at the offsets indexed for this template (see core/template_index.py)')
+    parser.add_argument('--app-cache', action='store_true',
+                       help='Restore the app if it was generated before for the same client and template, '
+                            'and store it for the next run (see core/app_cache.py); on by default with '
+                            '--batch and --serve')
+    parser.add_argument('--no-app-cache', action='store_true',
+                       help='Never use the app cache, also with --batch and --serve')
+    parser.add_argument('--app-cache-size', type=int, default=DEFAULT_MAX_BYTES >> 20, metavar='MB',
+                       help='Size limit of the app cache; least recently used apps are evicted '
+                            f'(default: {DEFAULT_MAX_BYTES >> 20} MB)')
+    parser.add_argument('--archive', metavar='FILE',
+                       help='Generate the app straight into a .tar, .tar.gz, .tar.zst or .zip archive '
+                            'instead of a directory')
+    parser.add_argument('--serve', nargs='?', const='127.0.0.1:8765', metavar='ADDRESS',
+                       help='Run as a generation service with the template kept in memory '
+                            '(HOST:PORT or unix:PATH, default 127.0.0.1:8765; see generation_server.py)')
+    parser.add_argument('--serve-root', metavar='DIR',
+                       help='Directory the service generates ?format=directory apps under (default: ~/Desktop)')
+    parser.add_argument('--serve-public', action='store_true',
+                       help='Let --serve listen on an address other machines can reach '
+                            '(the service has no authentication)')
+    parser.add_argument('--patch', metavar='PATH',
+                       help='With --dry-run, write the content replacements the app would get as a '
+                            'patch file (with --batch: a directory of <bundleId>.patch files)')
     parser.add_argument('--version', action='version', version='Barber App Wizard 3.0')
     
     args = parser.parse_args()
+    if args.serve and (args.dry_run or args.batch):
+        parser.error("--serve can't be combined with --dry-run or --batch")
+    if (args.serve_root or args.serve_public) and not args.serve:
+        parser.error("--serve-root and --serve-public require --serve")
+    if args.serve:
+        from generation_server import is_local_address
+        try:
+            if not args.serve_public and not is_local_address(args.serve):
+                parser.error(f"{args.serve} is reachable from other machines and the service has no "
+                             "authentication; add --serve-public to listen there anyway")
+        except ValueError as e:
+            parser.error(str(e))
+    if args.patch and not args.dry_run:
+        parser.error("--patch requires --dry-run")
+    if args.archive:
+        if args.serve or args.batch:
+            parser.error("--archive applies to single-app runs")
+        try:
+            problem = unsupported_reason(archive_format(args.archive))
+        except ValueError as e:
+            problem = str(e)
+        if problem:
+            parser.error(problem)
     
-    wizard = BarberAppDuplicationWizard(dry_run=args.dry_run)
+    wizard = BarberAppDuplicationWizard(dry_run=args.dry_run, jobs=args.jobs, copy_mode=args.copy_mode,
+                                        profile_path=args.profile, profile_format=args.profile_format,
+                                        rule_stats=args.rule_stats, skip_dead_rules=args.skip_dead_rules,
+                                        use_template_index=not args.no_template_index,
+                                        use_app_cache=(args.app_cache or bool(args.batch or args.serve))
+                                                      and not args.no_app_cache,
+                                        app_cache_size=args.app_cache_size << 20,
+                                        archive_path=args.archive, patch_path=args.patch)
+    if args.serve:
+        if args.profile:
+            print("⚠️  --profile applies to single-app runs and is ignored in serve mode")
+            wizard.profile_path = None
+        from generation_server import serve
+        serve(wizard, args.serve, output_root=args.serve_root, allow_remote=args.serve_public)
+        return
+    if args.batch:
+        if args.profile:
+            print("⚠️  --profile applies to single-app runs and is ignored in batch mode")
+        sys.exit(0 if wizard.run_batch(args.batch, args.batch_workers) else 1)
     wizard.run()
 
 if __name__ == '__main__':
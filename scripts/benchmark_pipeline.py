@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the branding pipeline.
+Synthesizes template trees of a given size, times each stage for several
+business_info fixtures, and writes JSON results that can be compared between
+commits to catch throughput regressions.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+from typing import Any, Callable, Dict, List, Optional
+
+# Add core directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+from replacements import (
+    TEXT_EXTENSIONS, apply_replacements_to_content, get_compiled_replacements, iter_files,
+    replace_hardcoded_content_safe
+)
+from postgen_check import check_legacy_patterns
+from app_duplication_wizard import BarberAppDuplicationWizard
+
+RESULTS_VERSION = 1
+
+STAGES = ('walk', 'apply', 'replace', 'check', 'generate')
+
+# Client entries (batch file format) the stages are run with
+FIXTURES = {
+    'minimal': {
+        "businessName": "Test Salon", "ownerName": "Dana", "ownerEmail": "dana@testsalon.com",
+        "ownerPhone": "+972523456789", "businessAddress": "Test Street 123, Test City",
+        "serviceTypes": ["Cut"], "primaryColor": "#ff6b35", "appName": "Test Salon",
+        "bundleId": "com.testsalon.app", "employees": [{"name": "Dana", "phone": "+972523456789"}],
+    },
+    'hebrew': {
+        "businessName": "מספרת הדר", "ownerName": "הדר", "ownerEmail": "hadar@hadar.co.il",
+        "ownerPhone": "0541234567", "businessAddress": "הרצל 10, חיפה", "serviceTypes": "תספורת,זקן",
+        "primaryColor": "#123abc", "appName": "הדר", "bundleId": "com.hadar.salon", "language": "he",
+        "employees": [{"name": "הדר", "phone": "0541234567"}],
+    },
+    'full': {
+        "businessName": "Studio Nine", "ownerName": "Noa", "ownerEmail": "noa@studio9.com",
+        "ownerPhone": "+972501112233", "businessAddress": "Dizengoff 99, Tel Aviv",
+        "serviceTypes": ["Cut", "Beard", "Color", "Kids"], "primaryColor": "#0a0b0c",
+        "appName": "Studio 9", "bundleId": "com.studionine.app", "numberOfWorkers": 3,
+        "messaging": {"sms4free": {"enabled": True, "user": "u", "pass": "p", "apiKey": "k", "sender": "Nine"},
+                      "whatsapp": {"enabled": True, "phoneNumberId": "1", "accessToken": "t"}},
+        "employees": [{"name": "Noa", "phone": "+972501112233"}, {"name": "Eli", "phone": "0502223344"},
+                      {"name": "Tal", "phone": "0503334455", "specialization": "Color"}],
+    },
+}
+
+# Legacy content planted in "dirty" synthetic files
+_DIRTY_SNIPPETS = [
+    "const BUSINESS_NAME = 'Barbersbar';",
+    "const title = 'ברבר בר - המספרה שלך';",
+    "const SUPPORT_PHONE = '054-835-3232';",
+    "const OWNER_PHONE = '0523985505';",
+    "const EMAIL = 'info@barbersbar.co.il';",
+    "const BUNDLE = 'com.barbersbar.app';",
+    "// Barber Shop booking screen",
+    "const ADDRESS = 'רפיח ים 12';",
+]
+
+_CLEAN_LINES = [
+    "import React, { useState } from 'react';",
+    "export function format(value: number): string {",
+    "  return value.toFixed(2);",
+    "}",
+    "const styles = { container: { flex: 1, padding: 16 } };",
+    "// Handles appointment scheduling for the selected day",
+    "const label = 'תור חדש';",
+    "  if (!items.length) { return null; }",
+]
+
+_DIRS = ['app/screens', 'app/components', 'app/i18n/locales', 'services', 'config', 'constants',
+         'scripts', 'docs', 'src/lib', 'assets/images']
+
+def synthesize_template(root: str, num_files: int, dirty_ratio: float = 0.2, seed: int = 0):
+    """
+    Write a synthetic template of num_files files under root: text files of
+    every TEXT_EXTENSIONS type (dirty_ratio of them with legacy content), some
+    binary assets, and a node_modules tree the pipeline must skip.
+    """
+    rng = random.Random(seed)
+    extensions = sorted(TEXT_EXTENSIONS)
+    for index in range(num_files):
+        directory = os.path.join(root, rng.choice(_DIRS), f'group{index // 200}')
+        os.makedirs(directory, exist_ok=True)
+        if index % 10 == 9:
+            with open(os.path.join(directory, f'image{index}.png'), 'wb') as f:
+                f.write(b'\x89PNG\r\n\x1a\n\0' + rng.randbytes(rng.randint(1024, 16384)))
+            continue
+        lines = [rng.choice(_CLEAN_LINES) for _ in range(rng.randint(40, 200))]
+        if rng.random() < dirty_ratio:
+            for _ in range(rng.randint(1, 4)):
+                lines.insert(rng.randrange(len(lines)), rng.choice(_DIRTY_SNIPPETS))
+        extension = extensions[index % len(extensions)]
+        with open(os.path.join(directory, f'file{index}{extension}'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    with open(os.path.join(root, 'app.json'), 'w', encoding='utf-8') as f:
+        json.dump({"expo": {"name": "Barbersbar", "slug": "barbersbar", "ios": {"bundleIdentifier": "com.barbersbar.app"},
+                            "android": {"package": "com.barbersbar.app"}}}, f, indent=2)
+    with open(os.path.join(root, 'package.json'), 'w', encoding='utf-8') as f:
+        json.dump({"name": "barbersbar", "version": "1.0.0"}, f, indent=2)
+    skipped = os.path.join(root, 'node_modules', 'some-package')
+    os.makedirs(skipped, exist_ok=True)
+    for index in range(max(1, num_files // 10)):
+        with open(os.path.join(skipped, f'dep{index}.js'), 'w', encoding='utf-8') as f:
+            f.write(f"module.exports = 'Barbersbar {index}';\n")
+
+def load_fixtures(names: List[str], fixtures_file: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Build business_info for each named fixture (from FIXTURES or a batch file)"""
+    wizard = BarberAppDuplicationWizard()
+    entries = dict(FIXTURES)
+    if fixtures_file:
+        for i, entry in enumerate(wizard.load_batch_file(fixtures_file)):
+            entries[entry.get('businessName') or f'fixture{i + 1}'] = entry
+    fixtures = {}
+    for name in names:
+        if name not in entries:
+            raise ValueError(f"Unknown fixture: {name} (have {', '.join(entries)})")
+        business_info, errors = wizard.business_info_from_entry(dict(entries[name]))
+        if business_info is None:
+            raise ValueError(f"Invalid fixture {name}: {'; '.join(errors)}")
+        fixtures[name] = business_info
+    return fixtures
+
+def _time(run: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> List[float]:
+    """Wall-clock seconds of each of `repeat` runs; setup runs untimed before each"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def run_stage(stage: str, template: str, work_dir: str, business_info: Dict[str, Any],
+              repeat: int, jobs: int) -> List[float]:
+    """Time one pipeline stage over the synthetic template"""
+    work = os.path.join(work_dir, 'work')
+
+    def fresh_copy():
+        shutil.rmtree(work, ignore_errors=True)
+        shutil.copytree(template, work)
+
+    if stage == 'walk':
+        return _time(lambda: iter_files(template), repeat)
+    if stage == 'apply':
+        contents = []
+        for rel_path in iter_files(template):
+            with open(os.path.join(template, rel_path), 'r', encoding='utf-8', errors='ignore') as f:
+                contents.append(f.read())
+        replacements = get_compiled_replacements(business_info)
+        return _time(lambda: [apply_replacements_to_content(content, replacements) for content in contents], repeat)
+    if stage == 'replace':
+        return _time(lambda: replace_hardcoded_content_safe(work, business_info, workers=jobs), repeat, fresh_copy)
+    if stage == 'check':
+        return _time(lambda: check_legacy_patterns(template, jobs=jobs), repeat)
+    if stage == 'generate':
+        home = os.path.join(work_dir, 'home')
+        wizard = BarberAppDuplicationWizard(jobs=jobs)
+        wizard.template_path = template
+
+        def clear_home():
+            shutil.rmtree(home, ignore_errors=True)
+            os.makedirs(os.path.join(home, 'Desktop'))
+
+        saved_home = os.environ.get('HOME')
+        os.environ['HOME'] = home  # apps are generated under ~/Desktop
+        try:
+            return _time(lambda: wizard.create_new_app_instance(dict(business_info)), repeat, clear_home)
+        finally:
+            if saved_home is None:
+                os.environ.pop('HOME', None)
+            else:
+                os.environ['HOME'] = saved_home
+    raise ValueError(f"Unknown stage: {stage}")
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes: List[int], fixtures: Dict[str, Dict[str, Any]], stages: List[str],
+                   repeat: int = 3, jobs: int = 1, dirty_ratio: float = 0.2, seed: int = 0) -> Dict[str, Any]:
+    """Run every stage for every tree size and fixture; returns the JSON results document"""
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix='brand-bench-') as work_dir:
+            template = os.path.join(work_dir, 'template')
+            synthesize_template(template, size, dirty_ratio, seed)
+            text_files = iter_files(template)
+            text_bytes = sum(os.path.getsize(os.path.join(template, path)) for path in text_files)
+            print(f"🌳 {size} files ({len(text_files)} text, {text_bytes // 1024} KB)")
+
+            for fixture_name, business_info in fixtures.items():
+                for stage in stages:
+                    timings = run_stage(stage, template, work_dir, business_info, repeat, jobs)
+                    best = min(timings)
+                    results.append({
+                        'stage': stage,
+                        'files': size,
+                        'fixture': fixture_name,
+                        'seconds': [round(t, 6) for t in timings],
+                        'min': round(best, 6),
+                        'median': round(statistics.median(timings), 6),
+                        'filesPerSecond': round(len(text_files) / best, 1) if best else None,
+                        'mbPerSecond': round(text_bytes / best / 1e6, 2) if best else None,
+                    })
+                    print(f"  ⏱️  {stage:<9} {fixture_name:<10} min {best * 1000:9.1f} ms  "
+                          f"median {statistics.median(timings) * 1000:9.1f} ms")
+
+    return {
+        'version': RESULTS_VERSION,
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'jobs': jobs,
+        'repeat': repeat,
+        'dirtyRatio': dirty_ratio,
+        'seed': seed,
+        'results': results,
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> List[str]:
+    """
+    Print a comparison of two results documents (matched by stage, size and
+    fixture); returns the keys that got slower by more than threshold.
+    """
+    previous = {(r['stage'], r['files'], r['fixture']): r for r in baseline.get('results', [])}
+    regressions = []
+    print(f"\n📊 {baseline.get('commit') or 'baseline'} → {current.get('commit') or 'current'}")
+    for setting in ('jobs', 'repeat', 'dirtyRatio', 'seed', 'python'):
+        if baseline.get(setting) != current.get(setting):
+            print(f"  ⚠️  {setting} differs: {baseline.get(setting)} → {current.get(setting)}")
+    for result in current.get('results', []):
+        key = (result['stage'], result['files'], result['fixture'])
+        if key not in previous:
+            continue
+        before, after = previous[key]['min'], result['min']
+        change = (after - before) / before if before else 0.0
+        marker = '❌' if change > threshold else '✅'
+        print(f"  {marker} {key[0]:<9} {key[1]:>6} {key[2]:<10} "
+              f"{before * 1000:9.1f} → {after * 1000:9.1f} ms ({change:+.1%})")
+        if change > threshold:
+            regressions.append(f"{key[0]}/{key[1]}/{key[2]}")
+    return regressions
+
+def main():
+    """Run the benchmarks"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the branding pipeline on synthetic templates')
+    parser.add_argument('--sizes', default='100,1000',
+                        help='Comma-separated template sizes in files (100 to 50000)')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated stages ({', '.join(STAGES)})")
+    parser.add_argument('--fixtures', default=','.join(FIXTURES), help='Comma-separated fixture names')
+    parser.add_argument('--fixtures-file', help='Batch file (JSON/CSV) with more fixtures, named by businessName')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Worker processes for the stages')
+    parser.add_argument('--dirty-ratio', type=float, default=0.2, help='Share of files with legacy content')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic templates')
+    parser.add_argument('--output', '-o', help='Write the JSON results to this file')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Slowdown (0.1 = 10%%) that counts as a regression in --compare')
+
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    stages = [stage for stage in args.stages.split(',') if stage]
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"unknown stage: {stage}")
+    if any(not 1 <= size <= 50000 for size in sizes):
+        parser.error("sizes must be between 1 and 50000 files")
+    try:
+        fixtures = load_fixtures([name for name in args.fixtures.split(',') if name], args.fixtures_file)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print("🏁 Branding Pipeline Benchmarks")
+    print("=" * 50)
+    current = run_benchmarks(sizes, fixtures, stages, max(1, args.repeat), args.jobs, args.dirty_ratio, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
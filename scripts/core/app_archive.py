@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Generated apps that never exist as loose files.
+An AppOverlay is the template plus the files the wizard rewrote or created,
+held in memory; write_archive() streams it into a tar (plain, gzip or zstd)
+or zip archive, passing unchanged template files through from disk without
+decoding them.
+"""
+
+import os
+import io
+import time
+import stat
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Callable, Dict, List, Optional, Union
+
+from walker import TreeSnapshot
+
+ARCHIVE_FORMATS = ('tar', 'tar.gz', 'tar.zst', 'zip')
+
+_EXTENSIONS = (
+    ('.tar.gz', 'tar.gz'), ('.tgz', 'tar.gz'), ('.tar.zst', 'tar.zst'), ('.tzst', 'tar.zst'),
+    ('.tar', 'tar'), ('.zip', 'zip'),
+)
+
+def archive_format(path: str) -> str:
+    """Archive format from a file name's extension; raises ValueError if it has none of ARCHIVE_FORMATS"""
+    lower = path.lower()
+    for extension, fmt in _EXTENSIONS:
+        if lower.endswith(extension):
+            return fmt
+    raise ValueError(f"Unknown archive type (expected .tar, .tar.gz, .tar.zst or .zip): {path}")
+
+class AppOverlay:
+    """
+    A generated app as its template (a TreeSnapshot) plus in-memory changes.
+    Paths are relative and os.sep separated, like the snapshot's.
+    """
+
+    def __init__(self, template_root: str, snapshot: TreeSnapshot):
+        self.template_root = template_root
+        self.snapshot = snapshot
+        self.files: Dict[str, bytes] = {}
+
+    def exists(self, rel_path: str) -> bool:
+        rel_path = rel_path.replace('/', os.sep)
+        return rel_path in self.files or rel_path in self.snapshot.files
+
+    def read_bytes(self, rel_path: str) -> bytes:
+        rel_path = rel_path.replace('/', os.sep)
+        data = self.files.get(rel_path)
+        if data is None:
+            data = self.snapshot.cached_bytes(rel_path)
+        if data is None:
+            if rel_path not in self.snapshot.files:
+                raise FileNotFoundError(f"No such file in the app: {rel_path}")
+            with open(os.path.join(self.template_root, rel_path), 'rb') as f:
+                data = f.read()
+        return data
+
+    def write_bytes(self, rel_path: str, data: bytes):
+        self.files[rel_path.replace('/', os.sep)] = data
+
+    def paths(self) -> List[str]:
+        """Template files in walk order, then the new files, sorted"""
+        return list(self.snapshot.files) + sorted(set(self.files) - set(self.snapshot.files))
+
+    def directories(self) -> List[str]:
+        """The template's directories plus those only new files live in"""
+        directories = list(self.snapshot.directories)
+        known = set(directories)
+        for rel_path in sorted(set(self.files) - set(self.snapshot.files)):
+            parent = os.path.dirname(rel_path)
+            missing = []
+            while parent and parent not in known:
+                missing.append(parent)
+                known.add(parent)
+                parent = os.path.dirname(parent)
+            directories.extend(reversed(missing))
+        return directories
+
+class ArchiveSink(ABC):
+    """Where write_archive() puts an app's entries; members are named root/rel_path"""
+
+    def __init__(self, root: str = ''):
+        self.root = root
+
+    def _name(self, rel_path: str) -> str:
+        name = rel_path.replace(os.sep, '/')
+        return f"{self.root}/{name}" if self.root else name
+
+    @abstractmethod
+    def add_directory(self, rel_path: str, mode: int, mtime: float):
+        ...
+
+    @abstractmethod
+    def add_bytes(self, rel_path: str, data: bytes, mode: int, mtime: float):
+        ...
+
+    @abstractmethod
+    def add_file(self, rel_path: str, src_path: str):
+        """Copy a file from disk as it is, without reading it all into memory"""
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> 'ArchiveSink':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+try:
+    import zstandard  # optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+def unsupported_reason(fmt: str) -> Optional[str]:
+    """Why fmt can't be written here (a missing optional dependency), or None"""
+    if fmt == 'tar.zst' and zstd is None and zstandard is None:
+        return ".tar.zst archives need Python 3.14+ or the zstandard package (pip install zstandard)"
+    return None
+
+def _zstd_writer(fileobj: BinaryIO) -> BinaryIO:
+    if zstd is not None:
+        return zstd.ZstdFile(fileobj, 'w')
+    if zstandard is None:
+        raise RuntimeError(unsupported_reason('tar.zst'))
+    return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+
+class TarSink(ArchiveSink):
+    """Streams a tar archive (compression '', 'gz' or 'zst'); fileobj needn't be seekable"""
+
+    def __init__(self, fileobj: BinaryIO, compression: str = '', root: str = ''):
+        super().__init__(root)
+        self._compressor = _zstd_writer(fileobj) if compression == 'zst' else None
+        mode = 'w|gz' if compression == 'gz' else 'w|'
+        self.tar = tarfile.open(fileobj=self._compressor or fileobj, mode=mode, format=tarfile.PAX_FORMAT)
+
+    def _info(self, rel_path: str, kind: bytes, mode: int, mtime: float, size: int = 0) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(self._name(rel_path))
+        info.type = kind
+        info.mode = stat.S_IMODE(mode)
+        info.mtime = int(mtime)
+        info.size = size
+        return info
+
+    def add_directory(self, rel_path: str, mode: int, mtime: float):
+        self.tar.addfile(self._info(rel_path, tarfile.DIRTYPE, mode, mtime))
+
+    def add_bytes(self, rel_path: str, data: bytes, mode: int, mtime: float):
+        self.tar.addfile(self._info(rel_path, tarfile.REGTYPE, mode, mtime, len(data)), io.BytesIO(data))
+
+    def add_file(self, rel_path: str, src_path: str):
+        with open(src_path, 'rb') as f:
+            info = os.fstat(f.fileno())
+            self.tar.addfile(self._info(rel_path, tarfile.REGTYPE, info.st_mode, info.st_mtime, info.st_size), f)
+
+    def close(self):
+        self.tar.close()
+        if self._compressor is not None:
+            self._compressor.close()
+
+class ZipSink(ArchiveSink):
+    """Writes a deflated zip archive; fileobj needn't be seekable"""
+
+    def __init__(self, fileobj: BinaryIO, root: str = ''):
+        super().__init__(root)
+        self.zip = zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _info(self, name: str, mode: int, mtime: float) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])  # zip dates start in 1980
+        info.external_attr = (mode & 0xFFFF) << 16
+        info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def add_directory(self, rel_path: str, mode: int, mtime: float):
+        info = self._info(self._name(rel_path) + '/', stat.S_IFDIR | stat.S_IMODE(mode), mtime)
+        info.external_attr |= 0x10  # MS-DOS directory flag
+        info.compress_type = zipfile.ZIP_STORED
+        self.zip.writestr(info, b'')
+
+    def add_bytes(self, rel_path: str, data: bytes, mode: int, mtime: float):
+        self.zip.writestr(self._info(self._name(rel_path), stat.S_IFREG | stat.S_IMODE(mode), mtime), data)
+
+    def add_file(self, rel_path: str, src_path: str):
+        with open(src_path, 'rb') as src:
+            status = os.fstat(src.fileno())
+            info = self._info(self._name(rel_path), stat.S_IFREG | stat.S_IMODE(status.st_mode), status.st_mtime)
+            info.file_size = status.st_size
+            with self.zip.open(info, 'w', force_zip64=status.st_size > zipfile.ZIP64_LIMIT) as dst:
+                while True:
+                    chunk = src.read(1 << 20)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+    def close(self):
+        self.zip.close()
+
+def open_archive(fileobj: BinaryIO, fmt: str, root: str = '') -> ArchiveSink:
+    """A sink writing the given ARCHIVE_FORMATS format to fileobj"""
+    if fmt == 'zip':
+        return ZipSink(fileobj, root)
+    if fmt in ('tar', 'tar.gz', 'tar.zst'):
+        return TarSink(fileobj, fmt[len('tar.'):], root)
+    raise ValueError(f"Unknown archive format: {fmt}")
+
+def write_archive(overlay: AppOverlay, target: Union[str, BinaryIO], fmt: Optional[str] = None,
+                  root: str = '') -> int:
+    """
+    Stream an app into an archive at target (a path, or a binary file object
+    such as a socket stream). fmt defaults to the path's extension; members
+    are placed under root. Unchanged template files are copied from disk as
+    they are. Returns the number of files written.
+    """
+    if fmt is None:
+        if not isinstance(target, str):
+            raise ValueError("An archive format is needed when writing to a file object")
+        fmt = archive_format(target)
+    now = time.time()
+
+    def write(fileobj: BinaryIO) -> int:
+        with open_archive(fileobj, fmt, root) as sink:
+            for rel_dir in overlay.directories():
+                template_dir = os.path.join(overlay.template_root, rel_dir)
+                try:
+                    info = os.stat(template_dir)
+                    sink.add_directory(rel_dir, info.st_mode, info.st_mtime)
+                except OSError:
+                    sink.add_directory(rel_dir, 0o755, now)
+            paths = overlay.paths()
+            for rel_path in paths:
+                src_path = os.path.join(overlay.template_root, rel_path)
+                data = overlay.files.get(rel_path)
+                if data is None:
+                    sink.add_file(rel_path, src_path)
+                    continue
+                try:
+                    mode = os.stat(src_path).st_mode  # rewritten files keep the template's permissions
+                except OSError:
+                    mode = 0o644
+                sink.add_bytes(rel_path, data, mode, now)
+            return len(paths)
+
+    return write_target(target, write)
+
+def write_target(target: Union[str, BinaryIO], write: Callable[[BinaryIO], int]) -> int:
+    """
+    Run write(fileobj) on target: a binary file object as is, or a path, written
+    under a .partial name and renamed, so a failed run leaves no half-written
+    archive behind. Returns what write returned.
+    """
+    if not isinstance(target, str):
+        return write(target)
+    partial_path = target + '.partial'
+    try:
+        with open(partial_path, 'wb') as f:
+            count = write(f)
+        os.replace(partial_path, target)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+    return count
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Cache of whole generated apps.
+An app is fully determined by the template's contents and the business_info
+it's generated for, so a finished app is stored under a key hashed from both,
+and a later run for the same client against the same template restores it
+instead of copying and branding anything. The template is identified by the
+sha256 of its files (the generator's own scripts among them), so a fresh
+checkout of the same revision still hits.
+
+Apps are kept as trees of blobs in the shared object store (see
+object_store.py): the template's files are stored once for every client,
+and in hardlink mode the apps themselves share them. Entries are evicted
+least recently used first once the files they refer to are over the size limit.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from collections import Counter
+
+from replacements import ReplacementResult
+from branding_manifest import hash_bytes, hash_file
+from walker import TreeSnapshot, walk_tree
+from app_archive import AppOverlay, archive_format, open_archive, write_target
+from object_store import GC_GRACE_SECONDS, ObjectStore
+from template_copy import CopyResult
+from transaction import write_temp
+
+APP_CACHE_VERSION = 3
+
+# Default size limit of the cache (the files cached apps refer to, each counted once)
+DEFAULT_MAX_BYTES = 2 << 30
+
+# business_info fields the wizard makes up when the client doesn't give them
+# (listed in business_info['generatedFields']). They're left out of the key and
+# taken from the cached app on a hit, so regenerating a client gets the same values.
+GENERATED_FIELDS = ('firebaseProjectId',)
+
+def default_cache_dir() -> str:
+    """App cache directory in the user's cache directory ($XDG_CACHE_HOME or ~/.cache)"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'barber-wizard', 'apps')
+
+def _canonical_business_info(business_info: Dict[str, Any]) -> Dict[str, Any]:
+    """business_info as it determines the app: without made-up fields, with file contents for file paths"""
+    generated = set(business_info.get('generatedFields') or ()) & set(GENERATED_FIELDS)
+    canonical = {field: value for field, value in business_info.items()
+                 if field != 'generatedFields' and field not in generated}
+    if canonical.get('firebaseConfigPath'):
+        # The config is copied into the app; where it was read from isn't
+        canonical['firebaseConfigPath'] = hash_file(canonical['firebaseConfigPath'])
+    return canonical
+
+def _rel(rel_path: str) -> str:
+    return rel_path.replace(os.sep, '/')
+
+@dataclass
+class CachedApp:
+    """A finished app in the cache: its tree of blobs and what generating it reported"""
+    key: str
+    metadata: Dict[str, Any]
+    store: ObjectStore
+    # Contents written instead of some files' blobs, by '/'-separated path (set per restore)
+    overrides: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def files(self) -> int:
+        return self.metadata['files']
+
+    def blobs(self) -> Dict[str, int]:
+        """Blob id -> size of every file of the app"""
+        return {entry[1]: entry[2] for entry in self.metadata['tree']['files']}
+
+    def replacement_result(self) -> ReplacementResult:
+        """The replacement statistics of the run that generated the app"""
+        result = self.metadata['result']
+        return ReplacementResult(
+            files_touched=result['filesTouched'], total_replacements=result['totalReplacements'],
+            files_with_changes=list(result['filesWithChanges']), files_verified=list(result['filesVerified']),
+            legacy_findings={name: [tuple(match) for match in matches]
+                             for name, matches in result['legacyFindings'].items()},
+        )
+
+    def read(self, rel_path: str) -> Optional[bytes]:
+        """Contents of one of the app's files as cached, or None if it has no such file"""
+        for path, blob, _, _, _, _ in self.metadata['tree']['files']:
+            if path == _rel(rel_path):
+                return self.store.read(blob)
+        return None
+
+    def adopt_generated_fields(self, business_info: Dict[str, Any]):
+        """Give business_info the made-up values the cached app was generated with"""
+        business_info.update(self.metadata['generated'])
+
+    def restore(self, app_root: str, mode: str = 'copy') -> CopyResult:
+        """
+        Materialize the app into app_root (which must not exist) from the
+        store, mode as for copy_and_brand_template: unchanged template files are
+        hardlinked to their blobs, everything else is cloned or copied.
+        Times are those a fresh generation gives: unchanged template files
+        keep the template's, generated files and directories are new now.
+        A template file is only hardlinked where its blob has that time (and
+        permissions), so linked files look like copied ones. Files in
+        overrides are written with those contents instead.
+        """
+        tree = self.metadata['tree']
+        result = CopyResult()
+        os.makedirs(app_root)
+        for rel_dir, _, _ in tree['directories']:
+            os.makedirs(os.path.join(app_root, rel_dir), exist_ok=True)
+        for rel_path, blob, size, file_mode, mtime_ns, shared in tree['files']:
+            dst_path = os.path.join(app_root, rel_path)
+            if rel_path in self.overrides:
+                with open(dst_path, 'wb') as f:
+                    f.write(self.overrides[rel_path])
+                os.chmod(dst_path, file_mode)
+                result.add('copied', len(self.overrides[rel_path]))
+                continue
+            kind = self.store.materialize(blob, dst_path, mode if shared or mode == 'reflink' else 'copy',
+                                          mtime_ns if shared else None)
+            if kind != 'linked':
+                os.chmod(dst_path, file_mode)
+                if shared:
+                    os.utime(dst_path, ns=(mtime_ns, mtime_ns))
+                else:
+                    os.utime(dst_path)
+            result.add(kind, size)
+        for rel_dir, dir_mode, _ in tree['directories']:
+            os.chmod(os.path.join(app_root, rel_dir), dir_mode)
+        return result
+
+    def link_unchanged(self, app_root: str) -> int:
+        """
+        Replace the unchanged template files of the app just stored from
+        app_root with hardlinks to their blobs, as restore() in hardlink mode
+        would have made them (only blobs with the file's time and permissions);
+        returns how many were linked
+        """
+        linked = 0
+        for rel_path, blob, _, _, _, shared in self.metadata['tree']['files']:
+            if shared and self.store.link_into(blob, os.path.join(app_root, rel_path)):
+                linked += 1
+        return linked
+
+    def write_archive(self, target, fmt: Optional[str] = None, root: str = '') -> int:
+        """write_archive() for the cached app: its blobs are written into a new archive under root"""
+        if fmt is None:
+            if not isinstance(target, str):
+                raise ValueError("An archive format is needed when writing to a file object")
+            fmt = archive_format(target)
+        tree = self.metadata['tree']
+        # Times as write_archive() gives a fresh app: the template's, and now for generated files
+        now = time.time()
+
+        def write(fileobj: BinaryIO) -> int:
+            with open_archive(fileobj, fmt, root) as sink:
+                for rel_dir, dir_mode, mtime_ns in tree['directories']:
+                    sink.add_directory(rel_dir.replace('/', os.sep), dir_mode, mtime_ns / 1e9)
+                for rel_path, blob, _, file_mode, mtime_ns, shared in tree['files']:
+                    data = self.overrides[rel_path] if rel_path in self.overrides else self.store.read(blob)
+                    sink.add_bytes(rel_path.replace('/', os.sep), data, file_mode,
+                                   mtime_ns / 1e9 if shared else now)
+            return len(tree['files'])
+
+        return write_target(target, write)
+
+class AppCache:
+    """
+    The cache directory: <key>.json describes an app (its tree of blobs and
+    metadata). A hit bumps the file's mtime, which is what eviction goes by.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 store: Optional[ObjectStore] = None):
+        self.path = path or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.store = store or ObjectStore()
+        # sha256 by path of the template files template_hash() last saw, as [size, mtime_ns, sha256]
+        self.template_files: Dict[str, list] = {}
+
+    def _metadata_path(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.json')
+
+    def template_hash(self, template_root: str, snapshot: TreeSnapshot) -> str:
+        """
+        Content hash of a template (a walker TreeSnapshot of it). File hashes
+        are remembered by size and mtime, so an unchanged template isn't read.
+        """
+        template_root = os.path.abspath(template_root)
+        memo_path = os.path.join(self.path, 'templates',
+                                 hashlib.sha256(template_root.encode('utf-8')).hexdigest()[:16] + '.json')
+        try:
+            with open(memo_path, 'r', encoding='utf-8') as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+        if not isinstance(memo, dict):
+            memo = {}
+
+        hashes = {}
+        digest = hashlib.sha256(f'{APP_CACHE_VERSION}'.encode('utf-8'))
+        for rel_dir in snapshot.directories:
+            digest.update(f"\0d\0{rel_dir.replace(os.sep, '/')}".encode('utf-8'))
+        for rel_path in snapshot.paths():
+            info = snapshot.get(rel_path)
+            known = memo.get(rel_path)
+            if isinstance(known, list) and known[:2] == [info.size, info.mtime_ns]:
+                sha256 = known[2]
+            elif info.size < 0:
+                sha256 = ''  # e.g. dangling symlink: not copied either
+            else:
+                data = snapshot.cached_bytes(rel_path)
+                sha256 = hash_bytes(data) if data is not None else hash_file(os.path.join(template_root, rel_path))
+            hashes[rel_path] = [info.size, info.mtime_ns, sha256]
+            digest.update(f"\0f\0{rel_path.replace(os.sep, '/')}\0{sha256}".encode('utf-8'))
+
+        if hashes != memo:
+            os.makedirs(os.path.dirname(memo_path), exist_ok=True)
+            temp_path = write_temp(memo_path, json.dumps(hashes).encode('utf-8'))
+            os.replace(temp_path, memo_path)
+        self.template_files = hashes
+        return digest.hexdigest()
+
+    def key(self, template_hash: str, business_info: Dict[str, Any], in_memory: bool = False) -> str:
+        """
+        Cache key of an app generated from the template for business_info.
+        Apps generated in memory (for archives) have no .branding-manifest, so they're kept apart.
+        """
+        data = json.dumps({'version': APP_CACHE_VERSION, 'template': template_hash,
+                           'businessInfo': _canonical_business_info(business_info), 'inMemory': in_memory},
+                          sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()[:32]
+
+    def get(self, key: str, touch: bool = True) -> Optional[CachedApp]:
+        """The cached app for key (unless touch is False, marked as just used), or None"""
+        metadata_path = self._metadata_path(key)
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            if metadata.get('version') != APP_CACHE_VERSION:
+                return None
+            if touch:
+                os.utime(metadata_path)
+        except (OSError, ValueError):
+            return None
+        return CachedApp(key, metadata, self.store)
+
+    def _known_sha256(self, rel_path: str, info: os.stat_result) -> Optional[str]:
+        """
+        The template file's hash, if the file at rel_path is that file
+        unchanged (same size and mtime: copies keep the template's times)
+        """
+        known = self.template_files.get(rel_path)
+        if known and known[:2] == [info.st_size, info.st_mtime_ns] and known[2]:
+            return known[2]
+        return None
+
+    def _store(self, key: str, tree: Dict[str, list], business_info: Dict[str, Any],
+               result: ReplacementResult) -> Optional[CachedApp]:
+        app_bytes = sum({entry[1]: entry[2] for entry in tree['files']}.values())
+        if app_bytes > self.max_bytes:
+            return None  # its blobs are left for gc
+        metadata = {
+            'version': APP_CACHE_VERSION, 'key': key,
+            'businessName': business_info.get('businessName'), 'bundleId': business_info.get('bundleId'),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'files': len(tree['files']), 'bytes': app_bytes,
+            'generated': {field: business_info[field] for field in business_info.get('generatedFields') or ()
+                          if field in business_info},
+            'result': {
+                'filesTouched': result.files_touched, 'totalReplacements': result.total_replacements,
+                'filesWithChanges': result.files_with_changes, 'filesVerified': result.files_verified,
+                'legacyFindings': result.legacy_findings,
+            },
+            'tree': tree,
+        }
+        # The blobs are all stored before the metadata that makes them an entry exists
+        os.makedirs(self.path, exist_ok=True)
+        metadata_path = self._metadata_path(key)
+        temp_path = write_temp(metadata_path, json.dumps(metadata, ensure_ascii=False).encode('utf-8'))
+        os.replace(temp_path, metadata_path)
+        self.evict()
+        return CachedApp(key, metadata, self.store)
+
+    def store_directory(self, key: str, app_root: str, business_info: Dict[str, Any],
+                        result: ReplacementResult) -> Optional[CachedApp]:
+        """Store the app generated into app_root; None if it's over the size limit by itself"""
+        snapshot = walk_tree(app_root)
+        directories = []
+        for rel_dir in snapshot.directories:
+            info = os.stat(os.path.join(app_root, rel_dir))
+            directories.append([_rel(rel_dir), info.st_mode & 0o7777, info.st_mtime_ns])
+        files = []
+        for rel_path in snapshot.files:
+            path = os.path.join(app_root, rel_path)
+            info = os.stat(path)
+            sha256 = self._known_sha256(rel_path, info)
+            blob = self.store.add_file(path, sha256)
+            files.append([_rel(rel_path), blob, info.st_size, info.st_mode & 0o7777, info.st_mtime_ns,
+                          sha256 is not None])
+        return self._store(key, {'directories': directories, 'files': files}, business_info, result)
+
+    def store_overlay(self, key: str, overlay: AppOverlay, business_info: Dict[str, Any],
+                      result: ReplacementResult) -> Optional[CachedApp]:
+        """Store an app generated in memory: template files from disk, changed files from memory"""
+        now_ns = time.time_ns()
+        directories = []
+        for rel_dir in overlay.directories():
+            try:
+                info = os.stat(os.path.join(overlay.template_root, rel_dir))
+                directories.append([_rel(rel_dir), info.st_mode & 0o7777, info.st_mtime_ns])
+            except OSError:
+                directories.append([_rel(rel_dir), 0o755, now_ns])
+        files = []
+        for rel_path in overlay.paths():
+            src_path = os.path.join(overlay.template_root, rel_path)
+            data = overlay.files.get(rel_path)
+            try:
+                info = os.stat(src_path)
+            except OSError:
+                info = None
+            if data is None:
+                if info is None:
+                    continue  # e.g. dangling symlink: not archived either
+                blob = self.store.add_file(src_path, self._known_sha256(rel_path, info))
+                files.append([_rel(rel_path), blob, info.st_size, info.st_mode & 0o7777, info.st_mtime_ns, True])
+            else:
+                # Rewritten files keep the template's permissions, as in write_archive()
+                file_mode = info.st_mode & 0o7777 if info is not None else 0o644
+                blob = self.store.add_bytes(data, file_mode)
+                files.append([_rel(rel_path), blob, len(data), file_mode, now_ns, False])
+        return self._store(key, {'directories': directories, 'files': files}, business_info, result)
+
+    def remove(self, key: str):
+        """Drop an entry; its blobs go with the next gc() unless other entries refer to them"""
+        # A version 1 entry's app was a tar next to it
+        for path in (self._metadata_path(key), os.path.join(self.path, f'{key}.tar')):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """(key, bytes of its files, last used) of every entry, least recently used first"""
+        entries = []
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        for name in names:
+            key, extension = os.path.splitext(name)
+            if extension != '.json':
+                continue
+            try:
+                used = os.stat(self._metadata_path(key)).st_mtime
+            except OSError:
+                continue  # removed meanwhile
+            cached = self.get(key, touch=False)
+            if cached is None:
+                self.remove(key)  # left by another version of the cache
+                continue
+            entries.append((key, cached.metadata['bytes'], used))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self) -> int:
+        """
+        Remove least recently used entries, and the blobs only they referred
+        to, until the files the rest refer to fit max_bytes (the newest entry
+        is always kept), then gc(); returns how many.
+        """
+        entries = self.entries()
+        blobs = {}
+        references = Counter()
+        for key, _, _ in entries:
+            cached = self.get(key, touch=False)
+            blobs[key] = cached.blobs() if cached is not None else {}
+            references.update(blobs[key].keys())
+        sizes = {blob: size for entry_blobs in blobs.values() for blob, size in entry_blobs.items()}
+        total = sum(sizes.values())
+        evicted = 0
+        for key, _, _ in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            for blob in blobs[key]:
+                references[blob] -= 1
+                if references[blob] == 0:
+                    total -= sizes[blob]
+                    self.store.remove(blob)
+            evicted += 1
+        self.gc()
+        return evicted
+
+    def gc(self, grace: float = GC_GRACE_SECONDS) -> Tuple[int, int]:
+        """Remove the blobs no entry refers to from the store; returns (files, bytes) removed"""
+        referenced = set()
+        for key, _, _ in self.entries():
+            cached = self.get(key, touch=False)
+            if cached is not None:
+                referenced.update(cached.blobs())
+        return self.store.gc(referenced, grace)
+
+    def clear(self) -> int:
+        entries = self.entries()
+        for key, _, _ in entries:
+            self.remove(key)
+        self.store.gc(set(), grace=0)
+        shutil.rmtree(os.path.join(self.path, 'templates'), ignore_errors=True)
+        return len(entries)
+
+def main():
+    """Show, clean up or clear the app cache"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generated app cache')
+    parser.add_argument('--clear', action='store_true', help='Remove every cached app')
+    parser.add_argument('--gc', action='store_true',
+                        help='Remove files no cached app refers to from the object store')
+    args = parser.parse_args()
+
+    cache = AppCache()
+    if args.clear:
+        print(f"🗑️  Removed {cache.clear()} cached apps from {cache.path}")
+        return 0
+    if args.gc:
+        files, freed = cache.gc()
+        print(f"🧹 Removed {files} unreferenced files ({freed / (1 << 20):.1f} MB) from {cache.store.path}")
+        return 0
+    entries = cache.entries()
+    print(f"📦 {cache.path}: {len(entries)} apps, {sum(size for _, size, _ in entries) / (1 << 20):.1f} MB "
+          f"of files in {cache.store.size() / (1 << 20):.1f} MB of objects")
+    for key, size, used in reversed(entries):
+        cached = cache.get(key, touch=False)
+        if cached is None:
+            continue
+        print(f"  {key}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  {size / (1 << 20):6.1f} MB  "
+              f"{cached.metadata.get('bundleId')} ({cached.metadata.get('businessName')})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Content-hash manifest for incremental re-branding.
+Records which replacement table each file was last processed with, so later
+runs only revisit files that changed or whose rule set changed.
+"""
+
+import os
+import json
+import hashlib
+from typing import Dict, Optional
+from dataclasses import dataclass, asdict
+
+MANIFEST_FILENAME = '.branding-manifest'
+MANIFEST_VERSION = 1
+
+@dataclass
+class ManifestEntry:
+    """Fingerprint of a file as it was left by the last branding run"""
+    size: int
+    mtime_ns: int
+    sha256: str
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def fingerprint_file(path: str, sha256: Optional[str] = None) -> ManifestEntry:
+    """Stat (and hash, unless the digest is already known) a file"""
+    stat = os.stat(path)
+    return ManifestEntry(stat.st_size, stat.st_mtime_ns, sha256 or hash_file(path))
+
+class BrandingManifest:
+    """Per-app record of file fingerprints and the rules hash they were processed with"""
+
+    def __init__(self, root: str, rules_hash: Optional[str] = None,
+                 entries: Optional[Dict[str, ManifestEntry]] = None):
+        self.root = root
+        self.rules_hash = rules_hash
+        self.entries = entries or {}
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, MANIFEST_FILENAME)
+
+    @classmethod
+    def load(cls, root: str) -> 'BrandingManifest':
+        """Load the manifest from root; a missing or unreadable manifest is empty"""
+        manifest = cls(root)
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                return manifest
+            manifest.rules_hash = data.get('rulesHash')
+            manifest.entries = {
+                rel_path: ManifestEntry(**entry) for rel_path, entry in data.get('files', {}).items()
+            }
+        except (OSError, ValueError, TypeError):
+            pass
+        return manifest
+
+    def is_current(self, rel_path: str, rules_hash: str, stat=None) -> bool:
+        """
+        True if the file is unchanged since it was processed with the same rules.
+        Size and mtime are checked first; the content hash only when they differ.
+        stat: Known size/mtime_ns of the file (e.g. a walker FileInfo), saves an os.stat
+        """
+        if rules_hash != self.rules_hash:
+            return False
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            return False
+        if stat is not None:
+            size, mtime_ns = stat.size, stat.mtime_ns
+        else:
+            try:
+                stat = os.stat(os.path.join(self.root, rel_path))
+            except OSError:
+                return False
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        if size != entry.size:
+            return False
+        if mtime_ns == entry.mtime_ns:
+            return True
+        # Touched but maybe not modified (e.g. checkout, copy)
+        if hash_file(os.path.join(self.root, rel_path)) != entry.sha256:
+            return False
+        entry.mtime_ns = mtime_ns
+        return True
+
+    def record(self, rel_path: str, entry: ManifestEntry):
+        self.entries[rel_path] = entry
+
+    def prune(self, rel_paths):
+        """Drop entries for files that are no longer part of the tree"""
+        keep = set(rel_paths)
+        self.entries = {path: entry for path, entry in self.entries.items() if path in keep}
+
+    def save(self, rules_hash: str):
+        self.rules_hash = rules_hash
+        data = {
+            'version': MANIFEST_VERSION,
+            'rulesHash': rules_hash,
+            'files': {path: asdict(entry) for path, entry in sorted(self.entries.items())},
+        }
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
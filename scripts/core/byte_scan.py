@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Bytes-level pre-scan for large files.
+Translates text patterns into bytes patterns that match (at least) the UTF-8
+encoding of every match, so files can be checked through an mmap and only
+decoded when they can actually match.
+"""
+
+import os
+import re
+import mmap
+import codecs
+import contextlib
+from typing import Iterator, List, Optional, Set, Union
+
+# Regex parse trees, for the modules that derive prefilters from patterns:
+# re._parser since Python 3.11, the (now deprecated) sre_parse module before
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Files at least this big are mapped instead of read
+MMAP_THRESHOLD = 256 * 1024
+
+# Any multi-byte UTF-8 character
+_MULTIBYTE = rb'[\xc0-\xff][\x80-\xbf]*'
+
+# Non-ASCII characters that IGNORECASE matches against ASCII letters
+_FOLD_EXTRAS = {'i': ('\u0130', '\u0131'), 'k': ('\u212a',), 's': ('\u017f',)}
+
+_CATEGORIES = {
+    sre_parse.CATEGORY_DIGIT: (rb'0-9', True),
+    sre_parse.CATEGORY_SPACE: (rb' \t\n\r\f\v\x1c-\x1f', True),
+    sre_parse.CATEGORY_WORD: (rb'a-zA-Z0-9_', True),
+}
+
+class _Unsupported(Exception):
+    pass
+
+def _escape_byte(byte: int) -> bytes:
+    return b'\\x%02x' % byte
+
+def _folded(char: str, ignore_case: bool) -> List[str]:
+    """Non-ASCII characters an ASCII char also matches under IGNORECASE"""
+    return list(_FOLD_EXTRAS.get(char.lower(), ())) if ignore_case else []
+
+def _translate_char(char: str, ignore_case: bool, universal_newlines: bool) -> bytes:
+    if char == '\n' and universal_newlines:
+        return rb'(?:\r\n?|\n)'
+    if char.isascii():
+        extras = _folded(char, ignore_case)
+        literal = re.escape(char.encode('ascii'))
+        if not extras:
+            return literal
+        return b'(?:' + b'|'.join([literal] + [re.escape(c.encode('utf-8')) for c in extras]) + b')'
+    if ignore_case and char.lower() != char.upper():
+        raise _Unsupported(char)  # non-ASCII case folding isn't reproduced in bytes
+    return b'(?:' + re.escape(char.encode('utf-8')) + b')'
+
+def _translate_class(items, ignore_case: bool, universal_newlines: bool, negate: bool = False) -> bytes:
+    ascii_members = []
+    extras = []
+    multibyte = False
+    matches_newline = False
+    for op, av in items:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL:
+            char = chr(av)
+            if char.isascii():
+                ascii_members.append(_escape_byte(av))
+                extras += _folded(char, ignore_case)
+                matches_newline |= char == '\n'
+            else:
+                if ignore_case and char.lower() != char.upper():
+                    raise _Unsupported(char)
+                extras.append(char)
+        elif op is sre_parse.RANGE:
+            low, high = av
+            if low < 0x80:
+                ascii_members.append(_escape_byte(low) + b'-' + _escape_byte(min(high, 0x7f)))
+                matches_newline |= low <= 0x0a <= high
+                for char in _FOLD_EXTRAS:
+                    if ignore_case and (low <= ord(char) <= high or low <= ord(char.upper()) <= high):
+                        extras += _FOLD_EXTRAS[char]
+            if high >= 0x80:
+                multibyte = True
+        elif op is sre_parse.CATEGORY and av in _CATEGORIES:
+            members, unicode_too = _CATEGORIES[av]
+            ascii_members.append(members)
+            multibyte |= unicode_too
+            matches_newline |= av is sre_parse.CATEGORY_SPACE
+        else:
+            raise _Unsupported(op)
+
+    if negate:
+        # Excluded non-ASCII characters are still allowed: a superset is enough
+        members = b''.join(ascii_members)
+        alternatives = [b'[^' + members + rb'\x80-\xff]' if members else rb'[\x00-\x7f]', _MULTIBYTE]
+        return b'(?:' + b'|'.join(alternatives) + b')'
+
+    alternatives = []
+    if matches_newline and universal_newlines:
+        alternatives.append(rb'\r\n')
+        ascii_members.append(rb'\r')
+    if ascii_members:
+        alternatives.append(b'[' + b''.join(ascii_members) + b']')
+    alternatives += [re.escape(char.encode('utf-8')) for char in extras]
+    if multibyte:
+        alternatives.append(_MULTIBYTE)
+    if not alternatives:
+        raise _Unsupported(items)
+    return b'(?:' + b'|'.join(alternatives) + b')'
+
+def _translate(parsed, ignore_case: bool, universal_newlines: bool) -> bytes:
+    out = []
+    for op, av in parsed:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue  # dropping zero-width conditions only widens the match set
+        if op is sre_parse.LITERAL:
+            out.append(_translate_char(chr(av), ignore_case, universal_newlines))
+        elif op is sre_parse.NOT_LITERAL:
+            out.append(_translate_class([(sre_parse.LITERAL, av)], ignore_case, universal_newlines, negate=True))
+        elif op is sre_parse.IN:
+            out.append(_translate_class(av, ignore_case, universal_newlines))
+        elif op is sre_parse.ANY:
+            out.append(b'(?:' + rb'[^\n\x80-\xff]|' + _MULTIBYTE + b')')
+        elif op is sre_parse.SUBPATTERN:
+            if av[1] or av[2]:
+                raise _Unsupported(op)  # inline flags
+            out.append(b'(?:' + _translate(av[-1], ignore_case, universal_newlines) + b')')
+        elif op is sre_parse.BRANCH:
+            out.append(b'(?:' + b'|'.join(_translate(branch, ignore_case, universal_newlines) for branch in av[1]) + b')')
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            low, high, item = av
+            bound = b'' if high == sre_parse.MAXREPEAT else b'%d' % high
+            out.append(b'(?:' + _translate(item, ignore_case, universal_newlines) + b'){%d,%s}' % (low, bound))
+        else:
+            raise _Unsupported(op)
+    return b''.join(out)
+
+def first_chars(parsed) -> Optional[Set[str]]:
+    """Characters a parsed pattern can start with, or None if it can't be determined"""
+    for op, av in parsed:
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            continue  # zero-width (\b, ^, lookarounds, ...)
+        if op is sre_parse.LITERAL:
+            return {chr(av)}
+        if op is sre_parse.IN:
+            chars = set()
+            for item_op, item_av in av:
+                if item_op is sre_parse.LITERAL:
+                    chars.add(chr(item_av))
+                elif item_op is sre_parse.RANGE and item_av[1] - item_av[0] < 256:
+                    chars.update(chr(c) for c in range(item_av[0], item_av[1] + 1))
+                else:
+                    return None
+            return chars
+        if op is sre_parse.SUBPATTERN:
+            return first_chars(av[-1])
+        if op is sre_parse.BRANCH:
+            chars = set()
+            for branch in av[1]:
+                branch_chars = first_chars(branch)
+                if branch_chars is None:
+                    return None
+                chars |= branch_chars
+            return chars
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] > 0:
+            return first_chars(av[2])
+        return None
+    return None
+
+def to_bytes_pattern(pattern: str, flags: int = 0, universal_newlines: bool = False) -> Optional[bytes]:
+    """
+    Bytes regex source matching the UTF-8 encoding of every match of pattern
+    (and possibly more), or None if the pattern can't be translated.
+    With universal_newlines, '\\n' in the text may be '\\r\\n' or '\\r' in the bytes.
+    """
+    try:
+        return _translate(sre_parse.parse(pattern, flags), bool(flags & re.IGNORECASE), universal_newlines)
+    except (_Unsupported, re.error):
+        return None
+
+def compile_bytes_superset(patterns: List[str], flags: int = 0,
+                           universal_newlines: bool = False) -> Optional[re.Pattern]:
+    """One bytes regex that finds a hit wherever any of the patterns can match, or None"""
+    translated = [to_bytes_pattern(pattern, flags, universal_newlines) for pattern in patterns]
+    if not translated or None in translated:
+        return None
+    source = b'|'.join(b'(?:' + source + b')' for source in translated)
+    # Lead-byte lookahead, as for the text engines
+    lead = first_chars(sre_parse.parse(source, flags & re.IGNORECASE))
+    if lead:
+        source = b'(?=[' + b''.join(_escape_byte(ord(c)) for c in sorted(lead)) + b'])(?:' + source + b')'
+    return re.compile(source, flags & re.IGNORECASE)
+
+def is_valid_utf8(buffer: Union[bytes, mmap.mmap], chunk_size: int = 1 << 20) -> bool:
+    """
+    True if buffer is valid UTF-8. Checked in chunks so large mapped files are
+    never materialized; invalid bytes would be dropped by an errors='ignore'
+    decode and could join text into a match the bytes scan can't see.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for start in range(0, len(buffer), chunk_size):
+            chunk = buffer[start:start + chunk_size]
+            if not chunk.isascii():
+                decoder.decode(chunk)
+            else:
+                decoder.decode(b'', final=True)  # an ASCII byte can't continue a sequence
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+@contextlib.contextmanager
+def open_buffer(path: str) -> Iterator[Union[bytes, mmap.mmap]]:
+    """File contents as bytes, or as a read-only mmap for files of MMAP_THRESHOLD or more"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Per-app state for the generation steps.
+Every step reads and writes through the context's root instead of the
+process working directory, so several apps can be generated at once.
+With an overlay, the app lives in memory on top of the template instead.
+"""
+
+import os
+import io
+import re
+import json
+import contextlib
+from typing import Any, ContextManager, Dict, List, Optional, Set
+from dataclasses import dataclass, field
+
+from replacements import ReplacementResult
+from profiler import Profiler
+from json_edit import JsonDocument
+from app_archive import AppOverlay
+from app_cache import CachedApp
+
+@dataclass
+class GenerationContext:
+    """The app being generated: where it lives and who it's for"""
+    root: str
+    business_info: Dict[str, Any]
+    dry_run: bool = False
+    jobs: int = 1
+    replacement_result: Optional[ReplacementResult] = None
+    # Files held back from the copy-time replacement pass, branded after the config steps
+    deferred_paths: Optional[List[str]] = None
+    # Set to collect per-step timings and counters (--profile)
+    profiler: Optional[Profiler] = None
+    # Whether the replacement passes collect per-pattern statistics (for the profile or rule stats)
+    pattern_stats: bool = False
+    # Whether the replacement passes check what they write for legacy content
+    check_legacy: bool = False
+    # JSON files the steps are editing, parsed once and written once (see json_document)
+    documents: Dict[str, JsonDocument] = field(default_factory=dict)
+    # Set when the app is generated in memory (written to an archive, never to root)
+    overlay: Optional[AppOverlay] = None
+    # Files written by the steps and not verified by a replacement pass since
+    # ('/'-separated); only these need a separate legacy content check
+    unverified_paths: Set[str] = field(default_factory=set)
+    # Set when the app was restored from the app cache instead of generated
+    cached_app: Optional[CachedApp] = None
+
+    def path(self, rel_path: str) -> str:
+        """Absolute path of a '/'-separated path inside the app"""
+        return os.path.join(self.root, *rel_path.split('/'))
+
+    def stage(self, name: str) -> ContextManager:
+        """Time the enclosed block as a generation step when profiling"""
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(name)
+
+    def count(self, counter: str, amount: float = 1):
+        if self.profiler is not None:
+            self.profiler.count(counter, amount)
+
+    def _count_io(self, kind: str, content: str):
+        if self.profiler is not None:
+            self.profiler.count(f'files_{kind}')
+            self.profiler.count(f'bytes_{kind}', len(content.encode('utf-8', errors='replace')))
+
+    def exists(self, rel_path: str) -> bool:
+        if self.overlay is not None:
+            return self.overlay.exists(rel_path)
+        return os.path.exists(self.path(rel_path))
+
+    def sub(self, pattern: str, replacement: str, content: str) -> str:
+        """re.sub that counts its matches for the profile"""
+        content, matches = re.subn(pattern, replacement, content)
+        self.count('regex_matches', matches)
+        return content
+
+    def read_bytes(self, rel_path: str) -> bytes:
+        if self.overlay is not None:
+            return self.overlay.read_bytes(rel_path)
+        with open(self.path(rel_path), 'rb') as f:
+            return f.read()
+
+    def read_text(self, rel_path: str, encoding: Optional[str] = None) -> str:
+        if self.overlay is not None:
+            # Same result as text mode: universal newlines
+            data = self.overlay.read_bytes(rel_path)
+            content = io.TextIOWrapper(io.BytesIO(data), encoding=encoding).read()
+        else:
+            with open(self.path(rel_path), 'r', encoding=encoding) as f:
+                content = f.read()
+        self._count_io('read', content)
+        return content
+
+    def write_text(self, rel_path: str, content: str, encoding: Optional[str] = None):
+        """Write a file inside the app, creating its directory if needed"""
+        if self.overlay is not None:
+            buffer = io.BytesIO()
+            with io.TextIOWrapper(buffer, encoding=encoding, write_through=True) as f:
+                f.write(content)
+                self.overlay.write_bytes(rel_path, buffer.getvalue())
+        else:
+            full_path = self.path(rel_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w', encoding=encoding) as f:
+                f.write(content)
+        self.unverified_paths.add(rel_path)
+        self._count_io('written', content)
+
+    def read_json(self, rel_path: str) -> Any:
+        return json.loads(self.read_text(rel_path))
+
+    def write_json(self, rel_path: str, data: Any, encoding: Optional[str] = None, **kwargs):
+        self.write_text(rel_path, json.dumps(data, indent=2, **kwargs), encoding=encoding)
+
+    def json_document(self, rel_path: str) -> JsonDocument:
+        """
+        A JSON file parsed for formatting-preserving edits. Every step gets the
+        same document until it's written by flush_documents() or take_documents().
+        """
+        document = self.documents.get(rel_path)
+        if document is None:
+            document = self.documents[rel_path] = JsonDocument(self.read_text(rel_path, encoding='utf-8'))
+        return document
+
+    def take_documents(self, rel_paths: List[str]) -> Dict[str, bytes]:
+        """Hand the edited documents among rel_paths to a pass that writes them itself"""
+        taken = {}
+        for rel_path in rel_paths:
+            document = self.documents.pop(rel_path, None)
+            if document is not None and document.modified:
+                taken[rel_path] = document.render().encode('utf-8')
+        return taken
+
+    def flush_documents(self):
+        """Write every edited document"""
+        for rel_path, document in self.documents.items():
+            if document.modified:
+                self.write_text(rel_path, document.render(), encoding='utf-8')
+        self.documents = {}
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Formatting-preserving edits of JSON config files.
+A JsonDocument parses the text once, remembering where every value sits;
+key-path edits are then spliced into the original text, so indentation,
+key order, escapes and everything not edited stay byte-for-byte the same.
+"""
+
+import re
+import json
+from json.decoder import scanstring
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+Path = Tuple[Any, ...]
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+@dataclass
+class _Node:
+    """Where a value sits in the text; containers also record where members can be added"""
+    start: int
+    end: int
+    kind: str
+    close: int = -1              # position of the closing bracket
+    last_end: int = -1           # end of the last member's value (-1 if empty)
+    member_indent: Optional[str] = None  # leading whitespace of members on their own lines
+
+def _fail(message: str, text: str, pos: int):
+    raise json.JSONDecodeError(message, text, pos)
+
+def _skip(text: str, pos: int) -> int:
+    return _WHITESPACE.match(text, pos).end()
+
+def _line_indent(text: str, pos: int) -> Optional[str]:
+    """Whitespace between the start of pos's line and pos, or None if pos isn't first on it"""
+    line_start = text.rfind('\n', 0, pos) + 1
+    prefix = text[line_start:pos]
+    return prefix if not prefix.strip() and line_start > 0 else None
+
+def _parse_value(text: str, pos: int, path: Path, index: Dict[Path, _Node]) -> Tuple[Any, int]:
+    pos = _skip(text, pos)
+    if pos >= len(text):
+        _fail("Expecting value", text, pos)
+    start = pos
+    char = text[pos]
+
+    if char in '{[':
+        is_object = char == '{'
+        closing = '}' if is_object else ']'
+        value: Any = {} if is_object else []
+        node = _Node(start, -1, 'object' if is_object else 'array')
+        pos = _skip(text, pos + 1)
+        if text.startswith(closing, pos):
+            node.close = pos
+        else:
+            node.member_indent = _line_indent(text, pos)
+            while True:
+                pos = _skip(text, pos)
+                if is_object:
+                    if not text.startswith('"', pos):
+                        _fail("Expecting property name enclosed in double quotes", text, pos)
+                    key, pos = scanstring(text, pos + 1)
+                    pos = _skip(text, pos)
+                    if not text.startswith(':', pos):
+                        _fail("Expecting ':' delimiter", text, pos)
+                    member, pos = _parse_value(text, pos + 1, path + (key,), index)
+                    value[key] = member
+                else:
+                    member, pos = _parse_value(text, pos, path + (len(value),), index)
+                    value.append(member)
+                node.last_end = pos
+                pos = _skip(text, pos)
+                if text.startswith(',', pos):
+                    pos += 1
+                elif text.startswith(closing, pos):
+                    node.close = pos
+                    break
+                else:
+                    _fail("Expecting ',' delimiter", text, pos)
+        node.end = node.close + 1
+        index[path] = node
+        return value, node.end
+
+    if char == '"':
+        value, pos = scanstring(text, pos + 1)
+        kind = 'string'
+    else:
+        number = _NUMBER.match(text, pos)
+        word = next((word for word in _CONSTANTS if text.startswith(word, pos)), None)
+        if number:
+            literal = number.group()
+            value = float(literal) if any(c in literal for c in '.eE') else int(literal)
+            pos = number.end()
+        elif word:
+            value = _CONSTANTS[word]
+            pos += len(word)
+        else:
+            _fail("Expecting value", text, pos)
+        kind = 'literal'
+    index[path] = _Node(start, pos, kind)
+    return value, pos
+
+class JsonDocument:
+    """
+    A parsed JSON text whose edits keep the original formatting.
+
+    Usage:
+        doc = JsonDocument(text)
+        doc.set(('expo', 'ios', 'bundleIdentifier'), 'com.example.app')
+        new_text = doc.render()
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._index: Dict[Path, _Node] = {}
+        self.data, end = _parse_value(text, 0, (), self._index)
+        if _skip(text, end) != len(text):
+            _fail("Extra data", text, _skip(text, end))
+        self._edits: Dict[Path, Any] = {}
+        self.indent_unit = self._detect_indent_unit()
+
+    def _detect_indent_unit(self) -> Optional[str]:
+        """The smallest member indentation; None for a document written on one line"""
+        indents = [node.member_indent for node in self._index.values() if node.member_indent]
+        return min(indents, key=len) if indents else None
+
+    @property
+    def modified(self) -> bool:
+        return bool(self._edits)
+
+    def get(self, path: Path, default: Any = None) -> Any:
+        value = self.data
+        for key in path:
+            try:
+                value = value[key]
+            except (KeyError, IndexError, TypeError):
+                return default
+        return value
+
+    def set(self, path: Path, value: Any):
+        """Set the value at path, creating missing objects along the way"""
+        path = tuple(path)
+        if not path:
+            raise ValueError("Can't replace the document root")
+        parent = self.data
+        for key in path[:-1]:
+            if isinstance(parent, dict):
+                parent = parent.setdefault(key, {})
+            elif isinstance(parent, list) and isinstance(key, int) and key < len(parent):
+                parent = parent[key]
+            else:
+                raise ValueError(f"Can't set {'/'.join(map(str, path))}: {key!r} is not an object member")
+        if not isinstance(parent, (dict, list)):
+            raise ValueError(f"Can't set {'/'.join(map(str, path))}: parent is not a container")
+        if isinstance(parent, list) and not (isinstance(path[-1], int) and path[-1] < len(parent)):
+            raise ValueError(f"Can't set {'/'.join(map(str, path))}: index out of range")
+        parent[path[-1]] = value
+        self._edits[path] = value
+
+    def _format(self, value: Any, base_indent: str) -> str:
+        if not isinstance(value, (dict, list)) or not value or self.indent_unit is None:
+            return json.dumps(value, ensure_ascii=False)
+        text = json.dumps(value, indent=self.indent_unit, ensure_ascii=False)
+        return text.replace('\n', '\n' + base_indent)
+
+    def _base_indent(self, pos: int) -> str:
+        line_start = self.text.rfind('\n', 0, pos) + 1
+        line = self.text[line_start:pos]
+        return line[:len(line) - len(line.lstrip())]
+
+    def render(self) -> str:
+        """The original text with every edit spliced in"""
+        if not self._edits:
+            return self.text
+
+        # Existing values are replaced in place; missing members are grouped under
+        # their deepest existing object and added there in one insertion each
+        replacements: Dict[Path, Any] = {}
+        insertions: Dict[Path, Dict[str, Any]] = {}
+        for path in sorted(self._edits, key=len):
+            if any(path[:i] in replacements for i in range(1, len(path))):
+                continue  # inside a value that is replaced as a whole
+            if path in self._index:
+                replacements[path] = self.get(path)
+                continue
+            depth = len(path) - 1
+            while path[:depth] not in self._index:
+                depth -= 1
+            parent = path[:depth]
+            if self._index[parent].kind != 'object':
+                raise ValueError(f"Can't add {'/'.join(map(str, path))} to a non-object")
+            insertions.setdefault(parent, {})[path[depth]] = self.get(path[:depth + 1])
+
+        splices: List[Tuple[int, int, str]] = []
+        for path, value in replacements.items():
+            node = self._index[path]
+            splices.append((node.start, node.end, self._format(value, self._base_indent(node.start))))
+        for path, members in insertions.items():
+            node = self._index[path]
+            if any(path[:i] in replacements for i in range(1, len(path) + 1)):
+                continue
+            if node.last_end == -1:
+                # Empty object: write it out whole
+                merged = dict(self.get(path))
+                splices.append((node.start, node.end, self._format(merged, self._base_indent(node.start))))
+                continue
+            if node.member_indent is not None:
+                separator, member_indent = '\n' + node.member_indent, node.member_indent
+            else:
+                separator, member_indent = ' ', self._base_indent(node.start)
+            added = ''.join(
+                f",{separator}{json.dumps(key, ensure_ascii=False)}: {self._format(value, member_indent)}"
+                for key, value in members.items()
+            )
+            splices.append((node.last_end, node.last_end, added))
+
+        text = self.text
+        for start, end, new_text in sorted(splices, key=lambda splice: (splice[0], splice[1]), reverse=True):
+            text = text[:start] + new_text + text[end:]
+        return text
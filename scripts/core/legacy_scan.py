@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Single-pass scanner for legacy brand strings and hardcoded content.
+Used by postgen_check to verify generated apps, and by the replacement
+engine to verify the files it writes (see replacements.brand_content's check_legacy).
+"""
+
+import re
+import bisect
+from typing import Dict, List, Tuple
+
+from byte_scan import compile_bytes_superset, first_chars, is_valid_utf8, open_buffer, sre_parse
+
+# Legacy brand strings and hardcoded content, by report name
+LEGACY_PATTERNS = {
+    'barbersbar_brand': r'\b[Bb]arbersbar\b',
+    'barber_shop_generic': r'\bBarber Shop\b',
+    'hebrew_brand': r'ברבר בר',
+    'old_emails': r'barbersbar\.co(?:\.il|m)',
+    'israeli_phone_054': r'054[-\s]?835[-\s]?3232',
+    'israeli_phone_052': r'052[-\s]?398[-\s]?5505',
+    'non_e164_phones': r'(?<!\+972)\b0[5-9]\d{8}\b',  # Israeli phones not in E.164
+    'old_addresses': r'רפיח ים \d+|נתיבות נווה שרון',
+    'old_bundle_id': r'com\.barbersbar\.app'
+}
+
+class LegacyScanner:
+    """
+    Finds legacy pattern matches line by line, with the same results as running
+    every pattern over every line, but with one regex scan per file.
+
+    The combined alternation flags every line a match touches; only those lines
+    are then checked pattern by pattern. Any per-line match also matches at the
+    same offset of the whole buffer, so no matching line can go unflagged.
+    """
+
+    def __init__(self, patterns: Dict[str, str] = None):
+        if patterns is None:
+            patterns = LEGACY_PATTERNS
+        self.patterns = [(name, re.compile(pattern)) for name, pattern in patterns.items()]
+        alternation = '|'.join(f'(?:{pattern})' for pattern in patterns.values())
+        # Same first-character lookahead as the replacement engine
+        lead = first_chars(sre_parse.parse(alternation))
+        if lead:
+            guard = ''.join(re.escape(c) for c in sorted(lead))
+            alternation = f'(?=[{guard}])(?:{alternation})'
+        self.regex = re.compile(alternation)
+        # Bytes version for rejecting files without decoding them
+        self.byte_regex = compile_bytes_superset(list(patterns.values()), universal_newlines=True)
+
+    def scan_file(self, path: str) -> List[Tuple[str, int, str]]:
+        """
+        scan() a file as text mode would read it (UTF-8, errors ignored, universal
+        newlines). Large files are mapped, and files the bytes patterns rule out
+        are never decoded.
+        """
+        with open_buffer(path) as buffer:
+            return self.scan_bytes(buffer)
+
+    def scan_bytes(self, data) -> List[Tuple[str, int, str]]:
+        """
+        scan() a file's raw contents (bytes or a buffer) as scan_file would read
+        them, so a buffer can be checked before it's written.
+        """
+        if self.byte_regex is not None and not self.byte_regex.search(data) and is_valid_utf8(data):
+            return []
+        content = str(data, 'utf-8', 'ignore')
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return self.scan(content)
+
+    def scan(self, content: str) -> List[Tuple[str, int, str]]:
+        """
+        Return (pattern_name, line_number, stripped_line) for every match, in line
+        order and pattern order within a line. Lines are split on '\\n' only.
+        """
+        hits = list(self.regex.finditer(content))
+        if not hits:
+            return []
+
+        # Start offset of every line, for mapping match offsets to line numbers
+        line_starts = [0]
+        position = content.find('\n')
+        while position != -1:
+            line_starts.append(position + 1)
+            position = content.find('\n', position + 1)
+
+        flagged = set()
+        for hit in hits:
+            first = bisect.bisect_right(line_starts, hit.start()) - 1
+            last = bisect.bisect_right(line_starts, max(hit.start(), hit.end() - 1)) - 1
+            flagged.update(range(first, last + 1))
+
+        findings = []
+        for index in sorted(flagged):
+            end = line_starts[index + 1] if index + 1 < len(line_starts) else len(content)
+            line = content[line_starts[index]:end]
+            for name, pattern in self.patterns:
+                for _ in pattern.finditer(line):
+                    findings.append((name, index + 1, line.strip()))
+        return findings
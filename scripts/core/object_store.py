@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store of app files.
+Every distinct file is kept once, as a blob named by the sha256 of its
+contents and its permissions (hardlinks share them). The app cache records
+each cached app as a tree of blobs, and apps are materialized from the store
+by hardlink, reflink or copy, so a fleet of generated apps takes about one
+template plus each client's changed files.
+
+A blob keeps the time of the file it was stored from, and is only hardlinked
+where a file should have that time. Blobs are checked against their sha256
+before they're used: one that was changed through a hardlinked app (edited
+in place) is treated as damaged instead of spreading the edit to the next
+app, and is replaced when its contents are stored again. Blobs no tree
+refers to are removed by gc().
+"""
+
+import os
+import stat
+import time
+import shutil
+import tempfile
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from branding_manifest import hash_bytes, hash_file
+from template_copy import reflink_file
+from transaction import TEMP_SUFFIX, write_temp
+
+# Unreferenced blobs younger than this are kept by gc(): they may belong to
+# an app that is being stored right now
+GC_GRACE_SECONDS = 3600
+
+def default_store_dir() -> str:
+    """Object store directory in the user's cache directory ($XDG_CACHE_HOME or ~/.cache)"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'barber-wizard', 'objects')
+
+def blob_id(sha256: str, mode: int = 0o644) -> str:
+    return f'{sha256}-{stat.S_IMODE(mode):04o}'
+
+def blob_sha256(blob: str) -> str:
+    return blob.split('-', 1)[0]
+
+def blob_mode(blob: str) -> int:
+    return int(blob.split('-', 1)[1], 8)
+
+class ObjectStore:
+    """Blobs in <path>/<first two hex digits>/<blob id>"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_store_dir()
+        # (inode, size, mtime) by blob id of the blobs whose contents were checked
+        self._verified: Dict[str, Tuple[int, int, int]] = {}
+
+    def blob_path(self, blob: str) -> str:
+        return os.path.join(self.path, blob[:2], blob)
+
+    def intact(self, blob: str) -> bool:
+        """
+        True if the blob exists and still has the contents it was stored
+        with; checked once per store while the file's inode, size and mtime stay the same
+        """
+        path = self.blob_path(blob)
+        try:
+            info = os.stat(path)
+        except OSError:
+            return False
+        identity = (info.st_ino, info.st_size, info.st_mtime_ns)
+        if self._verified.get(blob) == identity:
+            return True
+        try:
+            if hash_file(path) != blob_sha256(blob):
+                return False
+        except OSError:
+            return False
+        self._verified[blob] = identity
+        return True
+
+    def _check(self, blob: str) -> str:
+        path = self.blob_path(blob)
+        if not self.intact(blob):
+            raise OSError(f"Object missing or modified in place: {path}")
+        return path
+
+    def _publish(self, temp_path: str, blob: str, mtime_ns: Optional[int] = None):
+        """Move a finished temp file into place as blob"""
+        os.chmod(temp_path, blob_mode(blob))
+        if mtime_ns is not None:
+            os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(temp_path, self.blob_path(blob))
+        self._verified.pop(blob, None)
+
+    def add_bytes(self, data: bytes, mode: int = 0o644) -> str:
+        """Store data (unless it's there already) as a file with mode's permissions; returns its blob id"""
+        blob = blob_id(hash_bytes(data), mode)
+        if not self.intact(blob):
+            os.makedirs(os.path.dirname(self.blob_path(blob)), exist_ok=True)
+            self._publish(write_temp(self.blob_path(blob), data), blob)
+        return blob
+
+    def add_file(self, path: str, sha256: Optional[str] = None) -> str:
+        """
+        Store a file's contents with its permissions and time (unless they're
+        there already), cloned where the filesystem can; returns its blob id.
+        sha256 is the contents' hash, if known. The file itself is left as it is.
+        """
+        info = os.stat(path)
+        blob = blob_id(sha256 or hash_file(path), info.st_mode)
+        if self.intact(blob):
+            return blob
+        blob_path = self.blob_path(blob)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{blob}.', suffix=TEMP_SUFFIX, dir=os.path.dirname(blob_path))
+        os.close(fd)
+        try:
+            try:
+                os.unlink(temp_path)
+                reflink_file(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+            self._publish(temp_path, blob, info.st_mtime_ns)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return blob
+
+    def read(self, blob: str) -> bytes:
+        path = self.blob_path(blob)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if hash_bytes(data) != blob_sha256(blob):
+            raise OSError(f"Object modified in place: {path}")
+        return data
+
+    def linkable(self, blob: str, mtime_ns: int) -> bool:
+        """True if a file that should have mtime_ns (and the blob's permissions) can be a hardlink to the blob"""
+        try:
+            return os.stat(self.blob_path(blob)).st_mtime_ns == mtime_ns
+        except OSError:
+            return False
+
+    def materialize(self, blob: str, dst_path: str, mode: str = 'copy', mtime_ns: Optional[int] = None) -> str:
+        """
+        Put a blob's contents at dst_path (which must not exist) by hardlink,
+        reflink or copy (a link mode falls back to a copy where the filesystem
+        can't). A hardlink is only made if the blob has mtime_ns (when given).
+        Returns 'linked', 'cloned' or 'copied'; cloned and copied files are
+        the caller's to give permissions and times.
+        """
+        blob_path = self._check(blob)
+        if mode == 'hardlink' and (mtime_ns is None or self.linkable(blob, mtime_ns)):
+            try:
+                os.link(blob_path, dst_path)
+                return 'linked'
+            except OSError:
+                pass
+        elif mode == 'reflink':
+            try:
+                reflink_file(blob_path, dst_path)
+                return 'cloned'
+            except OSError:
+                pass
+        shutil.copyfile(blob_path, dst_path)
+        return 'copied'
+
+    def link_into(self, blob: str, path: str) -> bool:
+        """
+        Replace the file at path (same contents and permissions) with a
+        hardlink to the blob; False if the blob has another time or can't be linked
+        """
+        if not self.linkable(blob, os.stat(path).st_mtime_ns):
+            return False
+        blob_path = self._check(blob)
+        directory, name = os.path.split(path)
+        fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix=TEMP_SUFFIX, dir=directory or '.')
+        os.close(fd)
+        os.unlink(temp_path)
+        try:
+            os.link(blob_path, temp_path)
+        except OSError:
+            return False
+        os.replace(temp_path, path)
+        return True
+
+    def remove(self, blob: str):
+        try:
+            os.unlink(self.blob_path(blob))
+        except FileNotFoundError:
+            pass
+        self._verified.pop(blob, None)
+
+    def blobs(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """(path, stat) of every file in the store, blobs and leftover temp files"""
+        try:
+            shards = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            try:
+                with os.scandir(os.path.join(self.path, shard)) as entries:
+                    for entry in entries:
+                        try:
+                            yield entry.path, entry.stat(follow_symlinks=False)
+                        except OSError:
+                            pass  # removed meanwhile
+            except NotADirectoryError:
+                pass
+
+    def size(self) -> int:
+        """Bytes held by the store (each blob once, however many apps link it)"""
+        return sum(info.st_size for _, info in self.blobs())
+
+    def gc(self, referenced: Set[str], grace: float = GC_GRACE_SECONDS) -> Tuple[int, int]:
+        """
+        Remove blobs that aren't in referenced (and are older than grace
+        seconds, going by their ctime) and stale temp files. Apps linked to
+        a removed blob keep their file. Returns (files, bytes) removed.
+        """
+        cutoff = time.time() - grace
+        removed = freed = 0
+        for path, info in list(self.blobs()):
+            if os.path.basename(path) in referenced or info.st_ctime > cutoff:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += info.st_size
+        return removed, freed
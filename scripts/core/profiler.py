@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Lightweight instrumentation for app generation.
+Records wall time and counters (files read/written, bytes, regex matches)
+per step, plus per-pattern hits and match time from the replacement engine,
+and exports them as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+"""
+
+import os
+import json
+import time
+import contextlib
+from typing import Any, Dict, Iterator, List, Optional
+from dataclasses import dataclass, field
+
+PROFILE_FORMATS = ('json', 'chrome')
+
+@dataclass
+class PatternStats:
+    """Per-pattern hit counts and time spent matching, keyed by pattern source"""
+    hits: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+    # Files the literal prefilter let each pattern be tried on
+    candidate_files: Dict[str, int] = field(default_factory=dict)
+
+    def candidate(self, pattern: str):
+        self.candidate_files[pattern] = self.candidate_files.get(pattern, 0) + 1
+
+    def hit(self, pattern: str, count: int = 1):
+        self.hits[pattern] = self.hits.get(pattern, 0) + count
+
+    def timed(self, pattern: str, seconds: float):
+        self.seconds[pattern] = self.seconds.get(pattern, 0.0) + seconds
+
+    def merge(self, other: 'PatternStats'):
+        for pattern, count in other.hits.items():
+            self.hit(pattern, count)
+        for pattern, seconds in other.seconds.items():
+            self.timed(pattern, seconds)
+        for pattern, files in other.candidate_files.items():
+            self.candidate_files[pattern] = self.candidate_files.get(pattern, 0) + files
+
+@dataclass
+class StageRecord:
+    """One timed step; nested steps have a higher depth"""
+    name: str
+    start_ns: int
+    end_ns: int = 0
+    depth: int = 0
+    counters: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+class Profiler:
+    """Collects StageRecords and pattern statistics for one generation run"""
+
+    def __init__(self):
+        self.origin_ns = time.perf_counter_ns()
+        self.stages: List[StageRecord] = []
+        self.patterns = PatternStats()
+        self._open: List[StageRecord] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        """Time the enclosed block as a step called name"""
+        record = StageRecord(name, time.perf_counter_ns(), depth=len(self._open))
+        self.stages.append(record)
+        self._open.append(record)
+        try:
+            yield record
+        finally:
+            record.end_ns = time.perf_counter_ns()
+            self._open.pop()
+
+    def count(self, counter: str, amount: float = 1):
+        """Add to a counter of the innermost open step (and of the steps around it)"""
+        for record in self._open:
+            record.counters[counter] = record.counters.get(counter, 0) + amount
+
+    def add_patterns(self, stats: Optional[PatternStats]):
+        if stats is not None:
+            self.patterns.merge(stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready summary: steps in start order and patterns by hits"""
+        patterns = sorted(
+            set(self.patterns.hits) | set(self.patterns.seconds),
+            key=lambda pattern: (-self.patterns.hits.get(pattern, 0), pattern)
+        )
+        return {
+            'stages': [
+                {
+                    'name': record.name,
+                    'depth': record.depth,
+                    'startMs': round((record.start_ns - self.origin_ns) / 1e6, 3),
+                    'seconds': round(record.seconds, 6),
+                    'counters': record.counters,
+                }
+                for record in self.stages
+            ],
+            'patterns': [
+                {
+                    'pattern': pattern,
+                    'hits': self.patterns.hits.get(pattern, 0),
+                    'seconds': round(self.patterns.seconds.get(pattern, 0.0), 6),
+                }
+                for pattern in patterns
+            ],
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace Event Format document: one complete ('X') event per step"""
+        pid = os.getpid()
+        events = [
+            {
+                'name': record.name,
+                'cat': 'generation',
+                'ph': 'X',
+                'ts': (record.start_ns - self.origin_ns) / 1e3,
+                'dur': (record.end_ns - record.start_ns) / 1e3,
+                'pid': pid,
+                'tid': 0,
+                'args': record.counters,
+            }
+            for record in self.stages
+        ]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'patterns': self.to_dict()['patterns']}}
+
+    def save(self, path: str, fmt: str = 'json'):
+        if fmt not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format: {fmt}")
+        data = self.to_chrome_trace() if fmt == 'chrome' else self.to_dict()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def print_summary(self, top_patterns: int = 5):
+        print(f"\n⏱️  Generation Profile:")
+        for record in self.stages:
+            counters = ', '.join(f"{name}={value:,.0f}" for name, value in record.counters.items())
+            indent = '  ' * (record.depth + 1)
+            print(f"{indent}{record.name}: {record.seconds * 1000:.1f} ms" + (f" ({counters})" if counters else ''))
+        ranked = self.to_dict()['patterns'][:top_patterns]
+        if ranked:
+            print(f"  🔎 Top patterns:")
+            for entry in ranked:
+                print(f"    {entry['hits']:>5} hits {entry['seconds'] * 1000:8.2f} ms  {entry['pattern'][:60]}")
@@ -9,7 +9,25 @@ import re
 import glob
 from typing import Dict, List, Tuple, Optional, Set
 from dataclasses import dataclass
-import difflib
+import json
+import hashlib
+import functools
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from branding_manifest import BrandingManifest, ManifestEntry, fingerprint_file, hash_bytes
+from byte_scan import MMAP_THRESHOLD, first_chars, open_buffer, sre_parse
+from walker import PathRules, TreeSnapshot, walk_tree
+from transaction import TransactionalWriter, recover_transaction, write_temp
+from profiler import PatternStats
+from legacy_scan import LegacyScanner
+from span_diff import unified_diff
+
+try:
+    import ahocorasick  # optional: pip install pyahocorasick
+except ImportError:
+    ahocorasick = None
 
 @dataclass
 class ReplacementResult:
@@ -17,10 +35,55 @@ class ReplacementResult:
     files_touched: int = 0
     total_replacements: int = 0
     files_with_changes: List[str] = None
+    # Per-pattern hits/timings, when collected (pattern_stats=True)
+    pattern_stats: Optional[PatternStats] = None
+    # Files whose final contents were checked for legacy content (check_legacy=True)
+    files_verified: List[str] = None
+    # What that check found, as check_legacy_patterns reports it:
+    # {pattern_name: [(file, line_number, line_content)]}
+    legacy_findings: Dict[str, List[Tuple[str, int, str]]] = None
     
     def __post_init__(self):
         if self.files_with_changes is None:
             self.files_with_changes = []
+        if self.files_verified is None:
+            self.files_verified = []
+        if self.legacy_findings is None:
+            self.legacy_findings = {}
+    
+    def add_legacy_findings(self, rel_path: str, findings: List[Tuple[str, int, str]]):
+        """
+        Record that a file was verified, with the (pattern_name, line_number,
+        line_content) found in it; they replace what an earlier check of it found.
+        """
+        if rel_path in self.files_verified:
+            for pattern_name in list(self.legacy_findings):
+                matches = [match for match in self.legacy_findings[pattern_name] if match[0] != rel_path]
+                if matches:
+                    self.legacy_findings[pattern_name] = matches
+                else:
+                    del self.legacy_findings[pattern_name]
+        else:
+            self.files_verified.append(rel_path)
+        for pattern_name, line_num, line_content in findings:
+            self.legacy_findings.setdefault(pattern_name, []).append((rel_path, line_num, line_content))
+    
+    @property
+    def legacy_issues(self) -> int:
+        return sum(len(matches) for matches in self.legacy_findings.values())
+    
+    def merge(self, other: 'ReplacementResult'):
+        """Fold the statistics of another run into this one"""
+        self.files_touched += other.files_touched
+        self.total_replacements += other.total_replacements
+        self.files_with_changes.extend(other.files_with_changes)
+        if other.pattern_stats is not None:
+            if self.pattern_stats is None:
+                self.pattern_stats = PatternStats()
+            self.pattern_stats.merge(other.pattern_stats)
+        self.files_verified.extend(other.files_verified)
+        for pattern_name, matches in other.legacy_findings.items():
+            self.legacy_findings.setdefault(pattern_name, []).extend(matches)
 
 def normalize_to_e164(phone: str, default_country: str = "IL") -> str:
     """Normalize phone number to E.164 format"""
@@ -41,34 +104,40 @@ def normalize_to_e164(phone: str, default_country: str = "IL") -> str:
         return f"+{digits}"
     return digits
 
+# File types scanned for hardcoded content
+TEXT_EXTENSIONS = {'.ts', '.tsx', '.js', '.jsx', '.json', '.md'}
+
+# Dependency, VCS and build output directories never scanned or copied
+EXCLUDE_DIRS = {
+    'node_modules', '.git', '.expo', 'android', 'ios', 
+    'build', 'dist', '.next', 'coverage', '__pycache__'
+}
+
+# Generated files never scanned for hardcoded content: tools rewrite them wholesale
+# (a lockfile's "name" follows package.json on the next install) and they are large
+GENERATED_FILES = PathRules([
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', '*.min.js', '*.map',
+])
+
+def snapshot_tree(root: str) -> TreeSnapshot:
+    """Walk root once, skipping EXCLUDE_DIRS; the snapshot can be shared by every stage"""
+    return walk_tree(root, EXCLUDE_DIRS)
+
 def iter_files(root: str, extensions: Set[str] = None) -> List[str]:
     """
-    Recursively find files with specified extensions, excluding build directories.
+    Recursively find files with specified extensions, excluding build directories
+    and binary files. Sorted relative paths.
     """
-    if extensions is None:
-        extensions = {'.ts', '.tsx', '.js', '.jsx', '.json', '.md'}
-    
-    exclude_dirs = {
-        'node_modules', '.git', '.expo', 'android', 'ios', 
-        'build', 'dist', '.next', 'coverage', '__pycache__'
-    }
-    
-    found_files = []
-    
-    for root_dir, dirs, files in os.walk(root):
-        # Remove excluded directories from dirs list to prevent walking into them
-        dirs[:] = [d for d in dirs if d not in exclude_dirs]
-        
-        for file in files:
-            file_path = os.path.join(root_dir, file)
-            _, ext = os.path.splitext(file)
-            
-            if ext.lower() in extensions:
-                # Convert to relative path
-                rel_path = os.path.relpath(file_path, root)
-                found_files.append(rel_path)
-    
-    return sorted(found_files)
+    return scan_targets(snapshot_tree(root), extensions)
+
+def scan_targets(snapshot: TreeSnapshot, extensions: Set[str] = None) -> List[str]:
+    """A snapshot's text files that are scanned for hardcoded content (not GENERATED_FILES)"""
+    return [path for path in snapshot.text_files(TEXT_EXTENSIONS if extensions is None else extensions)
+            if not GENERATED_FILES.matches(path)]
+
+def is_scan_target(rel_path: str) -> bool:
+    """Whether a (text) file at rel_path would be among scan_targets()"""
+    return os.path.splitext(rel_path)[1].lower() in TEXT_EXTENSIONS and not GENERATED_FILES.matches(rel_path)
 
 def generate_replacements(business_info: Dict) -> Dict[str, str]:
     """
@@ -83,6 +152,10 @@ def generate_replacements(business_info: Dict) -> Dict[str, str]:
     # Normalize phone to E.164
     owner_phone_e164 = normalize_to_e164(business_info.get('ownerPhone', ''))
     
+    # Welcome message (default greets the business by name)
+    business_name = business_info.get('businessName', 'Business Name')
+    welcome_message = business_info.get('welcomeMessage', f"ברוכים הבאים ל-{business_name}!")
+    
     # Business addresses (Hebrew and English fallbacks)
     business_address_he = business_info.get('businessAddressHe', business_info.get('businessAddress', 'כתובת העסק'))
     business_address_en = business_info.get('businessAddressEn', business_info.get('businessAddress', 'Business Address'))
@@ -109,8 +182,8 @@ def generate_replacements(business_info: Dict) -> Dict[str, str]:
         r'title="Test Salon"': f'title="{business_info.get("businessName", "Business Name")}"',
         
         # Custom welcome message replacement
-        r"setWelcomeMessage\('ברוכים הבאים ל-Test Salon!'\)": f"setWelcomeMessage('{business_info.get('welcomeMessage', f'ברוכים הבאים ל-{business_info.get('businessName', 'Business Name')}!')}')",
-        r"welcomeMessage\|\|.*t\('home\.welcome'\)": f'"{business_info.get("welcomeMessage", f"ברוכים הבאים ל-{business_info.get('businessName', 'Business Name')}!")}"',
+        r"setWelcomeMessage\('ברוכים הבאים ל-Test Salon!'\)": f"setWelcomeMessage('{welcome_message}')",
+        r"welcomeMessage\|\|.*t\('home\.welcome'\)": f'"{welcome_message}"',
         
         # Email patterns
         r'\binfo@barbersbar\.com?\b': f"info@{domain}",
@@ -165,83 +238,834 @@ def generate_replacements(business_info: Dict) -> Dict[str, str]:
     
     return replacements
 
-def apply_replacements_to_content(content: str, replacements: Dict[str, str]) -> Tuple[str, int]:
+REPLACEMENT_FLAGS = re.IGNORECASE | re.MULTILINE
+
+def _expand_replacement(replacement: str) -> str:
+    """Resolve re.sub template escapes (e.g. \\n) once, so the value can be inserted literally"""
+    try:
+        return re.sub(r'\A', replacement, '', count=1)
+    except re.error:
+        return replacement
+
+# Non-ASCII characters that IGNORECASE treats as equal to 'i', 'k' or 's'
+_ASCII_FOLD_EXTRAS = ('\u0130', '\u0131', '\u017f', '\u212a')
+_ASCII_FOLD_EXTRAS_BYTES = tuple(c.encode('utf-8') for c in _ASCII_FOLD_EXTRAS)
+
+def _foldable(char: str) -> bool:
+    """True if bytes.lower() folds char the same way an IGNORECASE regex does"""
+    return char.isascii() or char.lower() == char.upper()
+
+def _required_literals(parsed) -> Optional[List[str]]:
+    """
+    Lowercased literal substrings of which at least one occurs in every match
+    of a parsed pattern, or None if no literal is required.
+    """
+    best: Optional[List[str]] = None
+    run: List[str] = []
+
+    def consider(option: Optional[List[str]]):
+        nonlocal best
+        if option and (best is None or min(map(len, option)) >= min(map(len, best))):
+            best = option
+
+    def flush():
+        if run:
+            consider([''.join(run).lower()])
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL and _foldable(chr(av)):
+            run.append(chr(av))
+            continue
+        if op is sre_parse.AT:
+            continue  # zero-width, literal chars on both sides stay adjacent
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            consider(_required_literals(av[-1]))
+        elif op is sre_parse.BRANCH:
+            options = [_required_literals(branch) for branch in av[1]]
+            if all(options):
+                consider([literal for option in options for literal in option])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] > 0:
+            consider(_required_literals(av[2]))
+    flush()
+    return best
+
+# Slice size for prefiltering mapped files
+CHUNK_SIZE = 1 << 20
+
+class LiteralPrefilter:
+    """
+    Multi-literal index over raw file bytes that tells which rules can possibly
+    match, so files (and rules) without any required literal skip the regex engine.
+    Uses an Aho-Corasick automaton when pyahocorasick is installed.
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.rule_count = len(patterns)
+        self.unfiltered: Set[int] = set()  # rules without a required literal
+        self.literal_rules: Dict[bytes, Set[int]] = {}
+
+        for index, pattern in enumerate(patterns):
+            literals = _required_literals(sre_parse.parse(pattern, REPLACEMENT_FLAGS))
+            if not literals:
+                self.unfiltered.add(index)
+                continue
+            for literal in literals:
+                self.literal_rules.setdefault(literal.encode('utf-8'), set()).add(index)
+
+        self.automaton = None
+        if ahocorasick is not None and self.literal_rules:
+            # Keys are latin-1 views of the UTF-8 bytes, so any pyahocorasick build works
+            self.automaton = ahocorasick.Automaton()
+            for literal in self.literal_rules:
+                self.automaton.add_word(literal.decode('latin-1'), literal)
+            self.automaton.make_automaton()
+
+    def candidates(self, data: bytes) -> Set[int]:
+        """
+        Indices of the rules whose required literals occur in data. A buffer that
+        isn't bytes (e.g. an mmap) is searched in overlapping chunks, so only one
+        chunk is ever copied into memory.
+        """
+        if not isinstance(data, bytes):
+            overlap = max(map(len, self.literal_rules), default=0) + max(map(len, _ASCII_FOLD_EXTRAS_BYTES))
+            found = set()
+            for start in range(0, len(data), CHUNK_SIZE):
+                found |= self.candidates(data[start:start + CHUNK_SIZE + overlap])
+            return found
+        
+        if any(extra in data for extra in _ASCII_FOLD_EXTRAS_BYTES):
+            return set(range(self.rule_count))
+
+        found = set(self.unfiltered)
+        haystack = data.lower()
+        if self.automaton is not None:
+            for _, literal in self.automaton.iter(haystack.decode('latin-1')):
+                found |= self.literal_rules[literal]
+        else:
+            for literal, rules in self.literal_rules.items():
+                if not rules <= found and literal in haystack:
+                    found |= rules
+        return found
+
+def _looks_around(parsed) -> bool:
+    """True if a parsed pattern has a lookahead/lookbehind or a conditional group"""
+    for op, av in parsed:
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT, sre_parse.GROUPREF_EXISTS):
+            return True
+        if op is sre_parse.SUBPATTERN:
+            branches = [av[-1]]
+        elif op is sre_parse.BRANCH:
+            branches = av[1]
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+            branches = [av[2]]
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            branches = [av]
+        else:
+            continue
+        if any(_looks_around(branch) for branch in branches):
+            return True
+    return False
+
+def _merge_spans(spans: List[Tuple[int, int, int, str]], found: List[Tuple[int, int]],
+                 index: int, value: str) -> List[Tuple[int, int, int, str]]:
+    """
+    Fold rule `index`'s matches - (start, end) in the content as spans rewrite it -
+    into spans, the (start, end, rule_index, value) edits of the original content.
+    A match that runs over earlier replacements takes them into its own edit.
+    """
+    merged = []
+    shift = 0  # length change of the edits passed so far
+    n = 0
+    # Edit a match ended inside of: (start, end, text so far, tail_start, tail), where
+    # tail is the rest of the earlier value, at tail_start in the matched text
+    pending = None
+    for start, end in found:
+        if pending is not None and start >= pending[3] + len(pending[4]):
+            merged.append((pending[0], pending[1], index, pending[2] + pending[4]))
+            pending = None
+
+        if pending is None:
+            # Edits before the match stay as they are
+            while n < len(spans):
+                span_start, span_end, _, span_value = spans[n]
+                new_start = span_start + shift
+                new_end = new_start + len(span_value)
+                if new_end > start or new_start == new_end == start:
+                    break
+                merged.append(spans[n])
+                shift += len(span_value) - (span_end - span_start)
+                n += 1
+            edit_start, text = start - shift, ''
+        else:
+            edit_start, edit_end, text, tail_start, tail = pending
+            text += tail[:start - tail_start]
+            if end <= tail_start + len(tail):
+                pending = (edit_start, edit_end, text + value, end, tail[end - tail_start:])
+                continue
+            pending = None
+
+        # Edits the match overlaps
+        while n < len(spans):
+            span_start, span_end, _, span_value = spans[n]
+            new_start = span_start + shift
+            new_end = new_start + len(span_value)
+            if new_start > end or (new_start == end and new_end > end):
+                break
+            if new_start < start:
+                edit_start, text = span_start, span_value[:start - new_start]
+            if new_end > end:
+                pending = (edit_start, span_end, text + value, end, span_value[end - new_start:])
+            shift += len(span_value) - (span_end - span_start)
+            n += 1
+        if pending is None:
+            merged.append((edit_start, end - shift, index, text + value))
+    if pending is not None:
+        merged.append((pending[0], pending[1], index, pending[2] + pending[4]))
+    merged.extend(spans[n:])
+    return merged
+
+def _splice(content: str, spans: List[Tuple[int, int, int, str]]) -> Tuple[str, List[Tuple[int, int, int]]]:
+    """content with the spans' values in place, plus where each value ended up"""
+    parts = []
+    placed = []
+    position = length = 0
+    for start, end, index, value in spans:
+        parts.append(content[position:start])
+        length += start - position
+        placed.append((length, length + len(value), index))
+        parts.append(value)
+        length += len(value)
+        position = end
+    parts.append(content[position:])
+    return ''.join(parts), placed
+
+class CompiledReplacementSet:
+    """
+    Replacement engine built from a {pattern: replacement} table.
+
+    Rules apply one after the other, in table order, each to the text the rules
+    before it left, so counts and output are those of a plain re.sub loop. Only
+    the rules the literal prefilter lets through run (a subset), plus any later
+    rule whose required literal a replacement inserts.
+
+    For the template index, all patterns are also joined into one alternation
+    that locates every match in a single scan, each hit dispatched to the rule
+    that produced it (see placeholders()).
+    """
+
+    def __init__(self, replacements: Dict[str, str], root: Optional['CompiledReplacementSet'] = None,
+                 root_indices: Optional[List[int]] = None):
+        self.table = dict(replacements)
+        # Rules without a replacement value are skipped, as before
+        self.rules: List[Tuple[str, str]] = [
+            (pattern, replacement) for pattern, replacement in replacements.items() if replacement
+        ]
+        # A subset keeps its root's rule order and indices for the rule-by-rule pass
+        self.root = root or self
+        self.root_indices = list(root_indices) if root is not None else list(range(len(self.rules)))
+        self.values = [_expand_replacement(replacement) for _, replacement in self.rules]
+        self.value_by_pattern = {pattern: value for (pattern, _), value in zip(self.rules, self.values)}
+        self.rule_index = {pattern: index for index, (pattern, _) in enumerate(self.rules)}
+        self.rule_regexes = [re.compile(pattern, REPLACEMENT_FLAGS) for pattern, _ in self.rules]
+        self._prefilter: Optional[LiteralPrefilter] = None
+        self._subsets: Dict[frozenset, 'CompiledReplacementSet'] = {}
+        self._reduced: Dict[frozenset, 'CompiledReplacementSet'] = {}
+        # (required literals, max width or None if unbounded, context-free) per rule
+        self._shapes: Optional[List[Tuple[Optional[List[str]], Optional[int], bool]]] = None
+        self._chained: Dict[int, Optional[List[str]]] = {}
+        self.regex = None
+        if self.rules:
+            alternation = '|'.join(f'(?:{pattern})' for pattern, _ in self.rules)
+            # A one-character lookahead lets the scanner skip most positions cheaply
+            lead: Optional[Set[str]] = set()
+            for pattern, _ in self.rules:
+                chars = first_chars(sre_parse.parse(pattern, REPLACEMENT_FLAGS))
+                if chars is None:
+                    lead = None
+                    break
+                lead |= chars
+            if lead:
+                guard = ''.join(re.escape(c) for c in sorted(lead))
+                alternation = f'(?=[{guard}])(?:{alternation})'
+            self.regex = re.compile(alternation, REPLACEMENT_FLAGS)
+
+    def candidates(self, data: bytes) -> Set[int]:
+        """Indices of the rules that can possibly match the raw file bytes"""
+        if self._prefilter is None:
+            self._prefilter = LiteralPrefilter([pattern for pattern, _ in self.rules])
+        return self._prefilter.candidates(data)
+
+    def subset(self, indices) -> 'CompiledReplacementSet':
+        """Engine restricted to the given rules, keeping their table order"""
+        key = frozenset(indices)
+        if len(key) == len(self.rules):
+            return self
+        if key not in self._subsets:
+            self._subsets[key] = CompiledReplacementSet(
+                {self.rules[i][0]: self.rules[i][1] for i in sorted(key)},
+                self.root, [self.root_indices[i] for i in sorted(key)]
+            )
+        return self._subsets[key]
+
+    def without(self, patterns) -> 'CompiledReplacementSet':
+        """Engine without the rules for the given pattern sources (they don't run at all)"""
+        key = frozenset(patterns) & frozenset(self.rule_index)
+        if not key:
+            return self
+        if key not in self._reduced:
+            self._reduced[key] = CompiledReplacementSet(
+                {pattern: replacement for pattern, replacement in self.rules if pattern not in key}
+            )
+        return self._reduced[key]
+
+    def _shape(self, index: int) -> Tuple[Optional[List[str]], Optional[int], bool]:
+        """Required literals, max match width (None if unbounded) and context-freeness of a rule"""
+        if self._shapes is None:
+            self._shapes = []
+            for pattern, _ in self.rules:
+                parsed = sre_parse.parse(pattern, REPLACEMENT_FLAGS)
+                low, high = parsed.getwidth()
+                self._shapes.append((
+                    _required_literals(parsed),
+                    high if high < sre_parse.MAXREPEAT else None,
+                    low > 0 and not _looks_around(parsed),
+                ))
+        return self._shapes[index]
+
+    def _chained_literals(self, index: int) -> Optional[List[str]]:
+        """
+        Required literals of the rules after `index` that its value could make or
+        complete (inside the value, or across one of its ends); None if a later
+        rule has no required literal.
+        """
+        if index not in self._chained:
+            value = self.values[index].lower()
+            chained: Optional[List[str]] = []
+            if any(extra in value for extra in _ASCII_FOLD_EXTRAS):
+                chained = None
+            for later in range(index + 1, len(self.rules)):
+                literals = self._shape(later)[0]
+                if chained is None or not literals:
+                    chained = None
+                    break
+                chained.extend(literal for literal in literals if literal in value or value in literal or any(
+                    value.endswith(literal[:n]) or value.startswith(literal[-n:]) for n in range(1, len(literal))
+                ))
+            self._chained[index] = chained
+        return self._chained[index]
+
+    def values_chain(self, lowered, spans: List[Tuple[int, int, int]]) -> bool:
+        """
+        True if splicing the values in at spans - sorted (start, end, rule_index) of
+        the lowercased content, str or bytes - could hand a later rule a match.
+        """
+        as_bytes = isinstance(lowered, bytes)
+        for n, (start, end, index) in enumerate(spans):
+            literals = self._chained_literals(index)
+            if literals is None:
+                return True
+            value = self.values[index].lower()
+            if as_bytes:
+                value = value.encode('utf-8')
+            for literal in literals:
+                if as_bytes:
+                    literal = literal.encode('utf-8')
+                reach = len(literal) - 1
+                if (n > 0 and start - spans[n - 1][1] < reach) or \
+                   (n + 1 < len(spans) and spans[n + 1][0] - end < reach):
+                    return True
+                before = lowered[max(0, start - reach):start]
+                window = before + value + lowered[end:end + reach]
+                found = window.find(literal)
+                while found != -1:
+                    if found < len(before) + len(value) and found + len(literal) > len(before):
+                        return True
+                    found = window.find(literal, found + 1)
+        return False
+
+    def _rule_at(self, content: str, pos: int) -> Optional[Tuple[int, int]]:
+        """First rule that matches at pos, as (rule_index, end)"""
+        for index, regex in enumerate(self.rule_regexes):
+            match = regex.match(content, pos)
+            if match and match.end() > pos:
+                return index, match.end()
+        return None
+
+    def _scan(self, content: str) -> List[Tuple[int, int, int]]:
+        """(start, end, rule_index) of the first rule matching at each position where one does"""
+        if self.regex is None:
+            return []
+        # Every match of every rule starts inside a span found by the combined scan,
+        # so only those positions need to be dispatched to individual rules.
+        found = []
+        for hit in self.regex.finditer(content):
+            for pos in range(hit.start(), hit.end()):
+                if pos == hit.start() or self.regex.match(content, pos):
+                    rule = self._rule_at(content, pos)
+                    if rule:
+                        found.append((pos, rule[1], rule[0]))
+        return found
+
+    def _undisturbed(self, lowered: str, spans: List[Tuple[int, int, int]]) -> bool:
+        """
+        True if no replacement at spans (sorted, root rule indices) can change what a
+        later rule matches around it. Occurrences of a later rule's literals that an
+        earlier replacement removes can't; any other occurrence within the rule's
+        match width of such a replacement might (any at all, for an unbounded rule).
+        """
+        root = self.root
+        first = min(index for _, _, index in spans)
+        for later in self.root_indices:
+            if later <= first:
+                continue
+            literals, width, context_free = root._shape(later)
+            if literals is None:
+                return False
+            earlier = [(start, end) for start, end, index in spans if index < later]
+            for literal in literals:
+                found = lowered.find(literal)
+                while found != -1:
+                    found_end = found + len(literal)
+                    if not any(start <= found and found_end <= end for start, end in earlier):
+                        if width is None or not context_free:
+                            return False
+                        if any(found < end + width + 1 and start - width - 1 < found_end for start, end in earlier):
+                            return False
+                    found = lowered.find(literal, found + 1)
+        return True
+
+    def placeholders(self, content: str) -> Optional[List[Tuple[int, int, int]]]:
+        """
+        The (start, end, rule_index) spans the rules replace in content (rule_index
+        into root.rules), when one scan finds them: None if matches overlap or a
+        replacement could change what a later rule matches. A client's values are
+        then safe to splice in unless values_chain() says otherwise.
+        """
+        if any(extra in content for extra in _ASCII_FOLD_EXTRAS):
+            return None
+        spans = [(start, end, self.root_indices[index]) for start, end, index in self._scan(content)]
+        for (_, end, _), (start, _, _) in zip(spans, spans[1:]):
+            if start < end:
+                return None
+        if spans and not self._undisturbed(content.lower(), spans):
+            return None
+        return spans
+
+    def match(self, content: str, stats: Optional[PatternStats] = None
+              ) -> Tuple[List[Tuple[int, int, int, str]], int]:
+        """
+        The (start, end, rule_index, value) edits rewriting content makes, sorted and
+        over the original content (rule_index into root.rules), plus the replacement
+        count. With stats, also records per-pattern hits and match time.
+        """
+        root = self.root
+        active = set(self.root_indices)
+        spans: List[Tuple[int, int, int, str]] = []
+        count = 0
+        text = content
+        for index in range(len(root.rules)):
+            if index not in active:
+                continue
+            pattern = root.rules[index][0]
+            started = time.perf_counter()
+            found = [match.span() for match in root.rule_regexes[index].finditer(text)]
+            if stats is not None:
+                stats.timed(pattern, time.perf_counter() - started)
+                for _ in found:
+                    stats.hit(pattern)
+            if not found:
+                continue
+            count += len(found)
+            spans = _merge_spans(spans, found, index, root.values[index])
+            text, placed = _splice(content, spans)
+            # Inserted text can give later rules a literal the file didn't have
+            later_rules = range(index + 1, len(root.rules))
+            reach = max((len(literal) for later in later_rules for literal in root._shape(later)[0] or []),
+                        default=1) - 1
+            windows = [text[max(0, start - reach):end + reach].lower()
+                       for start, end, rule in placed if rule == index]
+            folded = any(extra in window for window in windows for extra in _ASCII_FOLD_EXTRAS)
+            for later in later_rules:
+                literals = root._shape(later)[0]
+                if later not in active and (folded or not literals or any(
+                        literal in window for literal in literals for window in windows)):
+                    active.add(later)
+        return spans, count
+
+    def apply(self, content: str, stats: Optional[PatternStats] = None) -> Tuple[str, int]:
+        """
+        Rewrite content and return modified content + replacement count.
+        With stats, also records per-pattern hits and match time.
+        """
+        spans, count = self.match(content, stats)
+        if not spans:
+            return content, count
+        return _splice(content, spans)[0], count
+
+# business_info fields generate_replacements reads; nothing else affects the rules
+REPLACEMENT_FIELDS = (
+    'businessName', 'welcomeMessage', 'bundleId', 'domain', 'ownerPhone',
+    'businessAddress', 'businessAddressHe', 'businessAddressEn', 'primaryColor',
+)
+
+def _replacement_key(business_info: Dict) -> str:
+    """Canonical JSON of the fields the replacement table depends on"""
+    return json.dumps(
+        {field: business_info[field] for field in REPLACEMENT_FIELDS if field in business_info},
+        sort_keys=True, ensure_ascii=False
+    )
+
+@functools.lru_cache(maxsize=32)
+def _compiled_replacements_for(key: str) -> 'CompiledReplacementSet':
+    return CompiledReplacementSet(generate_replacements(json.loads(key)))
+
+def get_compiled_replacements(business_info: Dict) -> 'CompiledReplacementSet':
+    """
+    Compiled replacement set for business_info, memoized (LRU) on the fields the
+    rules depend on, so repeated runs for the same client in one process - batch
+    runs, copy + replace + check - compile the patterns once.
+    """
+    return _compiled_replacements_for(_replacement_key(business_info))
+
+def apply_replacements_to_content(content: str, replacements,
+                                  stats: Optional[PatternStats] = None) -> Tuple[str, int]:
     """
     Apply all replacements to content and return modified content + replacement count.
+    Accepts either a {pattern: replacement} dict or a prebuilt CompiledReplacementSet.
+    With stats, per-pattern hits and match time are added to it.
     """
-    modified_content = content
-    replacement_count = 0
+    if not isinstance(replacements, CompiledReplacementSet):
+        replacements = CompiledReplacementSet(replacements)
+    return replacements.apply(content, stats)
+
+@dataclass
+class FileReplacement:
+    """Outcome of running the replacement engine over a single file"""
+    path: str
+    replacements: int = 0
+    diff_preview: Optional[List[str]] = None
+    error: Optional[str] = None
+    fingerprint: Optional[ManifestEntry] = None
+    # Temp file holding the new contents, when the write is left to a TransactionalWriter
+    staged_path: Optional[str] = None
+    pattern_stats: Optional[PatternStats] = None
+    # The file's whole unified diff, in dry runs that write a patch file
+    patch: Optional[str] = None
+    # Legacy content left in the file's final contents, when verified (check_legacy=True)
+    legacy_findings: Optional[List[Tuple[str, int, str]]] = None
+
+def hash_replacement_table(replacements: Dict[str, str]) -> str:
+    """Stable hash of a {pattern: replacement} table, used to detect rule changes"""
+    return hashlib.sha256(json.dumps(list(replacements.items()), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def unmatched_large_file_hash(path: str, replacements: CompiledReplacementSet) -> Optional[str]:
+    """
+    For files of MMAP_THRESHOLD bytes or more, run the literal prefilter through
+    an mmap. Returns the file's sha256 if no rule can match (the file is never
+    read into memory as a whole), else None.
+    """
+    if os.path.getsize(path) < MMAP_THRESHOLD:
+        return None
+    with open_buffer(path) as buffer:
+        if replacements.candidates(buffer):
+            return None
+        return hash_bytes(buffer)
+
+# Compiled once per process; the scanner holds no per-run state
+_legacy_scanner: Optional[LegacyScanner] = None
+
+def legacy_scanner() -> LegacyScanner:
+    """This process's LegacyScanner, compiled on first use"""
+    global _legacy_scanner
+    if _legacy_scanner is None:
+        _legacy_scanner = LegacyScanner()
+    return _legacy_scanner
+
+# Lines of each file's diff kept for the console in dry run mode
+DIFF_PREVIEW_LINES = 20
+
+def brand_content(rel_file_path: str, raw_content: bytes, replacements: CompiledReplacementSet,
+                  dry_run: bool = False, patch: bool = False,
+                  pattern_stats: bool = False, check_legacy: bool = False) -> Tuple[bytes, FileReplacement]:
+    """
+    Run the replacement engine over a file's raw bytes.
+    Returns the bytes the file should end up with (unchanged in dry run mode) and its outcome.
+    In dry run mode the outcome carries a diff preview, and with patch=True the whole diff;
+    both are built from the match spans, only around the lines that change.
+    Otherwise, with check_legacy, the outcome also has the final bytes' legacy findings, as
+    postgen_check would find them on disk afterwards (so the file needn't be read again).
+    With pattern_stats, the outcome has per-pattern hits and match times (profiling).
+    """
+    final_content, outcome = _brand_content(rel_file_path, raw_content, replacements, dry_run, patch,
+                                            pattern_stats)
+    if check_legacy and not dry_run:
+        outcome.legacy_findings = legacy_scanner().scan_bytes(final_content)
+    return final_content, outcome
+
+def _brand_content(rel_file_path: str, raw_content: bytes, replacements: CompiledReplacementSet,
+                   dry_run: bool, patch: bool, pattern_stats: bool) -> Tuple[bytes, FileReplacement]:
+    outcome = FileReplacement(rel_file_path)
     
-    for pattern, replacement in replacements.items():
-        if replacement:  # Only replace if replacement value exists
-            matches = re.findall(pattern, modified_content, re.IGNORECASE | re.MULTILINE)
-            if matches:
-                replacement_count += len(matches)
-                modified_content = re.sub(pattern, replacement, modified_content, flags=re.IGNORECASE | re.MULTILINE)
+    # Skip the regex engine unless a required literal is present
+    candidate_rules = replacements.candidates(raw_content)
+    if not candidate_rules:
+        return raw_content, outcome
     
-    return modified_content, replacement_count
+    # Decode only files that can match (line endings are kept as-is)
+    original_content = raw_content.decode('utf-8', errors='ignore')
+    
+    if pattern_stats:
+        outcome.pattern_stats = PatternStats()
+        for rule_index in candidate_rules:
+            outcome.pattern_stats.candidate(replacements.rules[rule_index][0])
+    
+    # Dry run: diff the match spans without building the new contents
+    if dry_run:
+        matches, outcome.replacements = replacements.subset(candidate_rules).match(
+            original_content, outcome.pattern_stats
+        )
+        if outcome.replacements:
+            diff_path = rel_file_path.replace(os.sep, '/')
+            outcome.diff_preview = list(itertools.islice(
+                unified_diff(diff_path, original_content, matches), DIFF_PREVIEW_LINES
+            ))
+            if patch:
+                outcome.patch = ''.join(unified_diff(diff_path, original_content, matches))
+        return raw_content, outcome
+    
+    # Apply replacements
+    modified_content, outcome.replacements = apply_replacements_to_content(
+        original_content, replacements.subset(candidate_rules), outcome.pattern_stats
+    )
+    if outcome.replacements == 0:
+        return raw_content, outcome
+    
+    return modified_content.encode('utf-8'), outcome
+
+def process_file(root: str, rel_file_path: str, replacements: CompiledReplacementSet,
+                 dry_run: bool = False, fingerprint: bool = False, stage: bool = False,
+                 content: Optional[bytes] = None, patch: bool = False,
+                 pattern_stats: bool = False, check_legacy: bool = False) -> FileReplacement:
+    """
+    Rewrite a single file (or just compute its diff in dry run mode; with
+    patch=True the whole diff is kept for a patch file).
+    With fingerprint=True, also records the size/mtime/hash the file is left with.
+    With stage=True, the new contents go to a temp file (outcome.staged_path)
+    for a TransactionalWriter to move into place.
+    content is the file's new, not yet written contents: they are branded
+    instead of what's on disk and written even if nothing matches.
+    Never raises; errors are reported on the returned FileReplacement.
+    """
+    full_path = os.path.join(root, rel_file_path)
+    
+    try:
+        if content is None:
+            # Large files nothing can match are only ever looked at through an mmap
+            unmatched_hash = unmatched_large_file_hash(full_path, replacements)
+            if unmatched_hash is not None:
+                outcome = FileReplacement(rel_file_path)
+                if fingerprint and not dry_run:
+                    outcome.fingerprint = fingerprint_file(full_path, unmatched_hash)
+                if check_legacy and not dry_run:
+                    outcome.legacy_findings = legacy_scanner().scan_file(full_path)
+                return outcome
+            
+            with open(full_path, 'rb') as f:
+                raw_content = f.read()
+        else:
+            raw_content = content
+        
+        final_content, outcome = brand_content(rel_file_path, raw_content, replacements, dry_run, patch,
+                                               pattern_stats, check_legacy)
+        
+        # Write modified content if not dry run
+        written_path = full_path
+        if final_content is not raw_content or (content is not None and not dry_run):
+            if stage:
+                written_path = outcome.staged_path = write_temp(full_path, final_content)
+            else:
+                with open(full_path, 'wb') as f:
+                    f.write(final_content)
+        
+        if fingerprint and not dry_run:
+            # A rename keeps size and mtime, so the temp file's fingerprint holds for the target
+            outcome.fingerprint = fingerprint_file(written_path, hash_bytes(final_content))
+                    
+    except Exception as e:
+        outcome = FileReplacement(rel_file_path, error=str(e))
+    
+    return outcome
+
+def record_outcome(result: ReplacementResult, outcome: FileReplacement):
+    """Print a file's outcome and fold it into the run's ReplacementResult"""
+    if outcome.pattern_stats is not None:
+        if result.pattern_stats is None:
+            result.pattern_stats = PatternStats()
+        result.pattern_stats.merge(outcome.pattern_stats)
+    if outcome.legacy_findings is not None:
+        result.add_legacy_findings(outcome.path, outcome.legacy_findings)
+    if outcome.error is not None:
+        print(f"  ⚠️  Error processing {outcome.path}: {outcome.error}")
+        return
+    if outcome.replacements == 0:
+        return
+    
+    result.files_touched += 1
+    result.total_replacements += outcome.replacements
+    result.files_with_changes.append(outcome.path)
+    
+    print(f"  ✏️  {outcome.path}: {outcome.replacements} replacements")
+    
+    if outcome.diff_preview and len(result.files_with_changes) <= 3:  # Show first 3 files
+        print("".join(outcome.diff_preview))
+
+# Per-process engine and switches for pool workers, set once by _init_worker
+# (a pool serves one replace_hardcoded_content_safe call)
+_worker_replacements: Optional[CompiledReplacementSet] = None
+_worker_pattern_stats = False
+_worker_check_legacy = False
+
+def _init_worker(business_info: Dict, pattern_stats: bool = False, check_legacy: bool = False):
+    global _worker_replacements, _worker_pattern_stats, _worker_check_legacy
+    _worker_replacements = get_compiled_replacements(business_info)
+    _worker_pattern_stats = pattern_stats
+    _worker_check_legacy = check_legacy
+
+def _process_file_in_worker(args: Tuple[str, str, bool, bool, bool, Optional[bytes], bool]) -> FileReplacement:
+    root, rel_file_path, dry_run, fingerprint, stage, content, patch = args
+    return process_file(root, rel_file_path, _worker_replacements, dry_run, fingerprint, stage, content, patch,
+                        _worker_pattern_stats, _worker_check_legacy)
 
-def replace_hardcoded_content_safe(root: str, business_info: Dict, dry_run: bool = False) -> ReplacementResult:
+def replace_hardcoded_content_safe(root: str, business_info: Dict, dry_run: bool = False,
+                                   workers: int = 1, incremental: bool = False,
+                                   files: Optional[List[str]] = None,
+                                   snapshot: Optional[TreeSnapshot] = None,
+                                   contents: Optional[Dict[str, bytes]] = None,
+                                   patch_path: Optional[str] = None,
+                                   pattern_stats: bool = False,
+                                   check_legacy: bool = False) -> ReplacementResult:
     """
     Safely replace hardcoded content throughout the project.
     
+    Rewrites are staged and committed together by a TransactionalWriter: if the
+    run fails (or crashes) before every file is in place, no file is changed.
+
+    With check_legacy, every processed file is also checked for legacy
+    content (result.files_verified / legacy_findings); files skipped as
+    unchanged by an incremental run aren't.
+    
     Args:
         root: Project root directory
         business_info: Business information dictionary
         dry_run: If True, don't write files, just report what would change
+        workers: Number of processes to spread files across (1 = in-process)
+        incremental: Skip files unchanged since the last run with the same rules,
+            and keep a manifest of file hashes in root for the next run
+        files: Only process these relative paths instead of the whole tree
+        snapshot: Walk of root to use instead of walking it again
+        contents: New contents of some of the files (by relative path) that
+            haven't been written yet; they are branded and written in this pass
+        patch_path: In dry run mode, write every change to this file as a
+            unified diff that applies to root with `patch -p1` / `git apply`
+        pattern_stats: Collect per-pattern hits and match times (result.pattern_stats)
         
     Returns:
         ReplacementResult with statistics
     """
     
+    if patch_path is not None and not dry_run:
+        raise ValueError("A patch file can only be written in dry run mode")
+    
     result = ReplacementResult()
-    replacements = generate_replacements(business_info)
+    replacements = get_compiled_replacements(business_info)
+    contents = contents or {}
     
+    if not dry_run and recover_transaction(root):
+        print("↩️  Rolled back an interrupted branding run")
+
     # Get all files to process
-    files_to_process = iter_files(root)
+    if files is None:
+        if snapshot is None:
+            snapshot = snapshot_tree(root)
+        files_to_process = scan_targets(snapshot)
+    else:
+        files_to_process = list(files)
+    
+    manifest = None
+    if incremental:
+        rules_hash = hash_replacement_table(replacements.table)
+        manifest = BrandingManifest.load(root)
+        if files is None:
+            manifest.prune(files_to_process)
+        unchanged = [path for path in files_to_process if path not in contents and manifest.is_current(
+            path, rules_hash, snapshot.get(path) if snapshot is not None else None)]
+        if unchanged:
+            print(f"♻️  Skipping {len(unchanged)} files unchanged since the last branding run")
+            unchanged = set(unchanged)
+            files_to_process = [path for path in files_to_process if path not in unchanged]
+    fingerprint = manifest is not None
     
     print(f"🔍 Scanning {len(files_to_process)} files for hardcoded content...")
     if dry_run:
         print("📋 DRY RUN MODE - No files will be modified")
     
-    for rel_file_path in files_to_process:
-        full_path = os.path.join(root, rel_file_path)
-        
-        try:
-            # Read file with proper encoding
-            with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                original_content = f.read()
-            
-            # Apply replacements
-            modified_content, file_replacements = apply_replacements_to_content(original_content, replacements)
+    writer = TransactionalWriter(root)
+    if not dry_run:
+        writer.begin(os.path.join(root, rel_file_path) for rel_file_path in files_to_process)
+    
+    patch = patch_path is not None
+    pool = None
+    if workers > 1 and len(files_to_process) > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(business_info, pattern_stats, check_legacy)
+        )
+        chunksize = max(1, len(files_to_process) // (workers * 4))
+        outcomes = pool.map(
+            _process_file_in_worker,
+            [(root, rel_file_path, dry_run, fingerprint, True, contents.get(rel_file_path), patch)
+             for rel_file_path in files_to_process],
+            chunksize=chunksize
+        )
+    else:
+        outcomes = (process_file(root, rel_file_path, replacements, dry_run, fingerprint, stage=True,
+                                 content=contents.get(rel_file_path), patch=patch, pattern_stats=pattern_stats,
+                                 check_legacy=check_legacy)
+                    for rel_file_path in files_to_process)
+    
+    # Diffs are streamed to the patch file as they arrive; none is kept after it's written
+    patch_file = open(patch_path, 'w', encoding='utf-8', newline='') if patch else None
+    try:
+        # Outcomes arrive in file order, so output matches a serial run
+        for outcome in outcomes:
+            if outcome.patch is not None:
+                patch_file.write(outcome.patch)
+                outcome.patch = None
+            if outcome.staged_path is not None:
+                writer.add(os.path.join(root, outcome.path), outcome.staged_path)
+            if manifest is not None:
+                if outcome.fingerprint is not None:
+                    manifest.record(outcome.path, outcome.fingerprint)
+                else:
+                    manifest.entries.pop(outcome.path, None)
             
-            if file_replacements > 0:
-                result.files_touched += 1
-                result.total_replacements += file_replacements
-                result.files_with_changes.append(rel_file_path)
-                
-                print(f"  ✏️  {rel_file_path}: {file_replacements} replacements")
-                
-                # Show diff in dry run mode
-                if dry_run:
-                    diff_lines = list(difflib.unified_diff(
-                        original_content.splitlines(keepends=True),
-                        modified_content.splitlines(keepends=True),
-                        fromfile=f"a/{rel_file_path}",
-                        tofile=f"b/{rel_file_path}",
-                        n=2
-                    ))
-                    if diff_lines and len(result.files_with_changes) <= 3:  # Show first 3 files
-                        print("".join(diff_lines[:20]))  # Limit diff output
-                
-                # Write modified content if not dry run
-                if not dry_run:
-                    with open(full_path, 'w', encoding='utf-8') as f:
-                        f.write(modified_content)
-                        
-        except Exception as e:
-            print(f"  ⚠️  Error processing {rel_file_path}: {e}")
-            continue
+            record_outcome(result, outcome)
+        writer.commit()
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if patch_file is not None:
+            patch_file.close()
+    
+    if patch:
+        print(f"📝 Patch with {result.files_touched} changed files written to {patch_path}")
+    if manifest is not None and not dry_run:
+        manifest.save(rules_hash)
     
     return result
 
@@ -252,8 +1076,15 @@ def main():
     parser = argparse.ArgumentParser(description='Test content replacement system')
     parser.add_argument('--root', default='.', help='Project root directory')
     parser.add_argument('--dry-run', action='store_true', help='Show what would change without writing')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only reprocess files changed since the last run (uses .branding-manifest)')
+    parser.add_argument('--patch', metavar='FILE',
+                        help='With --dry-run, write the full diff to FILE (apply with patch -p1)')
     
     args = parser.parse_args()
+    if args.patch and not args.dry_run:
+        parser.error('--patch requires --dry-run')
     
     # Test business info
     test_business_info = {
@@ -265,7 +1096,9 @@ def main():
         'businessAddressEn': 'Test Street 123, Test City'
     }
     
-    result = replace_hardcoded_content_safe(args.root, test_business_info, args.dry_run)
+    result = replace_hardcoded_content_safe(args.root, test_business_info, args.dry_run,
+                                            workers=args.jobs, incremental=args.incremental,
+                                            patch_path=args.patch)
     
     print(f"\n📊 Summary:")
     print(f"  Files touched: {result.files_touched}")
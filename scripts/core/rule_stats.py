@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Per-rule statistics for the replacement engine, kept across runs.
+Every branded template copy made with --rule-stats (or --profile) adds its
+per-pattern hits, match time and prefilter results to a small local stats
+file, keyed by template revision.
+The report lists rules that never fire and rules that dominate match time.
+
+A rule whose required literals occur in none of a revision's scanned files
+can't match any of them (whatever the business_info), so it is proven dead
+for that revision and can be left out of the engine entirely.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import contextlib
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from profiler import PatternStats
+from transaction import write_temp
+
+RULE_STATS_FILENAME = 'rule-stats.json'
+RULE_STATS_VERSION = 1
+
+# Revisions kept per template; older ones are dropped on save
+MAX_REVISIONS = 10
+
+def default_stats_path() -> str:
+    """Stats file in the user's cache directory ($XDG_CACHE_HOME or ~/.cache)"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'barber-wizard', RULE_STATS_FILENAME)
+
+def template_revision(root: str, snapshot, rel_paths: Iterable[str]) -> str:
+    """
+    Identity of a template's scanned files: their paths, sizes and mtimes
+    (from a walker TreeSnapshot). Any edit makes a new revision.
+    """
+    digest = hashlib.sha256(os.path.abspath(root).encode('utf-8'))
+    for rel_path in sorted(rel_paths):
+        info = snapshot.get(rel_path)
+        digest.update(f"\0{rel_path}\0{info.size if info else -1}\0{info.mtime_ns if info else 0}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+@contextlib.contextmanager
+def _locked(path: str) -> Iterator[None]:
+    """Exclusive lock next to the stats file, so concurrent runs don't lose updates"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+class RuleStats:
+    """The stats file: {revision: {template, runs, filesScanned, checked, rules}}"""
+
+    def __init__(self, path: Optional[str] = None, revisions: Optional[Dict[str, Dict]] = None):
+        self.path = path or default_stats_path()
+        self.revisions = revisions or {}
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'RuleStats':
+        """Load the stats file; a missing or unreadable file is empty"""
+        stats = cls(path)
+        try:
+            with open(stats.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == RULE_STATS_VERSION:
+                stats.revisions = data.get('revisions', {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return stats
+
+    def dead_rules(self, revision: str, patterns: Iterable[str]) -> Set[str]:
+        """Patterns checked on this revision that no scanned file could ever match"""
+        entry = self.revisions.get(revision)
+        if not entry:
+            return set()
+        rules = entry.get('rules', {})
+        checked = set(entry.get('checked', []))
+        return {pattern for pattern in patterns
+                if pattern in checked and not rules.get(pattern, {}).get('candidateFiles')}
+
+    def _add(self, template: str, revision: str, patterns: List[str], stats: PatternStats, files_scanned: int):
+        entry = self.revisions.setdefault(revision, {
+            'template': os.path.abspath(template), 'runs': 0, 'filesScanned': files_scanned,
+            'checked': [], 'rules': {},
+        })
+        entry['runs'] += 1
+        entry['lastRun'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        entry['checked'] = sorted(set(entry['checked']) | set(patterns))
+        rules = entry['rules']
+        for pattern in patterns:
+            rule = rules.setdefault(pattern, {'hits': 0, 'seconds': 0.0, 'candidateFiles': 0})
+            rule['hits'] += stats.hits.get(pattern, 0)
+            rule['seconds'] = round(rule['seconds'] + stats.seconds.get(pattern, 0.0), 6)
+            rule['candidateFiles'] += stats.candidate_files.get(pattern, 0)
+
+        # Keep the most recent revisions of each template
+        same_template = sorted(
+            (key for key, value in self.revisions.items() if value.get('template') == entry['template']),
+            key=lambda key: self.revisions[key].get('lastRun', ''), reverse=True
+        )
+        for key in same_template[MAX_REVISIONS:]:
+            del self.revisions[key]
+
+    def record(self, template: str, revision: str, patterns: List[str], stats: PatternStats,
+               files_scanned: int):
+        """
+        Add one run's statistics and save, under a lock. patterns are the rules the
+        run checked; stats must come from a run with pattern stats collected for
+        every scanned file, or rules would look dead.
+        """
+        with _locked(self.path):
+            self.revisions = RuleStats.load(self.path).revisions
+            self._add(template, revision, patterns, stats, files_scanned)
+            data = {'version': RULE_STATS_VERSION, 'revisions': self.revisions}
+            temp_path = write_temp(self.path, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+            os.replace(temp_path, self.path)
+
+    def report(self, revision: Optional[str] = None, top: int = 10):
+        """Print never-firing, dead and most expensive rules for one revision (default: latest)"""
+        if not self.revisions:
+            print(f"📭 No rule statistics in {self.path}")
+            return
+        if revision is None:
+            revision = max(self.revisions, key=lambda key: self.revisions[key].get('lastRun', ''))
+        entry = self.revisions.get(revision)
+        if entry is None:
+            print(f"❌ Unknown revision: {revision}")
+            return
+
+        rules = entry['rules']
+        print(f"📊 Rule statistics for {entry['template']} (revision {revision})")
+        print(f"  Runs: {entry['runs']}, files scanned per run: {entry['filesScanned']}, last run: {entry.get('lastRun')}")
+
+        dead = sorted(self.dead_rules(revision, rules))
+        never = sorted(pattern for pattern, rule in rules.items() if not rule['hits'] and pattern not in dead)
+        print(f"\n💀 Proven dead (required text in no scanned file): {len(dead)}")
+        for pattern in dead:
+            print(f"    {pattern}")
+        print(f"\n🔇 Never fired (but could match): {len(never)}")
+        for pattern in never:
+            print(f"    {pattern}  (tried on {rules[pattern]['candidateFiles']} files)")
+
+        total_seconds = sum(rule['seconds'] for rule in rules.values()) or 1.0
+        ranked = sorted(rules.items(), key=lambda item: -item[1]['seconds'])[:top]
+        print(f"\n⏱️  Most match time:")
+        for pattern, rule in ranked:
+            print(f"  {rule['seconds'] * 1000:9.2f} ms {rule['seconds'] / total_seconds:6.1%} "
+                  f"{rule['hits']:>6} hits  {pattern[:70]}")
+
+def main():
+    """Show the replacement rule statistics"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replacement rule statistics')
+    parser.add_argument('command', nargs='?', choices=['report', 'clear'], default='report')
+    parser.add_argument('--stats', help=f'Stats file (default: {default_stats_path()})')
+    parser.add_argument('--revision', help='Template revision to report (default: latest run)')
+    parser.add_argument('--top', type=int, default=10, help='Number of most expensive rules to list')
+
+    args = parser.parse_args()
+
+    if args.command == 'clear':
+        path = args.stats or default_stats_path()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        print(f"🧹 Cleared {path}")
+        return 0
+
+    RuleStats.load(args.stats).report(args.revision, args.top)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Unified diffs of replacement runs, computed from the engine's match spans.
+Only small windows around the replaced spans (plus context lines) are split
+into lines and compared, so a diff costs about as much as its own output,
+and it's produced lazily: a preview that stops after 20 lines does no more
+work than that. The output is a regular, applyable unified diff.
+"""
+
+import difflib
+from typing import Iterator, List, Sequence, Tuple
+
+Match = Tuple[int, int, int, str]  # (start, end, rule_index, value) as from CompiledReplacementSet.match
+
+def _lines(text: str) -> List[str]:
+    """Split on '\\n' only (as patch does), keeping the line ends"""
+    lines = text.split('\n')
+    tail = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if tail:
+        lines.append(tail)
+    return lines
+
+def _line_start(content: str, pos: int, lines_before: int = 0) -> int:
+    """Offset of the start of pos's line, or of the line lines_before above it"""
+    start = content.rfind('\n', 0, pos) + 1
+    for _ in range(lines_before):
+        if start == 0:
+            break
+        start = content.rfind('\n', 0, start - 1) + 1
+    return start
+
+def _line_end(content: str, pos: int, lines_after: int = 0) -> int:
+    """Offset just past the end of pos's line (its '\\n'), or of the line lines_after below it"""
+    end = pos
+    for _ in range(lines_after + 1):
+        newline = content.find('\n', end)
+        if newline == -1:
+            return len(content)
+        end = newline + 1
+    return end
+
+def _format_range(start: int, length: int) -> str:
+    """'start,length' of a hunk header, 1-based (as difflib.unified_diff writes it)"""
+    first = start + 1
+    if length == 1:
+        return f"{first}"
+    if not length:
+        first -= 1  # empty ranges begin just before the hunk
+    return f"{first},{length}"
+
+def _output(line: str) -> Iterator[str]:
+    if line.endswith('\n'):
+        yield line
+    else:
+        yield line + '\n'
+        yield '\\ No newline at end of file\n'
+
+def _windows(content: str, matches: Sequence[Match], context: int) -> Iterator[Tuple[int, int, List[Match]]]:
+    """(start, end, matches) of the regions around groups of spans whose context lines meet"""
+    group: List[Match] = []
+    window_start = window_end = 0
+    for match in matches:
+        start = _line_start(content, match[0], context)
+        end = _line_end(content, max(match[0], match[1] - 1), context)
+        if group and start <= window_end:
+            group.append(match)
+            window_end = max(window_end, end)
+            continue
+        if group:
+            yield window_start, window_end, group
+        group = [match]
+        window_start, window_end = start, end
+    if group:
+        yield window_start, window_end, group
+
+def unified_hunks(content: str, matches: Sequence[Match], context: int = 2) -> Iterator[str]:
+    """Hunk lines of the diff between content and content with matches (sorted by start) replaced"""
+    line = 0        # original line number at `position`
+    position = 0
+    delta = 0       # lines added (or removed, if negative) by the windows so far
+    for window_start, window_end, group in _windows(content, matches, context):
+        line += content.count('\n', position, window_start)
+        position = window_start
+
+        parts = []
+        cursor = window_start
+        for start, end, _, value in group:
+            parts.append(content[cursor:start])
+            parts.append(value)
+            cursor = end
+        parts.append(content[cursor:window_end])
+        old_lines = _lines(content[window_start:window_end])
+        new_lines = _lines(''.join(parts))
+
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for opcodes in matcher.get_grouped_opcodes(context):
+            old_first, old_last = opcodes[0][1], opcodes[-1][2]
+            new_first, new_last = opcodes[0][3], opcodes[-1][4]
+            yield (f"@@ -{_format_range(line + old_first, old_last - old_first)} "
+                   f"+{_format_range(line + delta + new_first, new_last - new_first)} @@\n")
+            for tag, i1, i2, j1, j2 in opcodes:
+                if tag == 'equal':
+                    for text in old_lines[i1:i2]:
+                        yield from _output(' ' + text)
+                    continue
+                for text in old_lines[i1:i2]:
+                    yield from _output('-' + text)
+                for text in new_lines[j1:j2]:
+                    yield from _output('+' + text)
+        delta += len(new_lines) - len(old_lines)
+
+def unified_diff(rel_path: str, content: str, matches: Sequence[Match], context: int = 2) -> Iterator[str]:
+    """File headers plus unified_hunks(); rel_path is '/'-separated, headers are a/ and b/ prefixed"""
+    hunks = unified_hunks(content, matches, context)
+    first = next(hunks, None)
+    if first is None:
+        return
+    yield f"--- a/{rel_path}\n"
+    yield f"+++ b/{rel_path}\n"
+    yield first
+    yield from hunks
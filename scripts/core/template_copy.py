@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Fast template copy for new app instances.
+Skips the same dependency/build directories as iter_files and can hardlink
+or reflink files that will never be rewritten. copy_and_brand_template
+fuses the copy with the content replacement pass; brand_template_in_memory does the same pass into an AppOverlay, for apps
+that are written straight into an archive. Both can splice values in at the
+offsets of a TemplateIndex instead of running the engine.
+"""
+
+import os
+import sys
+import shutil
+from typing import Dict, Iterable, Optional, Tuple
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+from replacements import (
+    EXCLUDE_DIRS, CompiledReplacementSet, FileReplacement, ReplacementResult,
+    get_compiled_replacements, hash_replacement_table, brand_content, record_outcome,
+    unmatched_large_file_hash, scan_targets,
+    legacy_scanner
+)
+from walker import TreeSnapshot, walk_tree
+from branding_manifest import BrandingManifest, fingerprint_file, hash_bytes
+from app_archive import AppOverlay
+from template_index import FilePlaceholders, TemplateIndex
+
+COPY_MODES = ('copy', 'hardlink', 'reflink')
+
+# Linux FICLONE ioctl (btrfs, xfs, bcachefs, ...)
+_FICLONE = 0x40049409
+
+@dataclass
+class CopyResult:
+    """Statistics of a template copy"""
+    files_copied: int = 0
+    files_linked: int = 0
+    files_cloned: int = 0
+    bytes_copied: int = 0
+    files_scanned: int = 0
+
+    def add(self, kind: str, size: int):
+        if kind == 'linked':
+            self.files_linked += 1
+        elif kind == 'cloned':
+            self.files_cloned += 1
+        else:
+            self.files_copied += 1
+            self.bytes_copied += size
+
+def reflink_file(src: str, dst: str):
+    """Copy-on-write clone of src to dst; raises OSError if the filesystem can't"""
+    if sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL('libc.dylib', use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dst)
+    elif sys.platform.startswith('linux'):
+        import fcntl
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            except OSError:
+                dst_file.close()
+                os.unlink(dst)
+                raise
+    else:
+        raise OSError(f"reflink is not supported on {sys.platform}")
+    shutil.copystat(src, dst)
+
+def snapshot_template(src: str) -> TreeSnapshot:
+    """Walk the template (following directory symlinks), skipping EXCLUDE_DIRS"""
+    return walk_tree(src, EXCLUDE_DIRS, follow_links=True)
+
+def _make_tree(src: str, dst: str, snapshot: TreeSnapshot):
+    os.makedirs(dst)
+    shutil.copystat(src, dst)
+    for rel_dir in snapshot.directories:
+        os.makedirs(os.path.join(dst, rel_dir), exist_ok=True)
+
+def _copy_file(src_path: str, dst_path: str, mode: str, linkable: bool,
+               data: Optional[bytes] = None) -> Tuple[str, int]:
+    """Link, clone or copy one file; returns (kind, bytes_copied)"""
+    if mode != 'copy' and linkable:
+        try:
+            if mode == 'hardlink':
+                os.link(src_path, dst_path)
+                return 'linked', 0
+            reflink_file(src_path, dst_path)
+            return 'cloned', 0
+        except OSError:
+            pass
+    if data is None:
+        shutil.copy2(src_path, dst_path)
+        return 'copied', os.path.getsize(dst_path)
+    # Contents already in memory: write them instead of reading the file again
+    with open(dst_path, 'wb') as f:
+        f.write(data)
+    shutil.copystat(src_path, dst_path)
+    return 'copied', len(data)
+
+def _brand_copy_file(src: str, dst: str, rel_path: str, replacements: CompiledReplacementSet,
+                     mode: str, linkable: bool, transform: bool,
+                     placeholders: Optional[FilePlaceholders] = None,
+                     data: Optional[bytes] = None,
+                     pattern_stats: bool = False,
+                     check_legacy: bool = False) -> Tuple[str, int, Optional[FileReplacement]]:
+    """
+    Copy one template file to dst, rewriting it on the way if it's a text file
+    the engine changes (or, with its indexed placeholders, one they say changes).
+    data is the file's contents if already in memory; pattern_stats and
+    check_legacy are as for brand_content.
+    Returns (kind, bytes_copied, outcome or None if not scanned).
+    """
+    src_path = os.path.join(src, rel_path)
+    dst_path = os.path.join(dst, rel_path)
+    if not transform:
+        return _copy_file(src_path, dst_path, mode, linkable, data=data) + (None,)
+
+    try:
+        if placeholders is not None and not placeholders.spans:
+            # Indexed with nothing to replace: copied (or linked) without being read
+            kind, size = _copy_file(src_path, dst_path, mode, linkable, data=data)
+            outcome = placeholders.outcome(rel_path, replacements, pattern_stats, check_legacy)
+            outcome.fingerprint = fingerprint_file(dst_path, placeholders.sha256)
+            return kind, size, outcome
+        if data is None and placeholders is None:
+            unmatched_hash = unmatched_large_file_hash(src_path, replacements)
+            if unmatched_hash is not None:
+                # Large file no rule can match: copy it without reading it into memory
+                kind, size = _copy_file(src_path, dst_path, mode, linkable)
+                outcome = FileReplacement(rel_path, fingerprint=fingerprint_file(dst_path, unmatched_hash))
+                if check_legacy:
+                    outcome.legacy_findings = legacy_scanner().scan_file(src_path)
+                return kind, size, outcome
+        if data is None:
+            with open(src_path, 'rb') as f:
+                data = f.read()
+        raw_content = data
+        if placeholders is not None:
+            final_content, outcome = placeholders.apply(rel_path, raw_content, replacements, pattern_stats,
+                                                        check_legacy)
+        else:
+            final_content, outcome = brand_content(rel_path, raw_content, replacements,
+                                                   pattern_stats=pattern_stats, check_legacy=check_legacy)
+        if final_content is raw_content:
+            kind, size = _copy_file(src_path, dst_path, mode, linkable, data=raw_content)
+        else:
+            with open(dst_path, 'wb') as f:
+                f.write(final_content)
+            shutil.copymode(src_path, dst_path)
+            kind, size = 'copied', len(final_content)
+        outcome.fingerprint = fingerprint_file(dst_path, hash_bytes(final_content))
+    except Exception as e:
+        # Still try to get the file into the app unmodified; it may already be
+        # there as a link to src_path, which copying onto would refuse
+        try:
+            os.unlink(dst_path)
+        except FileNotFoundError:
+            pass
+        kind, size = _copy_file(src_path, dst_path, 'copy', False)
+        outcome = FileReplacement(rel_path, error=str(e))
+    return kind, size, outcome
+
+# Per-process engine and switches for pool workers, set once by _init_worker
+# (a pool serves one copy)
+_worker_replacements: Optional[CompiledReplacementSet] = None
+_worker_pattern_stats = False
+_worker_check_legacy = False
+
+def _init_worker(business_info: Dict, pattern_stats: bool = False, skip_rules: frozenset = frozenset(),
+                 check_legacy: bool = False):
+    global _worker_replacements, _worker_pattern_stats, _worker_check_legacy
+    _worker_replacements = get_compiled_replacements(business_info).without(skip_rules)
+    _worker_pattern_stats = pattern_stats
+    _worker_check_legacy = check_legacy
+
+def _brand_copy_in_worker(args) -> Tuple[str, int, Optional[FileReplacement]]:
+    return _brand_copy_file(*args[:3], _worker_replacements, *args[3:], pattern_stats=_worker_pattern_stats,
+                            check_legacy=_worker_check_legacy)
+
+def copy_and_brand_template(src: str, dst: str, business_info: Dict, mode: str = 'copy',
+                            workers: int = 1, defer: Iterable[str] = (),
+                            keep_unlinked: Iterable[str] = (),
+                            snapshot: Optional[TreeSnapshot] = None,
+                            skip_rules: Iterable[str] = (),
+                            index: Optional[TemplateIndex] = None,
+                            pattern_stats: bool = False,
+                            check_legacy: bool = False) -> Tuple[ReplacementResult, CopyResult]:
+    """
+    Copy the template and apply content replacement in one streaming pass.
+
+    Each file is read once: binary and unmatched files are copied (or linked)
+    as-is, matched text files are rewritten in memory and written straight to
+    dst. Also writes the branding manifest for later incremental runs.
+
+    Args:
+        src: Template root
+        dst: Destination directory (must not exist)
+        business_info: Business information dictionary
+        mode: 'copy', 'hardlink' or 'reflink' for files that are not rewritten
+        workers: Number of processes (1 = in-process)
+        defer: Relative paths to copy unmodified, for a later replacement pass
+        keep_unlinked: Relative paths that will be written later and must be real copies
+        snapshot: Walk of src to use (default: snapshot_template(src)); binary
+            files with a text extension are copied without scanning, and files
+            it holds in memory (TreeSnapshot.preload) aren't read again when
+            running in-process
+        skip_rules: Pattern sources proven dead for this template (see rule_stats)
+        index: Placeholder index of src for business_info's rules (see
+            template_index); indexed files are branded from it
+        pattern_stats: Collect per-pattern statistics (ReplacementResult.pattern_stats)
+        check_legacy: Check every scanned file's final contents for legacy
+            content (ReplacementResult.legacy_findings)
+
+    Returns:
+        (ReplacementResult, CopyResult)
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"Unknown copy mode: {mode}")
+
+    all_replacements = get_compiled_replacements(business_info)
+    skip_rules = frozenset(skip_rules)
+    replacements = all_replacements.without(skip_rules)
+    defer = {path.replace('/', os.sep) for path in defer}
+    keep_unlinked = {path.replace('/', os.sep) for path in keep_unlinked}
+
+    if snapshot is None:
+        snapshot = snapshot_template(src)
+    _make_tree(src, dst, snapshot)
+
+    scanned = set(scan_targets(snapshot)) - defer
+    tasks = [
+        (src, dst, rel_path, mode, rel_path not in keep_unlinked, rel_path in scanned,
+         index.placeholders(rel_path) if index is not None and rel_path in scanned else None)
+        for rel_path in snapshot.files
+    ]
+    print(f"🔍 Copying {len(tasks)} files, scanning {sum(task[5] for task in tasks)} for hardcoded content...")
+
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(business_info, pattern_stats, skip_rules, check_legacy)
+        )
+        results = pool.map(_brand_copy_in_worker, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+    else:
+        results = (_brand_copy_file(*task[:3], replacements, *task[3:], data=snapshot.cached_bytes(task[2]),
+                                    pattern_stats=pattern_stats, check_legacy=check_legacy)
+                   for task in tasks)
+
+    replacement_result = ReplacementResult()
+    copy_result = CopyResult()
+    manifest = BrandingManifest(dst)
+    try:
+        # Results arrive in file order, so output matches a serial run
+        for kind, size, outcome in results:
+            copy_result.add(kind, size)
+            if outcome is None:
+                continue
+            copy_result.files_scanned += 1
+            if outcome.fingerprint is not None:
+                manifest.record(outcome.path, outcome.fingerprint)
+            record_outcome(replacement_result, outcome)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Skipped rules can't match these files, so they count as processed with the full table
+    manifest.save(hash_replacement_table(all_replacements.table))
+    return replacement_result, copy_result
+
+def _brand_in_memory(src: str, rel_path: str, replacements: CompiledReplacementSet,
+                     placeholders: Optional[FilePlaceholders] = None,
+                     data: Optional[bytes] = None,
+                     pattern_stats: bool = False,
+                     check_legacy: bool = False) -> Tuple[Optional[bytes], FileReplacement]:
+    """Branded contents of one template file, or None if the engine (or index) leaves it unchanged"""
+    try:
+        if placeholders is not None and not placeholders.spans:
+            return None, placeholders.outcome(rel_path, replacements, pattern_stats, check_legacy)
+        if data is None:
+            with open(os.path.join(src, rel_path), 'rb') as f:
+                data = f.read()
+        if placeholders is not None:
+            final_content, outcome = placeholders.apply(rel_path, data, replacements, pattern_stats, check_legacy)
+        else:
+            final_content, outcome = brand_content(rel_path, data, replacements, pattern_stats=pattern_stats,
+                                                   check_legacy=check_legacy)
+        return (None if final_content is data else final_content), outcome
+    except Exception as e:
+        return None, FileReplacement(rel_path, error=str(e))
+
+def _brand_in_memory_in_worker(args) -> Tuple[Optional[bytes], FileReplacement]:
+    return _brand_in_memory(args[0], args[1], _worker_replacements, args[2], pattern_stats=_worker_pattern_stats,
+                            check_legacy=_worker_check_legacy)
+
+def brand_template_in_memory(src: str, business_info: Dict, workers: int = 1,
+                             defer: Iterable[str] = (), snapshot: Optional[TreeSnapshot] = None,
+                             skip_rules: Iterable[str] = (),
+                             index: Optional[TemplateIndex] = None,
+                             pattern_stats: bool = False,
+                             check_legacy: bool = False) -> Tuple[ReplacementResult, CopyResult, AppOverlay]:
+    """
+    Apply content replacement to the template without writing anything: the
+    rewritten files are kept in an AppOverlay on top of the template. Unchanged
+    files are never copied (the archive writer reads them from src).
+    Arguments are as for copy_and_brand_template; no branding manifest is kept.
+
+    Returns:
+        (ReplacementResult, CopyResult, AppOverlay); CopyResult counts the
+        rewritten files as copied
+    """
+    replacements = get_compiled_replacements(business_info)
+    skip_rules = frozenset(skip_rules)
+    replacements = replacements.without(skip_rules)
+    defer = {path.replace('/', os.sep) for path in defer}
+
+    if snapshot is None:
+        snapshot = snapshot_template(src)
+    overlay = AppOverlay(src, snapshot)
+
+    # Walk order, so the output matches copy_and_brand_template's
+    targets = set(scan_targets(snapshot)) - defer
+    scanned = [rel_path for rel_path in snapshot.files if rel_path in targets]
+    print(f"🔍 Branding {len(snapshot)} files in memory, scanning {len(scanned)} for hardcoded content...")
+    placeholders = {rel_path: index.placeholders(rel_path) if index is not None else None for rel_path in scanned}
+
+    pool = None
+    if workers > 1 and len(scanned) > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(business_info, pattern_stats, skip_rules, check_legacy)
+        )
+        results = pool.map(_brand_in_memory_in_worker,
+                           [(src, rel_path, placeholders[rel_path]) for rel_path in scanned],
+                           chunksize=max(1, len(scanned) // (workers * 4)))
+    else:
+        results = (_brand_in_memory(src, rel_path, replacements, placeholders[rel_path],
+                                    snapshot.cached_bytes(rel_path), pattern_stats, check_legacy)
+                   for rel_path in scanned)
+
+    replacement_result = ReplacementResult()
+    copy_result = CopyResult(files_scanned=len(scanned))
+    try:
+        for rel_path, (data, outcome) in zip(scanned, results):
+            if data is not None:
+                overlay.write_bytes(rel_path, data)
+                copy_result.add('copied', len(data))
+            record_outcome(replacement_result, outcome)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return replacement_result, copy_result, overlay
+
+def brand_overlay_files(overlay: AppOverlay, rel_paths: Iterable[str], business_info: Dict,
+                        contents: Optional[Dict[str, bytes]] = None,
+                        pattern_stats: bool = False, check_legacy: bool = False) -> ReplacementResult:
+    """
+    Replacement pass over some files of an AppOverlay (the in-memory
+    counterpart of replace_hardcoded_content_safe with files=rel_paths).
+    contents are new, not yet written contents of some of them.
+    """
+    replacements = get_compiled_replacements(business_info)
+    contents = contents or {}
+    result = ReplacementResult()
+    rel_paths = [rel_path for rel_path in rel_paths if overlay.exists(rel_path)]
+    print(f"🔍 Scanning {len(rel_paths)} files for hardcoded content...")
+    for rel_path in rel_paths:
+        data = contents.get(rel_path)
+        if data is None:
+            data = overlay.read_bytes(rel_path)
+        final_content, outcome = brand_content(rel_path, data, replacements, pattern_stats=pattern_stats,
+                                               check_legacy=check_legacy)
+        if final_content is not data or rel_path in contents:
+            overlay.write_bytes(rel_path, final_content)
+        record_outcome(result, outcome)
+    return result
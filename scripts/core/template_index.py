@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Precompiled placeholder index of a template.
+Where the replacement rules match in a template file doesn't depend on the
+client: the same brand names, phones and colors sit at the same offsets for
+everyone. The index records them once per template revision as byte ranges
+and rule patterns, so per-client branding splices the client's values in
+without running the regex engine, and files with nothing to replace aren't
+even read. Entries are checked against the template files' size and mtime
+(then sha256) and re-indexed when they change.
+
+Files where one scan can't tell what gets replaced (matches overlap, or a
+replacement could change what a later rule matches) or that aren't valid
+UTF-8 are marked dynamic and still go through the engine, as do files where
+a client's values could give a later rule a match (see values_chain).
+"""
+
+import os
+import sys
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+
+from replacements import (
+    CompiledReplacementSet, FileReplacement, brand_content, legacy_scanner
+)
+from branding_manifest import hash_bytes, hash_file
+from profiler import PatternStats
+from transaction import write_temp
+
+INDEX_VERSION = 2
+
+def default_index_dir() -> str:
+    """Index directory in the user's cache directory ($XDG_CACHE_HOME or ~/.cache)"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'barber-wizard', 'template-index')
+
+@dataclass
+class FilePlaceholders:
+    """Where the rules match in one template file, as it was when indexed"""
+    size: int
+    mtime_ns: int
+    sha256: str
+    # (start, end, pattern) byte ranges to replace, sorted
+    spans: List[Tuple[int, int, str]]
+    # Patterns the literal prefilter lets through, for per-pattern statistics
+    candidates: List[str]
+    # The engine has to run: one scan can't tell the spans, or the file isn't valid UTF-8
+    dynamic: bool = False
+    # Legacy findings of a file without spans (its branded contents are its own)
+    legacy: Optional[List[Tuple[str, int, str]]] = None
+
+    def outcome(self, rel_path: str, replacements: CompiledReplacementSet,
+                pattern_stats: bool = False, check_legacy: bool = False) -> FileReplacement:
+        """The FileReplacement brand_content would report, minus match timings"""
+        outcome = FileReplacement(rel_path, replacements=len(self.spans))
+        if pattern_stats:
+            candidates = [pattern for pattern in self.candidates if pattern in replacements.value_by_pattern]
+            if candidates:
+                outcome.pattern_stats = PatternStats()
+                for pattern in candidates:
+                    outcome.pattern_stats.candidate(pattern)
+                for _, _, pattern in self.spans:
+                    outcome.pattern_stats.hit(pattern)
+        if check_legacy and not self.spans:
+            outcome.legacy_findings = list(self.legacy or [])
+        return outcome
+
+    def apply(self, rel_path: str, raw_content: bytes, replacements: CompiledReplacementSet,
+              pattern_stats: bool = False, check_legacy: bool = False) -> Tuple[bytes, FileReplacement]:
+        """
+        brand_content() by splicing the values in at the indexed offsets (or brand_content()
+        itself, if these values could give a later rule a match of its own).
+        raw_content must be the indexed contents; it's returned as is if nothing is replaced.
+        """
+        outcome = self.outcome(rel_path, replacements, pattern_stats, check_legacy)
+        if not self.spans:
+            return raw_content, outcome
+        if replacements.values_chain(raw_content.lower(), [(start, end, replacements.rule_index[pattern])
+                                                           for start, end, pattern in self.spans]):
+            return brand_content(rel_path, raw_content, replacements, pattern_stats=pattern_stats,
+                                 check_legacy=check_legacy)
+        parts = []
+        position = 0
+        for start, end, pattern in self.spans:
+            parts.append(raw_content[position:start])
+            parts.append(replacements.value_by_pattern[pattern].encode('utf-8'))
+            position = end
+        parts.append(raw_content[position:])
+        final_content = b''.join(parts)
+        if check_legacy:
+            outcome.legacy_findings = legacy_scanner().scan_bytes(final_content)
+        return final_content, outcome
+
+def index_file(raw_content: bytes, replacements: CompiledReplacementSet) -> Tuple[List[Tuple[int, int, str]],
+                                                                                  List[str], bool]:
+    """(spans, candidate patterns, dynamic) of a file's contents"""
+    candidate_rules = replacements.candidates(raw_content)
+    candidates = [replacements.rules[index][0] for index in sorted(candidate_rules)]
+    if not candidate_rules:
+        return [], candidates, False
+    try:
+        content = raw_content.decode('utf-8')
+    except UnicodeDecodeError:
+        return [], candidates, True  # the engine drops invalid bytes
+    placeholders = replacements.subset(candidate_rules).placeholders(content)
+    if placeholders is None:
+        return [], candidates, True
+
+    # Character offsets to byte offsets, counting only the text between spans
+    spans = []
+    char_position = byte_position = 0
+    for start, end, index in placeholders:
+        byte_start = byte_position + len(content[char_position:start].encode('utf-8'))
+        byte_end = byte_start + len(content[start:end].encode('utf-8'))
+        spans.append((byte_start, byte_end, replacements.rules[index][0]))
+        char_position, byte_position = end, byte_end
+    return spans, candidates, False
+
+class TemplateIndex:
+    """
+    Placeholder index of one template for one rule set (the patterns of a
+    CompiledReplacementSet, in order; clients with the same fields filled in
+    share it). Saved as JSON in default_index_dir().
+    """
+
+    def __init__(self, template_root: str, patterns: List[str], path: Optional[str] = None):
+        self.template_root = os.path.abspath(template_root)
+        self.patterns = list(patterns)
+        key = hashlib.sha256('\0'.join([self.template_root] + self.patterns).encode('utf-8')).hexdigest()[:16]
+        self.path = path or os.path.join(default_index_dir(), f'{key}.json')
+        self.files: Dict[str, FilePlaceholders] = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, template_root: str, patterns: List[str], path: Optional[str] = None) -> 'TemplateIndex':
+        """Load the index; a missing, unreadable or other-rules file is empty"""
+        index = cls(template_root, patterns, path)
+        try:
+            with open(index.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION or data.get('patterns') != index.patterns:
+                return index
+            patterns = index.patterns
+            for rel_path, entry in data.get('files', {}).items():
+                index.files[rel_path] = FilePlaceholders(
+                    entry['size'], entry['mtimeNs'], entry['sha256'],
+                    [(start, end, patterns[rule]) for start, end, rule in entry['spans']],
+                    [patterns[rule] for rule in entry['candidates']], entry['dynamic'],
+                    [tuple(finding) for finding in entry['legacy']] if entry['legacy'] is not None else None,
+                )
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            index.files = {}
+        return index
+
+    def save(self):
+        rules = {pattern: rule for rule, pattern in enumerate(self.patterns)}
+        data = {
+            'version': INDEX_VERSION,
+            'template': self.template_root,
+            'patterns': self.patterns,
+            'files': {
+                rel_path: {
+                    'size': entry.size, 'mtimeNs': entry.mtime_ns, 'sha256': entry.sha256,
+                    'spans': [[start, end, rules[pattern]] for start, end, pattern in entry.spans],
+                    'candidates': [rules[pattern] for pattern in entry.candidates],
+                    'dynamic': entry.dynamic, 'legacy': entry.legacy,
+                }
+                for rel_path, entry in sorted(self.files.items())
+            },
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = write_temp(self.path, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def _is_current(self, rel_path: str, info) -> bool:
+        """Same check as BrandingManifest.is_current: size and mtime, then the hash"""
+        entry = self.files.get(rel_path)
+        if entry is None or info is None or info.size != entry.size:
+            return False
+        if info.mtime_ns == entry.mtime_ns:
+            return True
+        try:
+            if hash_file(os.path.join(self.template_root, rel_path)) != entry.sha256:
+                return False
+        except OSError:
+            return False
+        entry.mtime_ns = info.mtime_ns
+        self.dirty = True
+        return True
+
+    def refresh(self, snapshot, rel_paths: Iterable[str], replacements: CompiledReplacementSet) -> int:
+        """
+        Index the files among rel_paths (in a walker TreeSnapshot of the template)
+        that are new or changed, and forget the rest. replacements must have this
+        index's patterns. Returns the number of files indexed.
+        """
+        if [pattern for pattern, _ in replacements.rules] != self.patterns:
+            raise ValueError("The replacement rules don't match the index's patterns")
+        rel_paths = list(rel_paths)
+        indexed = 0
+        for rel_path in rel_paths:
+            info = snapshot.get(rel_path)
+            if self._is_current(rel_path, info):
+                continue
+            raw_content = snapshot.cached_bytes(rel_path)
+            if raw_content is None:
+                with open(os.path.join(self.template_root, rel_path), 'rb') as f:
+                    raw_content = f.read()
+            spans, candidates, dynamic = index_file(raw_content, replacements)
+            legacy = None
+            if not spans and not dynamic:
+                legacy = legacy_scanner().scan_bytes(raw_content)
+            self.files[rel_path] = FilePlaceholders(info.size, info.mtime_ns, hash_bytes(raw_content),
+                                                    spans, candidates, dynamic, legacy)
+            indexed += 1
+        keep = set(rel_paths)
+        if indexed or len(keep) != len(self.files):
+            self.files = {rel_path: entry for rel_path, entry in self.files.items() if rel_path in keep}
+            self.dirty = True
+        return indexed
+
+    def placeholders(self, rel_path: str) -> Optional[FilePlaceholders]:
+        """The file's placeholders, or None if it needs the engine (dynamic or not indexed)"""
+        entry = self.files.get(rel_path)
+        return None if entry is None or entry.dynamic else entry
+
+    @property
+    def placeholder_count(self) -> int:
+        return sum(len(entry.spans) for entry in self.files.values())
+
+    @property
+    def dynamic_count(self) -> int:
+        return sum(entry.dynamic for entry in self.files.values())
+
+# Indexes used in this process, so a long-running process (the generation
+# server, a batch) loads each from disk once
+_loaded: Dict[Tuple[str, Tuple[str, ...]], TemplateIndex] = {}
+
+def template_index(template_root: str, snapshot, rel_paths: Iterable[str],
+                   replacements: CompiledReplacementSet) -> TemplateIndex:
+    """
+    The current index of a template for replacements' rules: loaded (once per
+    process), brought up to date with the snapshot and saved if anything changed
+    """
+    patterns = tuple(pattern for pattern, _ in replacements.rules)
+    key = (os.path.abspath(template_root), patterns)
+    index = _loaded.get(key)
+    if index is None:
+        index = _loaded[key] = TemplateIndex.load(template_root, list(patterns))
+    indexed = index.refresh(snapshot, rel_paths, replacements)
+    if indexed:
+        print(f"🗂️  Indexed {indexed} template files: {index.placeholder_count} placeholders, "
+              f"{index.dynamic_count} files left to the engine")
+    if index.dirty:
+        index.save()
+    return index
+
+def main():
+    """Compile (or refresh) a template's placeholder index and show what's in it"""
+    import argparse
+    from replacements import get_compiled_replacements, scan_targets
+    from template_copy import snapshot_template
+
+    parser = argparse.ArgumentParser(description='Template placeholder index')
+    parser.add_argument('--template', default=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                        help='Template root (default: this repository)')
+    args = parser.parse_args()
+
+    # Every field the rules read is set, so every rule is part of the index
+    business_info = {
+        'businessName': 'Test Salon', 'welcomeMessage': 'ברוכים הבאים ל-Test Salon!',
+        'bundleId': 'com.testsalon.app', 'ownerPhone': '+972523456789',
+        'businessAddress': 'Test Street 123, Test City', 'businessAddressHe': 'רחוב בדיקה 123, עיר בדיקה',
+        'businessAddressEn': 'Test Street 123, Test City', 'primaryColor': '#112233',
+    }
+    snapshot = snapshot_template(args.template)
+    index = template_index(args.template, snapshot, scan_targets(snapshot), get_compiled_replacements(business_info))
+    files_with_spans = sum(bool(entry.spans) for entry in index.files.values())
+    print(f"📇 {index.path}")
+    print(f"  Files indexed: {len(index.files)} ({files_with_spans} with placeholders, "
+          f"{index.dynamic_count} left to the engine)")
+    print(f"  Placeholders: {index.placeholder_count}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
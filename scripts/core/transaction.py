@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+All-or-nothing file rewrites for branding runs.
+Rewritten files are staged as temp files next to their targets, fsynced
+together before any of them is renamed into place under a rollback journal
+(and each affected directory once after), so a crash or error never leaves
+an app half-branded. The journal is started (listing the targets)
+before any temp file exists, so recovery also finds the leftovers of a run
+that crashed while staging.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+from typing import Iterable, List, Optional, Tuple
+
+JOURNAL_FILENAME = '.branding-journal'
+JOURNAL_VERSION = 2
+
+TEMP_SUFFIX = '.brand-tmp'
+BACKUP_SUFFIX = '.brand-bak'
+
+def write_temp(path: str, data: bytes) -> str:
+    """
+    Write data to a new temp file in path's directory, with path's permissions
+    if it exists. Returns the temp path; safe to call from pool workers.
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix=TEMP_SUFFIX, dir=directory or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return temp_path
+
+def _fsync_path(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # directories can't be opened on some platforms
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # ... or synced on some filesystems
+    finally:
+        os.close(fd)
+
+def _remove(path: Optional[str]):
+    if path is None:
+        return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _backup(path: str) -> Optional[str]:
+    """Hardlink (or copy) an existing file to a sibling backup; None if it doesn't exist"""
+    if not os.path.exists(path):
+        return None
+    directory, name = os.path.split(path)
+    fd, backup_path = tempfile.mkstemp(prefix=f'.{name}.', suffix=BACKUP_SUFFIX, dir=directory or '.')
+    os.close(fd)
+    os.unlink(backup_path)
+    try:
+        os.link(path, backup_path)
+    except OSError:
+        shutil.copy2(path, backup_path)
+    return backup_path
+
+class TransactionalWriter:
+    """
+    Collects staged rewrites of files under root and applies them together.
+
+    Usage:
+        writer = TransactionalWriter(root)
+        writer.begin(targets)             # before any temp file is written
+        writer.stage(path, data)          # or writer.add(path, write_temp(path, data))
+        writer.commit()                   # or writer.discard()
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.staged: List[Tuple[str, str]] = []  # (target, temp)
+        self.targets: List[str] = []
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.root, JOURNAL_FILENAME)
+
+    def __len__(self) -> int:
+        return len(self.staged)
+
+    def begin(self, targets: Iterable[str]):
+        """
+        Journal the files that may be rewritten, so that temp files and backups
+        left by a crash before commit() are removed by recover_transaction()
+        """
+        self.targets = list(targets)
+        self._write_journal([])
+
+    def stage(self, path: str, data: bytes) -> str:
+        """Stage new contents for path; returns the temp file holding them"""
+        temp_path = write_temp(path, data)
+        self.add(path, temp_path)
+        return temp_path
+
+    def add(self, path: str, temp_path: str):
+        """Take over a temp file written by write_temp() as the new contents of path"""
+        self.staged.append((path, temp_path))
+
+    def discard(self):
+        """Drop every staged rewrite, leaving the targets untouched"""
+        for _, temp_path in self.staged:
+            _remove(temp_path)
+        self.staged = []
+        self._end()
+
+    def _end(self):
+        if self.targets:
+            _remove(self.journal_path)
+            self.targets = []
+
+    def commit(self):
+        """
+        Move every staged file into place. The temp files are fsynced first
+        (only they: nothing else on the filesystem is flushed), then backups
+        of the targets are journaled; if any rename
+        fails, the renamed targets are restored from their backups and the
+        error re-raised.
+        """
+        if not self.staged:
+            self._end()
+            return
+
+        backups = []
+        try:
+            for _, temp_path in self.staged:
+                _fsync_path(temp_path)
+            for target, _ in self.staged:
+                backups.append(_backup(target))
+        except BaseException:
+            for backup_path in backups:
+                _remove(backup_path)
+            self.discard()
+            raise
+
+        self._write_journal(backups)
+        renamed = 0
+        try:
+            for target, temp_path in self.staged:
+                os.replace(temp_path, target)
+                renamed += 1
+            for directory in sorted({os.path.dirname(target) or '.' for target, _ in self.staged}):
+                _fsync_path(directory)
+        except BaseException:
+            _restore(list(zip(self.staged, backups))[:renamed])
+            for _, temp_path in self.staged[renamed:]:
+                _remove(temp_path)
+            for backup_path in backups:
+                _remove(backup_path)
+            _remove(self.journal_path)
+            self.staged = []
+            self.targets = []
+            raise
+
+        _remove(self.journal_path)
+        for backup_path in backups:
+            _remove(backup_path)
+        self.staged = []
+        self.targets = []
+
+    def _relative(self, path: Optional[str]) -> Optional[str]:
+        return None if path is None else os.path.relpath(path, self.root)
+
+    def _write_journal(self, backups: List[Optional[str]]):
+        """Atomically (re)write the journal: the targets, and once committing, the files with their backups"""
+        data = {
+            'version': JOURNAL_VERSION,
+            'targets': sorted({self._relative(target) for target in self.targets}
+                              | {self._relative(target) for target, _ in self.staged}),
+            'files': [
+                {'target': self._relative(target), 'temp': self._relative(temp_path),
+                 'backup': self._relative(backup_path)}
+                for (target, temp_path), backup_path in zip(self.staged, backups)
+            ],
+        }
+        temp_path = self.journal_path + TEMP_SUFFIX
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+        _fsync_path(self.root)
+
+def _restore(entries):
+    """Put journaled targets back as they were: ((target, temp), backup) pairs"""
+    for (target, _), backup_path in entries:
+        if backup_path is None:
+            _remove(target)
+        else:
+            os.replace(backup_path, target)
+
+def _remove_leftovers(root: str, targets: List[str]):
+    """Remove the temp files and backups write_temp() and commit() may have left next to targets"""
+    names_by_directory = {}
+    for target in targets:
+        directory, name = os.path.split(os.path.join(root, target))
+        names_by_directory.setdefault(directory, set()).add(name)
+    for directory, names in names_by_directory.items():
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.startswith('.') or not entry.endswith((TEMP_SUFFIX, BACKUP_SUFFIX)):
+                continue
+            # write_temp()/_backup() name them .<target name>.<random><suffix>
+            if any(entry.startswith(f'.{name}.') for name in names):
+                _remove(os.path.join(directory, entry))
+
+def recover_transaction(root: str) -> bool:
+    """
+    Roll back a commit that was interrupted (e.g. by a crash) in root, and
+    remove the temp files and backups of a run that never got to commit.
+    Returns True if a journal was found.
+    """
+    journal_path = os.path.join(root, JOURNAL_FILENAME)
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError):
+        data = {}
+
+    if data.get('version') in (1, JOURNAL_VERSION):
+        for entry in data.get('files', []):
+            target, temp_path = os.path.join(root, entry['target']), os.path.join(root, entry['temp'])
+            backup_path = entry['backup'] and os.path.join(root, entry['backup'])
+            if backup_path is None:
+                # New file: only remove it if the rename already happened
+                if not os.path.exists(temp_path):
+                    _remove(target)
+            elif os.path.exists(backup_path):
+                os.replace(backup_path, target)
+                _remove(backup_path)  # rename is a no-op if it's still a hardlink of target
+            _remove(temp_path)
+        _remove_leftovers(root, data.get('targets', []) + [entry['target'] for entry in data.get('files', [])])
+    _remove(journal_path)
+    _remove(journal_path + TEMP_SUFFIX)
+    return True
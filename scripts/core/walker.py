@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Single-pass directory walker for the template and generated apps.
+Builds a TreeSnapshot (relative paths with sizes and mtimes) with os.scandir,
+so the copy, replace and check stages can share one traversal of a tree.
+"""
+
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set
+from dataclasses import dataclass
+
+# Bytes read from the start of a file to tell binary from text
+SNIFF_SIZE = 8192
+
+@dataclass
+class FileInfo:
+    """A file found by the walk, as stat'ed during the scan"""
+    path: str
+    size: int
+    mtime_ns: int
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore-style glob ('*', '**', '?', '[...]') to regex source"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        if char == '*':
+            out.append('[^/]*')
+        elif char == '?':
+            out.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = end
+        elif char == '\\' and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return ''.join(out)
+
+class PathRules:
+    """
+    Ordered gitignore-style rules. The last rule that matches a path decides:
+    a plain rule matches it, a '!' rule un-matches it. A trailing '/' restricts
+    a rule to directories; a rule with a '/' elsewhere is anchored to the root,
+    otherwise it matches the name at any depth.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.rules = []
+        for line in patterns:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            anchored = '/' in line
+            source = _glob_to_regex(line.lstrip('/'))
+            regex = re.compile(source + '$' if anchored else f'(?:.*/)?{source}$')
+            self.rules.append((regex, negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'PathRules':
+        """Rules from a .gitignore-style file; a missing file has no rules"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(f.readlines())
+        except OSError:
+            return cls()
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def matches(self, rel_path: str, is_dir: bool = False) -> bool:
+        """True if the rules select rel_path ('/' or os.sep separated)"""
+        rel_path = rel_path.replace(os.sep, '/')
+        matched = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                matched = not negate
+        return matched
+
+class TreeSnapshot:
+    """
+    Files and directories under a root, as found by one walk_tree() call.
+    Paths are relative and os.sep separated; `files` keeps the walk order
+    (each directory's files, then its subdirectories), paths() is sorted.
+    """
+
+    def __init__(self, root: str, files: Dict[str, FileInfo], directories: List[str]):
+        self.root = root
+        self.files = files
+        self.directories = directories
+        self._sorted: Optional[List[str]] = None
+        self._binary: Dict[str, bool] = {}
+        self._contents: Dict[str, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __contains__(self, rel_path: str) -> bool:
+        return rel_path.replace('/', os.sep) in self.files
+
+    def get(self, rel_path: str) -> Optional[FileInfo]:
+        return self.files.get(rel_path.replace('/', os.sep))
+
+    def paths(self, extensions: Optional[Set[str]] = None) -> List[str]:
+        """Sorted relative paths, optionally only those with one of the extensions"""
+        if self._sorted is None:
+            self._sorted = sorted(self.files)
+        if extensions is None:
+            return list(self._sorted)
+        return [path for path in self._sorted if os.path.splitext(path)[1].lower() in extensions]
+
+    def is_binary(self, rel_path: str) -> bool:
+        """True if the file starts with a NUL byte within its first SNIFF_SIZE bytes"""
+        binary = self._binary.get(rel_path)
+        if binary is None:
+            try:
+                with open(os.path.join(self.root, rel_path), 'rb') as f:
+                    binary = b'\0' in f.read(SNIFF_SIZE)
+            except OSError:
+                binary = False  # leave unreadable files to the stage that opens them
+            self._binary[rel_path] = binary
+        return binary
+
+    def text_files(self, extensions: Set[str]) -> List[str]:
+        """paths(extensions) without the binary files among them"""
+        return [path for path in self.paths(extensions) if not self.is_binary(path)]
+
+    def preload(self, max_size: int) -> int:
+        """
+        Read every file of at most max_size bytes into memory, for stages that
+        use the snapshot many times (see cached_bytes). Returns the bytes held.
+        """
+        for rel_path, info in self.files.items():
+            if 0 <= info.size <= max_size and rel_path not in self._contents:
+                try:
+                    with open(os.path.join(self.root, rel_path), 'rb') as f:
+                        self._contents[rel_path] = f.read()
+                except OSError:
+                    pass  # read from disk (and fail) when used
+        return sum(len(data) for data in self._contents.values())
+
+    def cached_bytes(self, rel_path: str) -> Optional[bytes]:
+        """A file's contents if preload() holds them, else None"""
+        return self._contents.get(rel_path)
+
+def walk_tree(root: str, exclude_dirs: Iterable[str] = (), exclude: Optional[PathRules] = None,
+              include: Optional[PathRules] = None, follow_links: bool = False) -> TreeSnapshot:
+    """
+    Walk root once with os.scandir and snapshot its files.
+
+    Args:
+        root: Directory to walk
+        exclude_dirs: Directory names never descended into, at any depth
+        exclude: Rules for files and directories to leave out (excluded
+            directories are not descended into)
+        include: If given, only files these rules select are kept
+        follow_links: Descend into symlinked directories
+
+    Returns:
+        TreeSnapshot of the tree
+    """
+    exclude_dirs = set(exclude_dirs)
+    files: Dict[str, FileInfo] = {}
+    directories: List[str] = []
+
+    def scan(path: str, rel_dir: str):
+        subdirs = []
+        dir_files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if entry.name in exclude_dirs or (exclude and exclude.matches(rel_path, True)):
+                        continue
+                    subdirs.append((entry.name, entry))
+                    continue
+                if exclude and exclude.matches(rel_path):
+                    continue
+                if include and not include.matches(rel_path):
+                    continue
+                try:
+                    # DirEntry caches the stat; symlinks report their target
+                    info = entry.stat()
+                    dir_files.append(FileInfo(rel_path, info.st_size, info.st_mtime_ns))
+                except OSError:
+                    dir_files.append(FileInfo(rel_path, -1, 0))  # e.g. dangling symlink
+
+        for info in sorted(dir_files, key=lambda info: info.path):
+            files[info.path] = info
+        for name, entry in sorted(subdirs, key=lambda item: item[0]):
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            directories.append(rel_path)
+            if follow_links or not entry.is_symlink():
+                scan(entry.path, rel_path)
+
+    scan(root, '')
+    return TreeSnapshot(root, files, directories)
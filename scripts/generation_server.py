@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Long-running app generation service (app_duplication_wizard.py --serve).
+Keeps the template walk, the template's file contents and the compiled
+replacement sets in memory, and generates apps from JSON client entries
+(the batch file format) over HTTP on a TCP port or a Unix socket.
+
+Endpoints:
+    GET  /health     template and cache state
+    POST /generate   body: one client entry. ?format=tar (default), tar.gz,
+                     tar.zst or zip streams the app back (it's generated in
+                     memory, never as files); ?format=directory generates it on
+                     the server, under the output root (--serve-root, default
+                     ~/Desktop), at &path=... (relative to it) or <name>-barbershop
+    POST /reload     walk and read the template again
+
+Apps are generated one at a time (the wizard's output is captured per app
+and stdout redirection is process-wide); archives are streamed concurrently.
+The server has no authentication, so it only listens on loopback addresses
+and Unix sockets unless it's started with allow_remote (--serve-public).
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import stat
+import ipaddress
+import threading
+import contextlib
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote, urlparse
+
+# Add core directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+from byte_scan import MMAP_THRESHOLD
+from template_copy import snapshot_template
+from walker import TreeSnapshot
+from app_archive import ARCHIVE_FORMATS, unsupported_reason
+from generation_context import GenerationContext
+from app_duplication_wizard import BarberAppDuplicationWizard, BatchResult, app_path_for, write_app_archive
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+# Largest request body accepted (client entries are a few KB)
+MAX_BODY_BYTES = 1 << 20
+
+OUTPUT_FORMATS = ARCHIVE_FORMATS + ('directory',)
+
+CONTENT_TYPES = {
+    'tar': 'application/x-tar', 'tar.gz': 'application/gzip', 'tar.zst': 'application/zstd',
+    'zip': 'application/zip',
+}
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """'unix:/path/to.sock' -> ('unix', path); 'host:port', ':port' or 'port' -> ('tcp', (host, port))"""
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    if not port.isdigit():
+        raise ValueError(f"Invalid address (expected HOST:PORT or unix:PATH): {address}")
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+def is_local_address(address: str) -> bool:
+    """True for Unix sockets and TCP addresses only this machine can connect to"""
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        return True
+    host = target[0]
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # a host name, which may resolve to anything
+
+def output_path(output_root: str, path: str) -> str:
+    """
+    Where a ?format=directory app is generated: path (relative) under
+    output_root. Raises ValueError for a path that would end up outside it.
+    """
+    parts = path.replace('\\', '/').split('/')
+    if not path or os.path.isabs(path) or path.startswith('~') or '..' in parts:
+        raise ValueError(f"path must be relative to the output directory, without '..': {path}")
+    root = os.path.realpath(output_root)
+    app_path = os.path.realpath(os.path.join(root, path))
+    # realpath follows symlinks, so a link under the root can't lead out of it either
+    if app_path == root or os.path.commonpath([root, app_path]) != root:
+        raise ValueError(f"path is outside the output directory: {path}")
+    return app_path
+
+class TemplateCache:
+    """
+    The template's walk with its small files held in memory. Before each use
+    the files and directories are stat'ed (no reads, no walk); any change,
+    addition or removal makes the next get() walk and read the template again.
+    """
+
+    def __init__(self, template_path: str, preload_limit: int = MMAP_THRESHOLD):
+        self.template_path = template_path
+        self.preload_limit = preload_limit
+        self.snapshot: Optional[TreeSnapshot] = None
+        self.bytes_cached = 0
+        self.walks = 0
+        self.loaded_at = 0.0
+        self._dir_mtimes: Dict[str, int] = {}
+
+    def _mtime(self, rel_dir: str) -> int:
+        return os.stat(os.path.join(self.template_path, rel_dir)).st_mtime_ns
+
+    def is_stale(self) -> bool:
+        if self.snapshot is None:
+            return True
+        try:
+            for rel_dir, mtime in self._dir_mtimes.items():
+                if self._mtime(rel_dir) != mtime:
+                    return True
+        except OSError:
+            return True
+        for rel_path, info in self.snapshot.files.items():
+            try:
+                current = os.stat(os.path.join(self.template_path, rel_path))
+            except OSError:
+                if info.size != -1:
+                    return True
+                continue
+            if current.st_size != info.size or current.st_mtime_ns != info.mtime_ns:
+                return True
+        return False
+
+    def refresh(self):
+        snapshot = snapshot_template(self.template_path)
+        self._dir_mtimes = {rel_dir: self._mtime(rel_dir) for rel_dir in [''] + snapshot.directories}
+        self.bytes_cached = snapshot.preload(self.preload_limit)
+        self.snapshot = snapshot
+        self.walks += 1
+        self.loaded_at = time.time()
+
+    def get(self) -> TreeSnapshot:
+        """The current snapshot, refreshed first if the template changed"""
+        if self.is_stale():
+            self.refresh()
+        return self.snapshot
+
+class GenerationService:
+    """A wizard and a warm template cache shared by every request"""
+
+    def __init__(self, wizard: BarberAppDuplicationWizard, cache: TemplateCache, output_root: str):
+        self.wizard = wizard
+        self.cache = cache
+        # ?format=directory apps are only generated under this directory
+        self.output_root = output_root
+        self.generated = 0
+        self._lock = threading.Lock()
+
+    def health(self) -> Dict[str, Any]:
+        snapshot = self.cache.snapshot
+        return {
+            'status': 'ok',
+            'template': self.cache.template_path,
+            'files': len(snapshot) if snapshot is not None else 0,
+            'bytesCached': self.cache.bytes_cached,
+            'walks': self.cache.walks,
+            'loadedAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.cache.loaded_at)),
+            'generated': self.generated,
+            'cachedApps': len(self.wizard.app_cache.entries()) if self.wizard.app_cache is not None else None,
+        }
+
+    def reload(self):
+        with self._lock:
+            self.cache.refresh()
+
+    def generate(self, business_info: Dict[str, Any], app_path: str,
+                 in_memory: bool = False) -> Tuple[BatchResult, Optional[GenerationContext]]:
+        """
+        Generate one app into app_path (or in memory, for write_app_archive),
+        capturing everything the wizard prints
+        """
+        result = BatchResult(business_info['businessName'], business_info['bundleId'], app_path)
+        output = io.StringIO()
+        start = time.perf_counter()
+        ctx = None
+        with self._lock:
+            try:
+                with contextlib.redirect_stdout(output):
+                    ctx = self.wizard.create_new_app_instance(business_info, app_path, snapshot=self.cache.get(),
+                                                              in_memory=in_memory)
+                result.ok = True
+                result.cached = ctx.cached_app is not None
+                self.generated += 1
+                if ctx.replacement_result:
+                    result.replacements = ctx.replacement_result.total_replacements
+                    result.files_touched = ctx.replacement_result.files_touched
+                    result.legacy_issues = ctx.replacement_result.legacy_issues
+            except Exception as e:
+                result.error = str(e)
+        result.seconds = time.perf_counter() - start
+        result.log = output.getvalue()
+        return result, ctx
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'BarberWizard/3.0'
+
+    @property
+    def service(self) -> GenerationService:
+        return self.server.service
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def _send_json(self, status: int, data: Dict[str, Any]):
+        body = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Tuple[Optional[Any], Optional[str]]:
+        """The request body as JSON, or (None, error)"""
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return None, "invalid Content-Length"
+        if length > MAX_BODY_BYTES:
+            return None, f"request body over {MAX_BODY_BYTES} bytes"
+        try:
+            return json.loads(self.rfile.read(length) or b'null'), None
+        except ValueError as e:
+            return None, f"invalid JSON: {e}"
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': f"unknown endpoint: {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == '/reload':
+            self.service.reload()
+            self._send_json(200, self.service.health())
+        elif url.path == '/generate':
+            self._generate({key: values[-1] for key, values in parse_qs(url.query).items()})
+        else:
+            self._send_json(404, {'error': f"unknown endpoint: {self.path}"})
+
+    def _generate(self, query: Dict[str, str]):
+        output_format = query.get('format', 'tar')
+        if output_format not in OUTPUT_FORMATS:
+            self._send_json(400, {'error': f"format must be one of {', '.join(OUTPUT_FORMATS)}"})
+            return
+        if unsupported_reason(output_format):
+            self._send_json(400, {'error': unsupported_reason(output_format)})
+            return
+        entry, error = self._read_json()
+        if error is not None:
+            self._send_json(400, {'error': error})
+            return
+        try:
+            business_info, errors = self.service.wizard.business_info_from_entry(entry)
+        except (TypeError, ValueError, AttributeError, KeyError) as e:
+            business_info, errors = None, [f"unusable value: {e}"]
+        if errors:
+            self._send_json(400, {'error': 'invalid client entry', 'problems': errors})
+            return
+
+        in_memory = output_format != 'directory'
+        if in_memory:
+            app_path = app_path_for(business_info)  # only its name is used
+        else:
+            try:
+                app_path = output_path(self.service.output_root,
+                                       query.get('path') or os.path.basename(app_path_for(business_info)))
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            if os.path.exists(app_path):
+                self._send_json(409, {'error': f"target directory already exists: {app_path}"})
+                return
+
+        result, ctx = self.service.generate(business_info, app_path, in_memory=in_memory)
+        if not result.ok:
+            self._send_json(500, {'error': result.error, 'log': result.log})
+            return
+        summary = {
+            'appPath': app_path, 'replacements': result.replacements,
+            'filesTouched': result.files_touched, 'legacyIssues': result.legacy_issues,
+            'cached': result.cached, 'seconds': round(result.seconds, 3),
+        }
+        if in_memory:
+            self._send_archive(ctx, os.path.basename(app_path), output_format, summary)
+        else:
+            self._send_json(200, dict(summary, log=result.log))
+
+    def _send_archive(self, ctx: GenerationContext, name: str, fmt: str, summary: Dict[str, Any]):
+        """Stream the app as an archive; the response ends when the connection closes"""
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[fmt])
+        # Business names may be Hebrew: plain filename for old clients, RFC 5987 for the rest
+        fallback = name.encode('ascii', 'replace').decode('ascii').replace('"', '')
+        self.send_header('Content-Disposition', f'attachment; filename="{fallback}.{fmt}"; '
+                                                f"filename*=UTF-8''{quote(name)}.{fmt}")
+        self.send_header('X-Replacements', str(summary['replacements']))
+        self.send_header('X-Files-Touched', str(summary['filesTouched']))
+        self.send_header('X-Legacy-Issues', str(summary['legacyIssues']))
+        self.send_header('X-App-Cache', 'hit' if summary['cached'] else 'miss')
+        self.send_header('X-Generation-Seconds', str(summary['seconds']))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        write_app_archive(ctx, self.wfile, fmt, root=name)
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(address: str) -> socketserver.BaseServer:
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        with contextlib.suppress(FileNotFoundError):
+            if stat.S_ISSOCK(os.stat(target).st_mode):
+                os.unlink(target)  # left behind by a previous server
+        return ThreadingUnixHTTPServer(target, GenerationRequestHandler)
+    return ThreadingHTTPServer(target, GenerationRequestHandler)
+
+def serve(wizard: BarberAppDuplicationWizard, address: str = DEFAULT_ADDRESS,
+          output_root: Optional[str] = None, allow_remote: bool = False):
+    """
+    Warm the template cache and serve generation requests until interrupted.
+    Directory apps go under output_root (default ~/Desktop). Addresses other
+    machines can reach are refused unless allow_remote is set.
+    """
+    if not allow_remote and not is_local_address(address):
+        raise ValueError(f"{address} is reachable from other machines and the server has no authentication; "
+                         "use a loopback address or a Unix socket (or allow it explicitly)")
+    output_root = os.path.abspath(os.path.expanduser(output_root or '~/Desktop'))
+    cache = TemplateCache(wizard.template_path)
+    start = time.perf_counter()
+    cache.refresh()
+    print(f"🌳 Template cached: {len(cache.snapshot)} files, {cache.bytes_cached // 1024} KB in memory "
+          f"({time.perf_counter() - start:.2f}s)")
+
+    server = make_server(address)
+    server.service = GenerationService(wizard, cache, output_root)
+    print(f"🚀 Serving app generation on {address} (POST /generate, GET /health, POST /reload)")
+    print(f"📁 Directory apps are generated under {output_root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
+    finally:
+        server.server_close()
+        kind, target = parse_address(address)
+        if kind == 'unix':
+            with contextlib.suppress(OSError):
+                os.unlink(target)
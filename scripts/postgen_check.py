@@ -5,67 +5,109 @@ Verifies that no legacy brand strings or hardcoded content remains.
 """
 
 import os
-import re
 import sys
-from typing import List, Dict, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor
 
 # Add core directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
-from replacements import iter_files
+from replacements import scan_targets, snapshot_tree
+from walker import TreeSnapshot
+from legacy_scan import LegacyScanner
 
-def check_legacy_patterns(root: str) -> Dict[str, List[Tuple[str, int, str]]]:
+# (pattern_name, line_number, line_content) as reported by LegacyScanner
+Finding = Tuple[str, int, str]
+
+# Per-process scanner, compiled on first use
+_scanner: Optional[LegacyScanner] = None
+
+def scan_file(task: Tuple[str, str]) -> Tuple[str, List[Finding], Optional[str]]:
+    """Scan one file; returns (rel_path, findings, error message or None)"""
+    global _scanner
+    root, rel_file_path = task
+    if _scanner is None:
+        _scanner = LegacyScanner()
+    try:
+        return rel_file_path, _scanner.scan_file(os.path.join(root, rel_file_path)), None
+    except Exception as e:
+        return rel_file_path, [], str(e)
+
+def iter_file_findings(root: str, files: List[str], jobs: int = 1,
+                       executor: Optional[Executor] = None) -> Iterator[Tuple[str, List[Finding], Optional[str]]]:
+    """
+    Yield scan_file results in file order as soon as each is available.
+    Scans in a process pool when jobs > 1 (or on the given executor); closing
+    the iterator early cancels the files not yet scanned.
+    """
+    tasks = [(root, rel_file_path) for rel_file_path in files]
+    own_pool = None
+    if executor is None and jobs > 1 and len(tasks) > 1:
+        executor = own_pool = ProcessPoolExecutor(max_workers=jobs)
+    if executor is None:
+        yield from map(scan_file, tasks)
+        return
+    
+    try:
+        yield from executor.map(scan_file, tasks, chunksize=max(1, min(32, len(tasks) // (max(1, jobs) * 4))))
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown(cancel_futures=True)
+
+def check_legacy_patterns(root: str, files: Optional[List[str]] = None, jobs: int = 1,
+                          fail_fast: bool = False,
+                          on_finding: Optional[Callable[[str, str, int, str], None]] = None,
+                          executor: Optional[Executor] = None) -> Dict[str, List[Tuple[str, int, str]]]:
     """
     Check for legacy brand strings and hardcoded content.
     
+    Args:
+        root: Project root directory
+        files: Relative paths to check (default: the text files under root)
+        jobs: Number of scanning processes (1 = in-process)
+        fail_fast: Stop at the first legacy hit
+        on_finding: Called with (pattern_name, file, line_number, line_content) as hits arrive
+        executor: Shared pool (of `jobs` processes) to scan on instead of starting one
+    
     Returns:
         Dict mapping pattern names to list of (file, line_number, line_content) matches
     """
     
-    legacy_patterns = {
-        'barbersbar_brand': r'\b[Bb]arbersbar\b',
-        'barber_shop_generic': r'\bBarber Shop\b',
-        'hebrew_brand': r'ברבר בר',
-        'old_emails': r'barbersbar\.co(?:\.il|m)',
-        'israeli_phone_054': r'054[-\s]?835[-\s]?3232',
-        'israeli_phone_052': r'052[-\s]?398[-\s]?5505',
-        'non_e164_phones': r'(?<!\+972)\b0[5-9]\d{8}\b',  # Israeli phones not in E.164
-        'old_addresses': r'רפיח ים \d+|נתיבות נווה שרון',
-        'old_bundle_id': r'com\.barbersbar\.app'
-    }
-    
     found_issues = {}
-    files_to_check = iter_files(root)
+    files_to_check = scan_targets(snapshot_tree(root)) if files is None else files
     
     print(f"🔍 Checking {len(files_to_check)} files for legacy content...")
     
-    for rel_file_path in files_to_check:
-        full_path = os.path.join(root, rel_file_path)
-        
-        try:
-            with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
+    results = iter_file_findings(root, files_to_check, jobs, executor)
+    try:
+        for rel_file_path, findings, error in results:
+            if error is not None:
+                print(f"  ⚠️  Error checking {rel_file_path}: {error}")
+                continue
             
-            for line_num, line in enumerate(lines, 1):
-                for pattern_name, pattern in legacy_patterns.items():
-                    matches = re.finditer(pattern, line)
-                    for match in matches:
-                        if pattern_name not in found_issues:
-                            found_issues[pattern_name] = []
-                        
-                        found_issues[pattern_name].append((
-                            rel_file_path,
-                            line_num,
-                            line.strip()
-                        ))
-        
-        except Exception as e:
-            print(f"  ⚠️  Error checking {rel_file_path}: {e}")
-            continue
+            for pattern_name, line_num, line_content in findings[:1] if fail_fast else findings:
+                if pattern_name not in found_issues:
+                    found_issues[pattern_name] = []
+                
+                found_issues[pattern_name].append((
+                    rel_file_path,
+                    line_num,
+                    line_content
+                ))
+                if on_finding is not None:
+                    on_finding(pattern_name, rel_file_path, line_num, line_content)
+            
+            if fail_fast and found_issues:
+                break
+    finally:
+        results.close()
     
     return found_issues
 
-def check_file_structure(root: str) -> Dict[str, str]:
-    """Check that required files exist and have proper structure"""
+def check_file_structure(root: str, snapshot: Optional[TreeSnapshot] = None) -> Dict[str, str]:
+    """
+    Check that required files exist and have proper structure.
+    With a snapshot of root, existence is looked up instead of stat'ed.
+    """
     
     required_files = {
         'app/utils/links.ts': 'Link utilities',
@@ -79,34 +121,19 @@ def check_file_structure(root: str) -> Dict[str, str]:
     status = {}
     
     for file_path, description in required_files.items():
-        full_path = os.path.join(root, file_path)
-        if os.path.exists(full_path):
+        if snapshot is not None:
+            exists = file_path in snapshot
+        else:
+            exists = os.path.exists(os.path.join(root, file_path))
+        if exists:
             status[file_path] = "✅ EXISTS"
         else:
             status[file_path] = "❌ MISSING"
     
     return status
 
-def main():
-    """Run post-generation checks"""
-    import argparse
-    
-    parser = argparse.ArgumentParser(description='Post-generation sanity checker')
-    parser.add_argument('--root', default='.', help='Project root directory')
-    parser.add_argument('--verbose', '-v', action='store_true', help='Show detailed output')
-    
-    args = parser.parse_args()
-    
-    print("🧪 Post-Generation Checks")
-    print("=" * 50)
-    
-    # Check for legacy patterns
-    legacy_issues = check_legacy_patterns(args.root)
-    
-    # Check file structure
-    file_status = check_file_structure(args.root)
-    
-    # Report results
+def report_root(legacy_issues: Dict[str, List[Tuple[str, int, str]]], file_status: Dict[str, str]):
+    """Print the file structure and legacy content results for one app"""
     print("\n📁 File Structure:")
     for file_path, status in file_status.items():
         print(f"  {status} {file_path}")
@@ -126,13 +153,65 @@ def main():
             
             if len(matches) > 5:
                 print(f"    ... and {len(matches) - 5} more")
+
+def main():
+    """Run post-generation checks"""
+    import argparse
     
-    # Summary
-    missing_files = [f for f, status in file_status.items() if "MISSING" in status]
-    total_legacy_issues = sum(len(matches) for matches in legacy_issues.values())
+    parser = argparse.ArgumentParser(description='Post-generation sanity checker')
+    parser.add_argument('--root', nargs='+', default=['.'],
+                        help='Project root directory (several roots check several apps)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Show detailed output')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Number of scanning processes')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='Stop at the first legacy content hit (for CI gating)')
     
+    args = parser.parse_args()
+    
+    print("🧪 Post-Generation Checks")
+    print("=" * 50)
+    
+    def stream_finding(pattern_name: str, file_path: str, line_num: int, line_content: str):
+        print(f"  ❌ {file_path}:{line_num} [{pattern_name}] → {line_content[:100]}")
+    
+    # One pool shared by every root, so checking many apps pays its startup once
+    executor = ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 else None
+    files_checked = 0
+    missing_files = []
+    total_legacy_issues = 0
+    try:
+        for root in args.root:
+            if len(args.root) > 1:
+                print(f"\n📂 {root}")
+            
+            # Walk the tree once; both checks and the summary reuse it
+            snapshot = snapshot_tree(root)
+            files = scan_targets(snapshot)
+            files_checked += len(files)
+            
+            # Check for legacy patterns
+            legacy_issues = check_legacy_patterns(
+                root, files, jobs=args.jobs, fail_fast=args.fail_fast, executor=executor,
+                on_finding=stream_finding if args.verbose or args.fail_fast else None
+            )
+            
+            # Check file structure
+            file_status = check_file_structure(root, snapshot)
+            
+            # Report results
+            report_root(legacy_issues, file_status)
+            
+            missing_files += [f for f, status in file_status.items() if "MISSING" in status]
+            total_legacy_issues += sum(len(matches) for matches in legacy_issues.values())
+            if args.fail_fast and total_legacy_issues:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    
+    # Summary
     print(f"\n📊 Summary:")
-    print(f"  Files checked: {len(iter_files(args.root))}")
+    print(f"  Files checked: {files_checked}")
     print(f"  Missing required files: {len(missing_files)}")
     print(f"  Legacy content issues: {total_legacy_issues}")
     